@@ -0,0 +1,125 @@
+"""
+Bulk email throughput for Bee It Feedback
+
+Queues the same notice for many recipients and drains it with the outbox
+worker against the SendGrid stand-in in sendgrid_sink.py, served in process
+over httpx's ASGI transport so nothing leaves the machine. The queue is
+held in memory instead of MongoDB, so the numbers are the worker's and the
+provider's. It runs once sending every message on its own and once grouping
+messages that share a body into one request with a personalization per
+recipient. The sink adds latency per request, rejects requests with more
+than 1000 personalizations and answers 429 with Retry-After once more
+requests arrive in a second than its rate limit allows.
+
+Run from the backend directory:
+
+    python bench_email_bulk.py                      # 5000 recipients
+    python bench_email_bulk.py -n 20000 --group-size 500 --concurrency 8
+    python bench_email_bulk.py --rate-limit 50 --latency-ms 120
+"""
+import argparse
+import asyncio
+import math
+import time
+
+import httpx
+
+import email_outbox
+import email_service
+from email_templates import render_with_tags
+from sendgrid_sink import SendGridSink
+
+
+def notice_messages(count: int) -> list:
+    html, tags = render_with_tags(
+        "new_feedback.html", ["colaborador_nome"],
+        gestor_nome="RH", tipo_feedback="Comunicado", data_feedback="17/10/2026"
+    )
+    return [{
+        "id": str(n),
+        "provedor": email_outbox.DEFAULT_PROVIDER,
+        "para": f"colaborador{n}@example.com",
+        "assunto": "Comunicado da equipe",
+        "html": html,
+        "substituicoes": {tags["colaborador_nome"]: f"Colaborador {n}"},
+    } for n in range(count)]
+
+
+class InMemoryWorker(email_outbox.OutboxWorker):
+    """Outbox worker claiming from a list; failed messages go back to the queue"""
+
+    def __init__(self, messages: list, **kwargs):
+        super().__init__(db=None, poll_seconds=0, **kwargs)
+        self.queue = list(messages)
+        self.sent = 0
+
+    async def _claim(self):
+        return self.queue.pop() if self.queue else None
+
+    async def _sent(self, messages):
+        self.sent += len(messages)
+
+    async def _failed(self, message, error, retryable, retry_after=None):
+        if retry_after:
+            await asyncio.sleep(retry_after)
+        self.queue.append(message)
+
+    async def report(self):
+        pass
+
+
+async def run(label: str, args, messages: list, group_size: int) -> dict:
+    sink = SendGridSink(latency_ms=args.latency_ms, rate_limit=args.rate_limit, max_recorded=len(messages))
+    client = email_service.SendGridClient(api_key="bench", transport=httpx.ASGITransport(app=sink.app))
+    worker = InMemoryWorker(
+        messages,
+        client=client,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        rate_limits={email_outbox.DEFAULT_PROVIDER: args.rate_limit},
+        group_size=group_size,
+    )
+    started = time.perf_counter()
+    try:
+        while worker.queue:
+            await worker.drain_once()
+    finally:
+        await client.close()
+    elapsed = time.perf_counter() - started
+    stats = sink.stats()
+    assert stats["emails_aceitos"] == worker.sent == len(messages)
+    return {
+        "label": label,
+        "seconds": elapsed,
+        "emails_per_s": worker.sent / elapsed,
+        "requests": stats["requisicoes"],
+        "rejected": stats["por_status"].get("429", 0),
+        "sent": worker.sent,
+        "peak_per_s": stats["emails_por_segundo_pico"],
+    }
+
+
+async def main(args):
+    messages = notice_messages(args.count)
+    # Sending one by one takes long enough that a slice says enough
+    single = messages[:max(1, math.ceil(args.count / 10))]
+    results = [
+        await run("one request per recipient", args, single, group_size=1),
+        await run(f"grouped by body ({args.group_size})", args, messages, group_size=args.group_size),
+    ]
+    print(f"{args.count} recipients, {args.latency_ms:.0f} ms latency, {args.rate_limit} requests/s limit")
+    print(f"{'':28} {'emails':>8} {'requests':>9} {'429s':>6} {'seconds':>8} {'emails/s':>10} {'peak/s':>8}")
+    for r in results:
+        print(f"{r['label']:28} {r['sent']:8} {r['requests']:9} {r['rejected']:6} {r['seconds']:8.2f} "
+              f"{r['emails_per_s']:10.0f} {r['peak_per_s']:8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-recipient and grouped outbox sends offline")
+    parser.add_argument("-n", "--count", type=int, default=5000)
+    parser.add_argument("--group-size", type=int, default=email_outbox.EMAIL_OUTBOX_GROUP_SIZE)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=email_outbox.EMAIL_OUTBOX_CONCURRENCY)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--rate-limit", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""
+Email rendering throughput for Bee It Feedback
+
+Renders synthetic overdue-feedback digests two ways: compiling the
+templates for every message (what a fresh environment per email would
+cost) and one `render` call per message on the shared, precompiled
+environment. Needs no database.
+
+Run from the backend directory:
+
+    python bench_email_templates.py             # 2000 digests of 10 items
+    python bench_email_templates.py -n 10000 --items 50
+"""
+import argparse
+import statistics
+import time
+
+from jinja2 import Environment, FileSystemLoader
+from markupsafe import Markup
+
+import email_templates
+
+TEMPLATE = "overdue_feedbacks_digest.html"
+
+
+def digest_contexts(count: int, items: int) -> list:
+    # Names with markup characters so escaping is part of the measured work
+    return [{
+        "gestor_nome": f"Gestor <{n}> & Cia",
+        "feedbacks": [
+            {"colaborador_nome": f"Colaborador {n}-{i} \"O'Neil\"", "data_prevista": "01/10/2026", "dias_atraso": i + 1}
+            for i in range(items)
+        ],
+        "total": items + 5,
+    } for n in range(count)]
+
+
+def render_uncached(contexts: list) -> list:
+    bodies = []
+    for context in contexts:
+        env = Environment(loader=FileSystemLoader(email_templates.TEMPLATES_DIR), autoescape=True, cache_size=0)
+        for fragment in email_templates.FRAGMENTS:
+            env.globals[fragment] = Markup(env.get_template(f"{fragment}.html").render())
+        bodies.append(env.get_template(TEMPLATE).render(context))
+    return bodies
+
+
+def render_each(contexts: list) -> list:
+    return [email_templates.render(TEMPLATE, **context) for context in contexts]
+
+
+def measure(label: str, render, contexts: list, repeats: int) -> dict:
+    render(contexts[:10])
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        render(contexts)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "label": label,
+        "us_per_email": best / len(contexts) * 1_000_000,
+        "emails_per_s": len(contexts) / best,
+        "median_s": statistics.median(timings),
+    }
+
+
+def main(count: int, items: int, repeats: int):
+    contexts = digest_contexts(count, items)
+    results = [
+        # Compiling per message is slow enough that a slice says enough
+        measure("compile per email", render_uncached, contexts[:max(1, count // 20)], 1),
+        measure("render per email", render_each, contexts, repeats),
+    ]
+    print(f"{count} digests of {items} items")
+    print(f"{'':24} {'us/email':>10} {'emails/s':>10} {'median s':>10}")
+    for result in results:
+        print(f"{result['label']:24} {result['us_per_email']:10.1f} {result['emails_per_s']:10.0f} {result['median_s']:10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure email template rendering throughput")
+    parser.add_argument("-n", "--count", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("-r", "--repeats", type=int, default=5)
+    args = parser.parse_args()
+    main(args.count, args.items, args.repeats)
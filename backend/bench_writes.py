@@ -0,0 +1,137 @@
+"""
+Database operations per write request for Bee It Feedback
+
+Drives the PUT endpoints in-process and counts every command the app sends
+to MongoDB through pymongo's command monitoring, next to the update + read
+back sequence the endpoints used before they returned the updated document
+from the write itself.
+
+Run from the backend directory against a seeded database (POST /api/seed):
+
+    python bench_writes.py              # 200 requests per endpoint
+    python bench_writes.py -n 1000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from collections import Counter
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+load_dotenv(Path(__file__).parent / '.env')
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts commands by (name, collection) while enabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self.commands = Counter()
+
+    def started(self, event):
+        if self.enabled:
+            self.commands[(event.command_name, event.command.get(event.command_name))] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Must be registered before the app creates its client
+counter = CommandCounter()
+monitoring.register(counter)
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+
+
+async def legacy_round_trips(collection, doc_id: str, update: dict) -> None:
+    """The former pattern: write, then read the document back"""
+    await collection.update_one({"id": doc_id}, {"$set": update})
+    await collection.find_one({"id": doc_id}, {"_id": 0})
+
+
+async def measure(label: str, request, iterations: int) -> dict:
+    # One untimed call warms caches (principal, loaders, connection pool)
+    await request()
+    counter.commands.clear()
+    counter.enabled = True
+    latencies = []
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await request()
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        counter.enabled = False
+    commands = dict(counter.commands)
+    return {
+        "label": label,
+        "ops": sum(commands.values()) / iterations,
+        "p50_ms": statistics.median(latencies),
+        "commands": {f"{name}:{coll}": count / iterations for (name, coll), count in sorted(commands.items())},
+    }
+
+
+async def main(iterations: int):
+    db = server.db
+    admin = await db.usuarios.find_one({"papel": "ADMIN"}, {"_id": 0})
+    colaborador = await db.usuarios.find_one({"papel": "COLABORADOR"}, {"_id": 0})
+    team = await db.times.find_one({}, {"_id": 0})
+    feedback = await db.feedbacks.find_one({}, {"_id": 0})
+    plan = await db.planos_acao.find_one({}, {"_id": 0})
+    item = await db.itens_plano.find_one({}, {"_id": 0})
+    if not all((admin, colaborador, team, feedback, plan, item)):
+        raise SystemExit("Seed the database first (POST /api/seed)")
+
+    token = server.create_token(admin["id"], admin["email"], admin["papel"])
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=server.app)
+
+    # Payloads leave the data as it is, so runs can be repeated
+    endpoints = [
+        ("PUT /users", f"/api/users/{colaborador['id']}", {"ativo": colaborador.get("ativo", True)},
+         db.usuarios, colaborador["id"]),
+        ("PUT /teams", f"/api/teams/{team['id']}", {"descricao": team.get("descricao") or ""},
+         db.times, team["id"]),
+        ("PUT /feedbacks", f"/api/feedbacks/{feedback['id']}", {"contexto": feedback["contexto"]},
+         db.feedbacks, feedback["id"]),
+        ("PUT /action-plans", f"/api/action-plans/{plan['id']}", {"objetivo": plan["objetivo"]},
+         db.planos_acao, plan["id"]),
+        ("PUT /action-plan-items", f"/api/action-plan-items/{item['id']}", {"descricao": item["descricao"]},
+         db.itens_plano, item["id"]),
+    ]
+
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        for label, path, payload, collection, doc_id in endpoints:
+            async def request():
+                response = await client.put(path, json=payload)
+                response.raise_for_status()
+
+            async def legacy():
+                await legacy_round_trips(collection, doc_id, payload)
+
+            results.append(await measure(f"{label} (legacy update + find)", legacy, iterations))
+            results.append(await measure(label, request, iterations))
+
+    print(f"{'':44} {'ops/req':>8} {'p50 ms':>8}")
+    for result in results:
+        print(f"{result['label']:44} {result['ops']:8.2f} {result['p50_ms']:8.2f}")
+        for command, count in result["commands"].items():
+            print(f"    {command:40} {count:8.2f}")
+    server.client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count database operations per PUT request")
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
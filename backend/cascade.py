@@ -0,0 +1,243 @@
+"""
+Cascading deletes for Bee It Feedback
+
+Deleting a user removes the feedbacks they gave or received, deleting a
+feedback removes its action plans and deleting a plan removes its items and
+check-ins. Notifications about a removed feedback or plan, and those
+addressed to a removed user, go with them, as do emails about them still
+waiting in the outbox and their entries in the notification ledger.
+
+The dependency graph is resolved once into id lists per collection, then
+each collection is cleared with a single `delete_many` on `$in`, so the
+number of operations does not grow with the number of documents removed.
+Dashboard counters and the plan counts of surviving feedbacks are adjusted
+in the same pass. On a replica set or sharded cluster the whole cascade runs
+in one transaction. On a standalone mongod the steps run children first and
+the root last, so an interrupted delete can simply be repeated.
+
+Users with more than CASCADE_INLINE_LIMIT feedbacks are removed
+by a background job instead: the user is deactivated at once and their
+feedbacks are deleted CASCADE_CHUNK_SIZE at a time, with the progress
+recorded in `cascade_jobs`.
+"""
+import logging
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable
+
+from pymongo import UpdateOne
+
+import metrics
+from dashboard_counters import COUNTERS_COLLECTION, apply_feedback_changes, apply_plan_changes
+from digests import LEDGER_COLLECTION
+from email_outbox import OUTBOX_COLLECTION, STATUS_FALHOU, STATUS_PENDENTE
+from org_tree import CLOSURE_COLLECTION, STATE_COLLECTION
+from transactions import run_in_transaction
+
+logger = logging.getLogger(__name__)
+
+CASCADE_INLINE_LIMIT = int(os.environ.get('CASCADE_INLINE_LIMIT', '5000'))
+CASCADE_CHUNK_SIZE = int(os.environ.get('CASCADE_CHUNK_SIZE', '500'))
+
+JOBS_COLLECTION = "cascade_jobs"
+
+# Fields needed to take a document out of the dashboard counters
+FEEDBACK_PROJECTION = {
+    "_id": 0, "id": 1, "colaborador_id": 1, "gestor_id": 1,
+    "status_feedback": 1, "tipo_feedback": 1, "ciencia_colaborador": 1,
+}
+PLAN_PROJECTION = {"_id": 0, "id": 1, "feedback_id": 1, "colaborador_id": 1, "gestor_id": 1, "status": 1}
+
+async def delete_cascade(
+    db,
+    user_ids: Iterable[str] = (),
+    feedback_ids: Iterable[str] = (),
+    plan_ids: Iterable[str] = (),
+    session=None
+) -> Dict[str, int]:
+    """
+    Delete users, feedbacks and plans together with everything that depends
+    on them
+
+    Returns:
+        dict: Number of documents deleted per collection
+    """
+    user_ids, feedback_ids, plan_ids = list(user_ids), list(feedback_ids), list(plan_ids)
+    deleted: Dict[str, int] = {}
+
+    # Resolve every level of the graph before removing anything
+    feedback_filters = []
+    if feedback_ids:
+        feedback_filters.append({"id": {"$in": feedback_ids}})
+    if user_ids:
+        feedback_filters.append({"colaborador_id": {"$in": user_ids}})
+        feedback_filters.append({"gestor_id": {"$in": user_ids}})
+    feedbacks = []
+    if feedback_filters:
+        feedbacks = await db.feedbacks.find(
+            {"$or": feedback_filters}, FEEDBACK_PROJECTION, session=session
+        ).to_list(None)
+    feedback_ids = [f["id"] for f in feedbacks]
+
+    plan_filters = []
+    if plan_ids:
+        plan_filters.append({"id": {"$in": plan_ids}})
+    if feedback_ids:
+        plan_filters.append({"feedback_id": {"$in": feedback_ids}})
+    plans = []
+    if plan_filters:
+        plans = await db.planos_acao.find({"$or": plan_filters}, PLAN_PROJECTION, session=session).to_list(None)
+    plan_ids = [p["id"] for p in plans]
+
+    async def remove(collection: str, query: dict):
+        result = await db[collection].delete_many(query, session=session)
+        deleted[collection] = deleted.get(collection, 0) + result.deleted_count
+
+    # Children first, roots last
+    if plan_ids:
+        await remove("itens_plano", {"plano_de_acao_id": {"$in": plan_ids}})
+        await remove("checkins", {"plano_de_acao_id": {"$in": plan_ids}})
+
+    notification_filters = []
+    if feedback_ids or plan_ids:
+        notification_filters.append({"entidade_id": {"$in": feedback_ids + plan_ids}})
+    if user_ids:
+        notification_filters.append({"usuario_id": {"$in": user_ids}})
+    if notification_filters:
+        await remove("notificacoes", {"$or": notification_filters})
+
+    # Emails not sent yet (or dead-lettered) about removed items or to removed users
+    outbox_filters = []
+    if feedback_ids or plan_ids:
+        outbox_filters.append({"entidade_id": {"$in": feedback_ids + plan_ids}})
+    if user_ids:
+        emails = await db.usuarios.distinct("email", {"id": {"$in": user_ids}}, session=session)
+        if emails:
+            outbox_filters.append({"para": {"$in": emails}})
+    if outbox_filters:
+        await remove(OUTBOX_COLLECTION, {
+            "status": {"$in": [STATUS_PENDENTE, STATUS_FALHOU]},
+            "$or": outbox_filters
+        })
+
+    ledger_filters = []
+    if feedback_ids or plan_ids:
+        ledger_filters.append({"entidade_id": {"$in": feedback_ids + plan_ids}})
+    if user_ids:
+        ledger_filters.append({"destinatario_id": {"$in": user_ids}})
+    if ledger_filters:
+        await remove(LEDGER_COLLECTION, {"$or": ledger_filters})
+
+    if plan_ids:
+        await remove("planos_acao", {"id": {"$in": plan_ids}})
+        # Plans removed on their own leave their feedback with fewer plans
+        removed_feedbacks = set(feedback_ids)
+        per_feedback = Counter(p["feedback_id"] for p in plans if p.get("feedback_id") not in removed_feedbacks)
+        if per_feedback:
+            await db.feedbacks.bulk_write([
+                UpdateOne({"id": feedback_id}, {"$inc": {"planos_count": -count}})
+                for feedback_id, count in per_feedback.items()
+            ], ordered=False, session=session)
+        await apply_plan_changes(db, [(plan, None) for plan in plans], session=session)
+
+    if feedback_ids:
+        await remove("feedbacks", {"id": {"$in": feedback_ids}})
+        await apply_feedback_changes(db, [(feedback, None) for feedback in feedbacks], session=session)
+
+    if user_ids:
+        # Reports of a removed manager stay, without a manager
+        await db.usuarios.update_many(
+            {"gestor_direto_id": {"$in": user_ids}}, {"$set": {"gestor_direto_id": None}}, session=session
+        )
+        await db[CLOSURE_COLLECTION].delete_many({"gestor_id": {"$in": user_ids}}, session=session)
+        await db[STATE_COLLECTION].delete_many({"_id": {"$in": user_ids}}, session=session)
+        await db[COUNTERS_COLLECTION].delete_many({"_id": {"$in": [
+            f"{scope}:{user_id}" for user_id in user_ids for scope in ("gestor", "colaborador")
+        ]}}, session=session)
+        await remove("usuarios", {"id": {"$in": user_ids}})
+
+    return deleted
+
+
+async def delete_with_cascade(db, **roots) -> Dict[str, int]:
+    """`delete_cascade` in a transaction where available"""
+    with metrics.timed("cascade.delete"):
+        deleted = await run_in_transaction(db, lambda session: delete_cascade(db, session=session, **roots))
+    # Counted once committed: a retried transaction runs the callback again
+    for collection, count in deleted.items():
+        metrics.inc(f"cascade.deleted.{collection}", count)
+    return deleted
+
+
+async def user_cascade_size(db, user_id: str) -> int:
+    """Number of feedbacks a user's deletion would remove (plans and items follow them)"""
+    return await db.feedbacks.count_documents({"$or": [{"colaborador_id": user_id}, {"gestor_id": user_id}]})
+
+
+async def create_cascade_job(db, user_id: str, requested_by_id: str, total: int) -> dict:
+    """Register a pending background deletion of a user"""
+    job = {
+        "id": str(uuid.uuid4()),
+        "tipo": "usuario",
+        "alvo_id": user_id,
+        "status": "pendente",
+        "total_feedbacks": total,
+        "feedbacks_removidos": 0,
+        "progresso_percentual": 0,
+        "removidos": {},
+        "erro": None,
+        "criado_por_id": requested_by_id,
+        "criado_em": datetime.now(timezone.utc).isoformat(),
+        "concluido_em": None,
+    }
+    await db[JOBS_COLLECTION].insert_one(job)
+    del job["_id"]
+    return job
+
+
+def _progress_update(deleted: Dict[str, int], fields: dict) -> dict:
+    update = {"$set": fields}
+    if deleted:
+        update["$inc"] = {f"removidos.{collection}": count for collection, count in deleted.items()}
+    return update
+
+
+async def run_user_cascade_job(db, job_id: str, user_id: str):
+    """
+    Background job: delete a user's feedbacks CASCADE_CHUNK_SIZE at a time,
+    each chunk in its own transaction where available, then the user
+    """
+    jobs = db[JOBS_COLLECTION]
+    await jobs.update_one({"id": job_id}, {"$set": {"status": "processando"}})
+    try:
+        job = await jobs.find_one({"id": job_id}, {"_id": 0, "total_feedbacks": 1})
+        total = max(job["total_feedbacks"], 1)
+        removed = 0
+        owned = {"$or": [{"colaborador_id": user_id}, {"gestor_id": user_id}]}
+        while True:
+            chunk = await db.feedbacks.find(owned, {"_id": 0, "id": 1}).limit(CASCADE_CHUNK_SIZE).to_list(CASCADE_CHUNK_SIZE)
+            if not chunk:
+                break
+            deleted = await delete_with_cascade(db, feedback_ids=[f["id"] for f in chunk])
+            removed += deleted.get("feedbacks", 0)
+            await jobs.update_one({"id": job_id}, _progress_update(deleted, {
+                "feedbacks_removidos": removed,
+                # Feedbacks created meanwhile can push past the initial total
+                "progresso_percentual": min(99, removed * 100 // total),
+            }))
+
+        deleted = await delete_with_cascade(db, user_ids=[user_id])
+        await jobs.update_one({"id": job_id}, _progress_update(deleted, {
+            "status": "concluido",
+            "progresso_percentual": 100,
+            "concluido_em": datetime.now(timezone.utc).isoformat(),
+        }))
+    except Exception as e:
+        logger.error(f"Error running cascade job {job_id}: {e}")
+        await jobs.update_one({"id": job_id}, {"$set": {
+            "status": "erro",
+            "erro": str(e),
+            "concluido_em": datetime.now(timezone.utc).isoformat(),
+        }})
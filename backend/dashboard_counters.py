@@ -0,0 +1,295 @@
+"""
+Materialized dashboard counters for Bee It Feedback
+
+Tallies live in the `dashboard_counters` collection, one document per scope:
+`empresa` for the whole company, `gestor:<id>` for the feedbacks a manager
+gave and `colaborador:<id>` for the feedbacks a collaborator received. Write
+endpoints keep them current with atomic `$inc` updates and
+`reconcile_counters` rebuilds them from the source collections and applies
+the difference to repair drift.
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Optional
+
+from pymongo import DeleteOne, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_COLLECTION = "dashboard_counters"
+EMPRESA_SCOPE = "empresa"
+
+
+def _scopes(doc: dict) -> list:
+    """Counter documents a feedback or plan contributes to"""
+    scopes = [EMPRESA_SCOPE]
+    if doc.get("gestor_id"):
+        scopes.append(f"gestor:{doc['gestor_id']}")
+    if doc.get("colaborador_id"):
+        scopes.append(f"colaborador:{doc['colaborador_id']}")
+    return scopes
+
+
+def counter_key(value) -> str:
+    """
+    Field name tallying `value`. The API only accepts known statuses and
+    types, but stored documents predate that check: a value that is empty,
+    contains a dot or starts with `$` would make an invalid `$inc` path.
+    """
+    key = str(value) if value not in (None, "") else "Indefinido"
+    key = key.replace(".", "\uff0e")
+    if key.startswith("$"):
+        key = "\uff04" + key[1:]
+    return key
+
+
+def feedback_contribution(feedback: dict) -> Dict[str, int]:
+    """Counter fields incremented by a single feedback"""
+    fields = {
+        "feedbacks_total": 1,
+        f"feedbacks_por_status.{counter_key(feedback.get('status_feedback'))}": 1,
+        f"feedbacks_por_tipo.{counter_key(feedback.get('tipo_feedback'))}": 1,
+    }
+    if not feedback.get("ciencia_colaborador"):
+        fields["aguardando_ciencia"] = 1
+    return fields
+
+
+def plan_contribution(plan: dict) -> Dict[str, int]:
+    """Counter fields incremented by a single action plan"""
+    return {
+        "planos_total": 1,
+        f"planos_por_status.{counter_key(plan.get('status'))}": 1,
+    }
+
+
+def _diff(contribution, before: Optional[dict], after: Optional[dict]) -> Dict[str, Dict[str, int]]:
+    deltas = defaultdict(lambda: defaultdict(int))
+    if before:
+        for scope in _scopes(before):
+            for field, value in contribution(before).items():
+                deltas[scope][field] -= value
+    if after:
+        for scope in _scopes(after):
+            for field, value in contribution(after).items():
+                deltas[scope][field] += value
+    return {
+        scope: {field: value for field, value in fields.items() if value}
+        for scope, fields in deltas.items()
+    }
+
+
+async def _apply(db, deltas: Dict[str, Dict[str, int]], session=None):
+    operations = [
+        UpdateOne({"_id": scope}, {"$inc": fields}, upsert=True)
+        for scope, fields in deltas.items() if fields
+    ]
+    if operations:
+        await db[COUNTERS_COLLECTION].bulk_write(operations, ordered=False, session=session)
+
+
+async def apply_feedback_change(db, before: Optional[dict], after: Optional[dict], session=None):
+    """
+    Update the counters for a feedback transition
+
+    Args:
+        before: Feedback document before the write (None on create)
+        after: Feedback document after the write (None on delete)
+        session: Optional client session, to count inside a transaction
+    """
+    await _apply(db, _diff(feedback_contribution, before, after), session)
+
+
+async def apply_plan_change(db, before: Optional[dict], after: Optional[dict], session=None):
+    """
+    Update the counters for an action plan transition
+
+    Args:
+        before: Plan document before the write (None on create)
+        after: Plan document after the write (None on delete)
+        session: Optional client session, to count inside a transaction
+    """
+    await _apply(db, _diff(plan_contribution, before, after), session)
+
+
+def _merge(contribution, transitions: list) -> Dict[str, Dict[str, int]]:
+    merged = defaultdict(lambda: defaultdict(int))
+    for before, after, *count in transitions:
+        weight = count[0] if count else 1
+        for scope, fields in _diff(contribution, before, after).items():
+            for field, value in fields.items():
+                merged[scope][field] += value * weight
+    return {
+        scope: {field: value for field, value in fields.items() if value}
+        for scope, fields in merged.items()
+    }
+
+
+async def apply_feedback_changes(db, transitions: list, session=None):
+    """
+    Update the counters for many feedback transitions with one bulk_write
+
+    Args:
+        transitions: (before, after) or (before, after, count) tuples, where
+            count is the number of feedbacks making that same transition
+        session: Optional client session, to count inside a transaction
+    """
+    await _apply(db, _merge(feedback_contribution, transitions), session)
+
+
+async def apply_plan_changes(db, transitions: list, session=None):
+    """
+    Update the counters for many plan transitions with one bulk_write
+
+    Args:
+        transitions: (before, after) or (before, after, count) tuples, where
+            count is the number of plans making that same transition
+        session: Optional client session, to count inside a transaction
+    """
+    await _apply(db, _merge(plan_contribution, transitions), session)
+
+
+async def get_counters(db, scope: str) -> dict:
+    """Return the counter document for a scope (empty tallies if none exist)"""
+    return await db[COUNTERS_COLLECTION].find_one({"_id": scope}) or {"_id": scope}
+
+
+async def get_colaborador_counters(db, colaborador_ids: list) -> list:
+    """Return the counter documents of several collaborators in one query"""
+    scopes = [f"colaborador:{cid}" for cid in colaborador_ids]
+    return await db[COUNTERS_COLLECTION].find({"_id": {"$in": scopes}}).to_list(len(scopes))
+
+
+async def backfill_plan_owners(db) -> int:
+    """
+    Copy colaborador_id and gestor_id from the linked feedback onto plans
+    missing them. Plan listings are scoped by these fields, so the server
+    runs this once at startup; later runs find nothing to do.
+
+    Returns:
+        int: Number of plans updated
+    """
+    updated = 0
+    cursor = db.planos_acao.aggregate([
+        {"$match": {"colaborador_id": {"$exists": False}}},
+        {"$lookup": {
+            "from": "feedbacks",
+            "localField": "feedback_id",
+            "foreignField": "id",
+            "as": "feedback"
+        }},
+        {"$unwind": "$feedback"},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "colaborador_id": "$feedback.colaborador_id",
+            "gestor_id": "$feedback.gestor_id"
+        }}
+    ])
+    operations = []
+    async for plan in cursor:
+        operations.append(UpdateOne(
+            {"id": plan["id"]},
+            {"$set": {"colaborador_id": plan["colaborador_id"], "gestor_id": plan["gestor_id"]}}
+        ))
+        if len(operations) >= 1000:
+            result = await db.planos_acao.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+    if operations:
+        result = await db.planos_acao.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+    if updated:
+        logger.info(f"Plan owners backfilled on {updated} plans")
+    return updated
+
+
+async def reconcile_counters(db) -> int:
+    """
+    Rebuild every counter document from the feedbacks and planos_acao
+    collections. Grouping happens in MongoDB; only one row per distinct
+    (collaborator, manager, status, type) combination reaches Python.
+
+    The counters are not overwritten: the difference between the rebuilt
+    tallies and a snapshot read just before the aggregation is applied with
+    `$inc`, so updates landing after the snapshot are kept. Scopes with no
+    source documents left are deleted only while they still match the
+    snapshot. A write made while the aggregation runs may be counted twice;
+    the next run corrects it.
+
+    Returns:
+        int: Number of counter scopes rebuilt
+    """
+    snapshot = {}
+    async for doc in db[COUNTERS_COLLECTION].find({}):
+        snapshot[doc["_id"]] = doc
+
+    counters = defaultdict(lambda: defaultdict(int))
+
+    feedback_groups = db.feedbacks.aggregate([
+        {"$group": {
+            "_id": {
+                "colaborador_id": "$colaborador_id",
+                "gestor_id": "$gestor_id",
+                "status_feedback": "$status_feedback",
+                "tipo_feedback": "$tipo_feedback",
+                "ciencia_colaborador": "$ciencia_colaborador"
+            },
+            "count": {"$sum": 1}
+        }}
+    ])
+    async for group in feedback_groups:
+        for scope in _scopes(group["_id"]):
+            for field, value in feedback_contribution(group["_id"]).items():
+                counters[scope][field] += value * group["count"]
+
+    plan_groups = db.planos_acao.aggregate([
+        {"$group": {
+            "_id": {
+                "colaborador_id": "$colaborador_id",
+                "gestor_id": "$gestor_id",
+                "status": "$status"
+            },
+            "count": {"$sum": 1}
+        }}
+    ])
+    async for group in plan_groups:
+        for scope in _scopes(group["_id"]):
+            for field, value in plan_contribution(group["_id"]).items():
+                counters[scope][field] += value * group["count"]
+
+    deltas = {}
+    for scope in counters.keys() | snapshot.keys():
+        current = _flatten(snapshot.get(scope, {}))
+        rebuilt = counters.get(scope, {})
+        deltas[scope] = {
+            field: rebuilt.get(field, 0) - current.get(field, 0)
+            for field in rebuilt.keys() | current.keys()
+            if rebuilt.get(field, 0) != current.get(field, 0)
+        }
+    await _apply(db, {scope: fields for scope, fields in deltas.items() if scope in counters})
+
+    # Untouched since the snapshot: the whole document still equals it
+    operations = [
+        DeleteOne({"_id": scope, "$expr": {"$eq": ["$$ROOT", snapshot[scope]]}})
+        for scope in snapshot.keys() - counters.keys()
+    ]
+    if operations:
+        await db[COUNTERS_COLLECTION].bulk_write(operations, ordered=False)
+
+    logger.info(f"Dashboard counters reconciled: {len(counters)} scopes")
+    return len(counters)
+
+
+def _flatten(document: dict) -> Dict[str, int]:
+    """The dotted `$inc` paths and values of a counter document"""
+    fields = {}
+    for key, value in document.items():
+        if key == "_id":
+            continue
+        if isinstance(value, dict):
+            for name, count in value.items():
+                fields[f"{key}.{name}"] = count
+        else:
+            fields[key] = value
+    return fields
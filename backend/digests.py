@@ -0,0 +1,287 @@
+"""
+Overdue digests for Bee It Feedback
+
+The overdue check sends each person one email listing everything that
+needs their attention, instead of one email per feedback or plan:
+
+- managers get the feedbacks they gave whose next feedback date passed at
+  least a day ago
+- collaborators and managers get the action plans they are responsible
+  for whose deadline passed or falls within DEADLINE_WARNING_DAYS
+
+Each list is one aggregation that groups the items by recipient and joins
+the recipient's name and e-mail with `$lookup`, so the scan issues the same
+number of queries however many items are overdue. Recipients are read
+DIGEST_CHUNK_SIZE at a time; the bodies of a chunk are rendered as one
+batch and queued in the email outbox with a single insert.
+
+Every alert sent is recorded in `notification_ledger`, one entry per
+(recipient, item, kind, UTC day) under a unique index, expiring after
+NOTIFICATION_LEDGER_TTL_DAYS. Before queueing a chunk the scan reads the
+ledger for all of its recipients at once and leaves out what they were
+already alerted about today, so the check can run as often as wanted and
+each item still reaches each person at most once a day.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+import metrics
+from email_outbox import enqueue_emails, outbox_message
+from email_service import action_plans_digest_emails, overdue_feedbacks_digest_emails
+
+DIGEST_CHUNK_SIZE = int(os.environ.get('DIGEST_CHUNK_SIZE', '500'))
+# Items listed in one email; the rest are summarized as a count
+DIGEST_MAX_ITEMS = int(os.environ.get('DIGEST_MAX_ITEMS', '50'))
+DEADLINE_WARNING_DAYS = 7
+
+LEDGER_COLLECTION = "notification_ledger"
+NOTIFICATION_LEDGER_TTL_DAYS = int(os.environ.get('NOTIFICATION_LEDGER_TTL_DAYS', '2'))
+
+FEEDBACK_DIGEST = "digest_feedbacks_atrasados"
+PLAN_DIGEST = "digest_prazos_planos"
+
+
+def _recipient_lookup() -> List[dict]:
+    """Stages joining the recipient grouped under `_id`, dropping those without an e-mail"""
+    return [
+        {"$lookup": {
+            "from": "usuarios",
+            "let": {"usuario_id": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$id", "$$usuario_id"]}}},
+                {"$project": {"_id": 0, "nome": 1, "email": 1, "ativo": 1}}
+            ],
+            "as": "destinatario"
+        }},
+        {"$unwind": "$destinatario"},
+        {"$match": {"destinatario.email": {"$nin": [None, ""]}, "destinatario.ativo": {"$ne": False}}},
+    ]
+
+
+def overdue_feedbacks_pipeline(now: datetime) -> List[dict]:
+    """Aggregation on feedbacks yielding one row per manager with their overdue feedbacks"""
+    cutoff = (now - timedelta(days=1)).isoformat()
+    return [
+        {"$match": {
+            "data_proximo_feedback": {"$lte": cutoff},
+            "status_feedback": {"$ne": "Concluído"}
+        }},
+        {"$sort": {"data_proximo_feedback": 1}},
+        {"$group": {
+            "_id": "$gestor_id",
+            "total": {"$sum": 1},
+            "itens": {"$push": {
+                "id": "$id",
+                "colaborador_nome": "$colaborador_nome",
+                "data": "$data_proximo_feedback"
+            }}
+        }},
+        *_recipient_lookup(),
+    ]
+
+
+def _responsible(role: str, field: str) -> dict:
+    return {"$cond": [
+        {"$in": [{"$ifNull": ["$responsavel", "Ambos"]}, [role, "Ambos"]]},
+        [field],
+        []
+    ]}
+
+
+def plan_deadlines_pipeline(now: datetime) -> List[dict]:
+    """Aggregation on plans yielding one row per responsible person with their plans"""
+    threshold = (now + timedelta(days=DEADLINE_WARNING_DAYS)).isoformat()
+    return [
+        {"$match": {"prazo_final": {"$lte": threshold}, "status": {"$ne": "Concluído"}}},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "objetivo": 1,
+            "prazo_final": 1,
+            "destinatarios": {"$setUnion": [
+                _responsible("Colaborador", "$colaborador_id"),
+                _responsible("Gestor", "$gestor_id"),
+            ]}
+        }},
+        {"$unwind": "$destinatarios"},
+        {"$sort": {"prazo_final": 1}},
+        {"$group": {
+            "_id": "$destinatarios",
+            "total": {"$sum": 1},
+            "itens": {"$push": {"id": "$id", "objetivo": "$objetivo", "data": "$prazo_final"}}
+        }},
+        *_recipient_lookup(),
+    ]
+
+
+def _parse_iso(value: Optional[str]) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _feedback_items(row: dict, now: datetime) -> List[dict]:
+    feedbacks = []
+    for item in row["itens"][:DIGEST_MAX_ITEMS]:
+        data = _parse_iso(item.get("data"))
+        feedbacks.append({
+            "colaborador_nome": item.get("colaborador_nome") or "Colaborador",
+            "data_prevista": data.strftime("%d/%m/%Y") if data else item.get("data"),
+            "dias_atraso": (now - data).days if data else 0,
+        })
+    return feedbacks
+
+
+def feedback_digests(rows: List[dict], now: datetime) -> List[dict]:
+    """Outbox messages for rows of `overdue_feedbacks_pipeline`, rendered as one batch"""
+    emails = overdue_feedbacks_digest_emails([{
+        "gestor_nome": row["destinatario"].get("nome") or "Gestor",
+        "feedbacks": _feedback_items(row, now),
+        "total": row["total"],
+    } for row in rows])
+    return [
+        outbox_message(row["destinatario"]["email"], assunto, html, FEEDBACK_DIGEST)
+        for row, (assunto, html) in zip(rows, emails)
+    ]
+
+
+def _plan_items(row: dict, now: datetime) -> List[dict]:
+    planos = []
+    for item in row["itens"][:DIGEST_MAX_ITEMS]:
+        prazo = _parse_iso(item.get("data"))
+        planos.append({
+            "objetivo": item.get("objetivo") or "Plano de Ação",
+            "prazo_final": prazo.strftime("%d/%m/%Y") if prazo else item.get("data"),
+            "dias_restantes": (prazo - now).days if prazo else 0,
+        })
+    return planos
+
+
+def plan_digests(rows: List[dict], now: datetime) -> List[dict]:
+    """Outbox messages for rows of `plan_deadlines_pipeline`, rendered as one batch"""
+    emails = action_plans_digest_emails([{
+        "responsavel_nome": row["destinatario"].get("nome") or "Responsável",
+        "planos": _plan_items(row, now),
+        "total": row["total"],
+    } for row in rows])
+    return [
+        outbox_message(row["destinatario"]["email"], assunto, html, PLAN_DIGEST)
+        for row, (assunto, html) in zip(rows, emails)
+    ]
+
+
+async def claim_alerts(db, tipo: str, candidates: Dict[str, List[str]], now: datetime) -> List[dict]:
+    """
+    Record alerts of kind `tipo` for today in the ledger, skipping those
+    already recorded
+
+    Args:
+        candidates: Recipient id -> ids of the items they would be alerted about
+
+    Returns:
+        list: Ledger entries written by this call; the alerts to send
+    """
+    dia = now.date().isoformat()
+    sent = set()
+    async for entry in db[LEDGER_COLLECTION].find(
+        {"destinatario_id": {"$in": list(candidates)}, "tipo": tipo, "dia": dia},
+        {"_id": 0, "destinatario_id": 1, "entidade_id": 1}
+    ):
+        sent.add((entry["destinatario_id"], entry["entidade_id"]))
+
+    expira_em = now + timedelta(days=NOTIFICATION_LEDGER_TTL_DAYS)
+    entries = [
+        {"destinatario_id": destinatario_id, "entidade_id": entidade_id, "tipo": tipo, "dia": dia, "expira_em": expira_em}
+        for destinatario_id, entidade_ids in candidates.items()
+        for entidade_id in entidade_ids
+        if (destinatario_id, entidade_id) not in sent
+    ]
+    if not entries:
+        return []
+    try:
+        await db[LEDGER_COLLECTION].insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # A concurrent scan claimed some of them first: those are its to send
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in errors):
+            raise
+        taken = {error["index"] for error in errors}
+        entries = [entry for index, entry in enumerate(entries) if index not in taken]
+    return entries
+
+
+async def _release_alerts(db, entries: List[dict]):
+    await db[LEDGER_COLLECTION].delete_many({"_id": {"$in": [entry["_id"] for entry in entries]}})
+
+
+async def _queue_chunk(db, rows: List[dict], tipo: str, build: Callable[[List[dict]], List[dict]], now: datetime) -> dict:
+    candidates = {row["_id"]: [item["id"] for item in row["itens"]] for row in rows}
+    claimed = await claim_alerts(db, tipo, candidates, now)
+    new = {}
+    for entry in claimed:
+        new.setdefault(entry["destinatario_id"], set()).add(entry["entidade_id"])
+
+    pending = []
+    alerted = 0
+    for row in rows:
+        itens = [item for item in row["itens"] if item["id"] in new.get(row["_id"], ())]
+        if itens:
+            pending.append({**row, "itens": itens, "total": len(itens)})
+            alerted += len(itens)
+    try:
+        queued = await enqueue_emails(db, build(pending))
+    except Exception:
+        # Let the next run send what could not be queued
+        await _release_alerts(db, claimed)
+        raise
+    skipped = sum(len(ids) for ids in candidates.values()) - alerted
+    return {"emails": queued, "itens": alerted, "ja_notificados": skipped}
+
+
+async def _queue_digests(db, cursor, tipo: str, build: Callable[[List[dict]], List[dict]], now: datetime) -> dict:
+    totals = {"emails": 0, "itens": 0, "ja_notificados": 0}
+    chunk = []
+    async for row in cursor:
+        chunk.append(row)
+        if len(chunk) >= DIGEST_CHUNK_SIZE:
+            for key, value in (await _queue_chunk(db, chunk, tipo, build, now)).items():
+                totals[key] += value
+            chunk = []
+    if chunk:
+        for key, value in (await _queue_chunk(db, chunk, tipo, build, now)).items():
+            totals[key] += value
+    return totals
+
+
+async def queue_overdue_digests(db, now: Optional[datetime] = None) -> dict:
+    """
+    Queue one digest per manager with overdue feedbacks and one per person
+    responsible for plans near or past their deadline, covering only the
+    items they were not alerted about yet today
+
+    Returns:
+        dict: Digests queued, items alerted and items already alerted, per kind
+    """
+    now = now or datetime.now(timezone.utc)
+    with metrics.timed("digests.overdue_scan"):
+        feedbacks = await _queue_digests(
+            db,
+            db.feedbacks.aggregate(overdue_feedbacks_pipeline(now), allowDiskUse=True, batchSize=DIGEST_CHUNK_SIZE),
+            FEEDBACK_DIGEST,
+            lambda rows: feedback_digests(rows, now),
+            now
+        )
+        plans = await _queue_digests(
+            db,
+            db.planos_acao.aggregate(plan_deadlines_pipeline(now), allowDiskUse=True, batchSize=DIGEST_CHUNK_SIZE),
+            PLAN_DIGEST,
+            lambda rows: plan_digests(rows, now),
+            now
+        )
+    metrics.inc("digests.queued", feedbacks["emails"] + plans["emails"])
+    return {"feedbacks_atrasados": feedbacks, "prazos_planos": plans}
@@ -0,0 +1,402 @@
+"""
+Durable email outbox for Bee It Feedback
+
+Requests never talk to SendGrid. They insert the message into the
+`email_outbox` collection, in the same transaction as the change that
+caused it where the deployment supports transactions, and return. An
+asyncio worker drains the outbox through one pooled `SendGridClient`:
+
+- claimed messages sharing a body (e.g. every "novo feedback" email, whose
+  per-recipient values are SendGrid substitutions) go out as one request
+  with a personalization per recipient, up to EMAIL_OUTBOX_GROUP_SIZE
+- a message is claimed atomically (status "enviando" plus a lease), so any
+  number of workers can drain the same outbox, and a message claimed by a
+  worker that died is picked up again once its lease expires
+- sends are spread under a per-provider rate limit and a concurrency cap
+- 429, 5xx and network errors are retried with exponential backoff
+  (honouring Retry-After); other 4xx responses, and messages that ran out
+  of attempts, are dead-lettered with status "falhou" and kept for
+  inspection and requeueing
+- sent messages expire EMAIL_OUTBOX_RETENTION_DAYS after delivery
+
+The worker runs inside every web worker by default. Set
+EMAIL_OUTBOX_WORKER_ENABLED=false to run it on its own instead, from the
+backend directory:
+
+    python email_outbox.py
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import httpx
+from pymongo import ReturnDocument
+
+import metrics
+from email_service import SENDGRID_MAX_PERSONALIZATIONS, SendGridClient, personalization, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "email_outbox"
+
+EMAIL_OUTBOX_WORKER_ENABLED = os.environ.get('EMAIL_OUTBOX_WORKER_ENABLED', 'true').lower() == 'true'
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', '2'))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+EMAIL_OUTBOX_CONCURRENCY = int(os.environ.get('EMAIL_OUTBOX_CONCURRENCY', '10'))
+# Recipients per request for messages sharing a body; 1 sends each on its own
+EMAIL_OUTBOX_GROUP_SIZE = min(int(os.environ.get('EMAIL_OUTBOX_GROUP_SIZE', '1000')), SENDGRID_MAX_PERSONALIZATIONS)
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '8'))
+EMAIL_OUTBOX_BACKOFF_BASE_SECONDS = float(os.environ.get('EMAIL_OUTBOX_BACKOFF_BASE_SECONDS', '30'))
+EMAIL_OUTBOX_BACKOFF_MAX_SECONDS = float(os.environ.get('EMAIL_OUTBOX_BACKOFF_MAX_SECONDS', '3600'))
+EMAIL_OUTBOX_LEASE_SECONDS = float(os.environ.get('EMAIL_OUTBOX_LEASE_SECONDS', '120'))
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get('EMAIL_OUTBOX_RETENTION_DAYS', '7'))
+
+# Sends per second allowed per provider, in each worker process
+PROVIDER_RATE_LIMITS = {
+    "sendgrid": float(os.environ.get('SENDGRID_RATE_PER_SECOND', '10')),
+}
+DEFAULT_PROVIDER = "sendgrid"
+
+STATUS_PENDENTE = "pendente"
+STATUS_ENVIANDO = "enviando"
+STATUS_ENVIADO = "enviado"
+STATUS_FALHOU = "falhou"
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def outbox_message(
+    para: str,
+    assunto: str,
+    html: str,
+    tipo: str,
+    entidade_id: Optional[str] = None,
+    substituicoes: Optional[Dict[str, str]] = None
+) -> dict:
+    """
+    A new outbox document, ready to be sent. `substituicoes` maps the
+    substitution tags in a shared `html` to this recipient's values.
+    """
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "provedor": DEFAULT_PROVIDER,
+        "tipo": tipo,
+        "entidade_id": entidade_id,
+        "para": para,
+        "assunto": assunto,
+        "html": html,
+        "substituicoes": substituicoes,
+        "status": STATUS_PENDENTE,
+        "tentativas": 0,
+        "proxima_tentativa_em": now,
+        "bloqueado_ate": None,
+        "ultimo_erro": None,
+        "criado_em": now,
+        "enviado_em": None,
+        "expira_em": None,
+    }
+
+
+async def enqueue_email(
+    db,
+    para: str,
+    assunto: str,
+    html: str,
+    tipo: str,
+    entidade_id: Optional[str] = None,
+    substituicoes: Optional[Dict[str, str]] = None,
+    session=None
+) -> dict:
+    """
+    Queue one email. Pass the session of the transaction writing the domain
+    change so the message exists if and only if the change does.
+    """
+    message = outbox_message(para, assunto, html, tipo, entidade_id, substituicoes)
+    await db[OUTBOX_COLLECTION].insert_one(message, session=session)
+    del message["_id"]
+    metrics.inc("email_outbox.enqueued")
+    return message
+
+
+async def enqueue_emails(db, messages: List[dict], session=None) -> int:
+    """
+    Queue many emails built with `outbox_message` in one insert
+
+    Returns:
+        int: Number of messages queued
+    """
+    if not messages:
+        return 0
+    await db[OUTBOX_COLLECTION].insert_many(messages, ordered=False, session=session)
+    for message in messages:
+        message.pop("_id", None)
+    metrics.inc("email_outbox.enqueued", len(messages))
+    return len(messages)
+
+
+def backoff_seconds(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Delay before retry number `attempt` (1-based), with jitter"""
+    delay = min(EMAIL_OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1), EMAIL_OUTBOX_BACKOFF_MAX_SECONDS)
+    delay *= random.uniform(0.8, 1.2)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class RateLimiter:
+    """Token bucket spacing calls to at most `rate` per second"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def group_by_body(messages: List[dict], max_size: int) -> List[List[dict]]:
+    """Split messages into requests: same provider and body, at most max_size each"""
+    groups: Dict[tuple, List[dict]] = {}
+    for message in messages:
+        groups.setdefault((message.get("provedor", DEFAULT_PROVIDER), message["html"]), []).append(message)
+    size = max(1, max_size)
+    return [group[start:start + size] for group in groups.values() for start in range(0, len(group), size)]
+
+
+class OutboxWorker:
+    """Drains `email_outbox` through a pooled SendGrid client"""
+
+    def __init__(
+        self,
+        db,
+        client: Optional[SendGridClient] = None,
+        batch_size: int = EMAIL_OUTBOX_BATCH_SIZE,
+        concurrency: int = EMAIL_OUTBOX_CONCURRENCY,
+        poll_seconds: float = EMAIL_OUTBOX_POLL_SECONDS,
+        rate_limits: Optional[Dict[str, float]] = None,
+        group_size: int = EMAIL_OUTBOX_GROUP_SIZE
+    ):
+        self.db = db
+        self.client = client or SendGridClient()
+        self.batch_size = batch_size
+        self.group_size = group_size
+        self.poll_seconds = poll_seconds
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._limiters = {
+            provider: RateLimiter(rate) for provider, rate in (rate_limits or PROVIDER_RATE_LIMITS).items()
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is not None:
+            return
+        if not self.client.configured:
+            # Messages stay queued until a key is configured
+            logger.warning("SENDGRID_API_KEY not configured. Email outbox is not being drained.")
+            return
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.client.close()
+
+    async def run(self):
+        """Drain the outbox until cancelled"""
+        while True:
+            try:
+                sent = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Whatever broke this pass, the queue must keep draining
+                logger.exception("Email outbox drain failed")
+                metrics.inc("email_outbox.errors")
+                sent = 0
+            # A full batch means more is probably waiting
+            if sent < self.batch_size:
+                await asyncio.sleep(self.poll_seconds)
+
+    async def drain_once(self) -> int:
+        """
+        Claim up to batch_size due messages and deliver them
+
+        Returns:
+            int: Number of messages claimed
+        """
+        claimed = []
+        for _ in range(self.batch_size):
+            message = await self._claim()
+            if not message:
+                break
+            claimed.append(message)
+        if claimed:
+            await asyncio.gather(*(self._deliver(group) for group in group_by_body(claimed, self.group_size)))
+        await self.report()
+        return len(claimed)
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self.db[OUTBOX_COLLECTION].find_one_and_update(
+            {"$or": [
+                {"status": STATUS_PENDENTE, "proxima_tentativa_em": {"$lte": now}},
+                # Claimed by a worker that never finished
+                {"status": STATUS_ENVIANDO, "bloqueado_ate": {"$lt": now}},
+            ]},
+            {
+                "$set": {"status": STATUS_ENVIANDO, "bloqueado_ate": now + timedelta(seconds=EMAIL_OUTBOX_LEASE_SECONDS)},
+                "$inc": {"tentativas": 1},
+            },
+            {"_id": 0, "id": 1, "provedor": 1, "para": 1, "assunto": 1, "html": 1, "substituicoes": 1, "tentativas": 1},
+            sort=[("proxima_tentativa_em", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _deliver(self, messages: List[dict]):
+        """Send messages sharing a body as one request, one personalization each"""
+        first = messages[0]
+        limiter = self._limiters.get(first.get("provedor", DEFAULT_PROVIDER))
+        personalizations = [
+            personalization(
+                message["para"],
+                message.get("substituicoes"),
+                message["assunto"] if message["assunto"] != first["assunto"] else None
+            )
+            for message in messages
+        ]
+        async with self._semaphore:
+            if limiter:
+                await limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = await self.client.send_bulk(first["assunto"], first["html"], personalizations)
+            except httpx.HTTPError as e:
+                await self._failed_all(messages, f"{type(e).__name__}: {e}", retryable=True)
+                return
+            except Exception as e:
+                # A bug or a malformed message must not fail the rest of the batch
+                logger.exception(f"Unexpected error sending emails {[m.get('id') for m in messages]}")
+                await self._failed_all(messages, f"{type(e).__name__}: {e}", retryable=True)
+                return
+            finally:
+                metrics.observe("email_outbox.send", time.perf_counter() - started)
+                metrics.inc("email_outbox.requests")
+
+        if response.status_code in (200, 201, 202):
+            await self._sent(messages)
+        else:
+            await self._failed_all(
+                messages,
+                f"HTTP {response.status_code}: {response.text[:500]}",
+                retryable=response.status_code in RETRYABLE_STATUS_CODES,
+                retry_after=retry_after_seconds(response)
+            )
+
+    async def _sent(self, messages: List[dict]):
+        now = datetime.now(timezone.utc)
+        await self.db[OUTBOX_COLLECTION].update_many({"id": {"$in": [m["id"] for m in messages]}}, {"$set": {
+            "status": STATUS_ENVIADO,
+            "enviado_em": now,
+            "bloqueado_ate": None,
+            "expira_em": now + timedelta(days=EMAIL_OUTBOX_RETENTION_DAYS),
+        }})
+        metrics.inc("email_outbox.sent", len(messages))
+
+    async def _failed_all(self, messages: List[dict], error: str, retryable: bool, retry_after: Optional[float] = None):
+        # Each message keeps its own attempt count, hence its own backoff
+        await asyncio.gather(*(self._failed(message, error, retryable, retry_after) for message in messages))
+
+    async def _failed(self, message: dict, error: str, retryable: bool, retry_after: Optional[float] = None):
+        attempts = message["tentativas"]
+        if retryable and attempts < EMAIL_OUTBOX_MAX_ATTEMPTS:
+            delay = backoff_seconds(attempts, retry_after)
+            update = {
+                "status": STATUS_PENDENTE,
+                "proxima_tentativa_em": datetime.now(timezone.utc) + timedelta(seconds=delay),
+                "bloqueado_ate": None,
+                "ultimo_erro": error,
+            }
+            metrics.inc("email_outbox.retries")
+        else:
+            update = {"status": STATUS_FALHOU, "bloqueado_ate": None, "ultimo_erro": error}
+            metrics.inc("email_outbox.dead_lettered")
+            logger.error(f"Email {message['id']} to {message['para']} dead-lettered: {error}")
+        await self.db[OUTBOX_COLLECTION].update_one({"id": message["id"]}, {"$set": update})
+
+    async def report(self):
+        """Publish the backlog size and the age of the oldest due message"""
+        now = datetime.now(timezone.utc)
+        outbox = self.db[OUTBOX_COLLECTION]
+        pending = await outbox.count_documents({"status": STATUS_PENDENTE})
+        oldest = await outbox.find_one(
+            {"status": STATUS_PENDENTE, "proxima_tentativa_em": {"$lte": now}},
+            {"_id": 0, "criado_em": 1}, sort=[("proxima_tentativa_em", 1)]
+        )
+        metrics.set_gauge("email_outbox.pending", pending)
+        lag = (now - oldest["criado_em"].replace(tzinfo=timezone.utc)).total_seconds() if oldest else 0
+        metrics.set_gauge("email_outbox.lag_seconds", round(lag, 3))
+
+
+async def outbox_stats(db) -> dict:
+    """Number of outbox messages per status"""
+    rows = await db[OUTBOX_COLLECTION].aggregate([
+        {"$group": {"_id": "$status", "total": {"$sum": 1}}}
+    ]).to_list(None)
+    return {row["_id"]: row["total"] for row in rows}
+
+
+async def requeue_email(db, message_id: str) -> bool:
+    """Put a dead-lettered message back in the queue with fresh attempts"""
+    result = await db[OUTBOX_COLLECTION].update_one(
+        {"id": message_id, "status": STATUS_FALHOU},
+        {"$set": {
+            "status": STATUS_PENDENTE,
+            "tentativas": 0,
+            "proxima_tentativa_em": datetime.now(timezone.utc),
+        }}
+    )
+    return result.modified_count == 1
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        worker = OutboxWorker(client[os.environ['DB_NAME']])
+        if not worker.client.configured:
+            raise SystemExit("SENDGRID_API_KEY not configured")
+        try:
+            await worker.run()
+        finally:
+            await worker.stop()
+
+    asyncio.run(main())
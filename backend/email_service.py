@@ -1,251 +1,243 @@
 """
 Email service for Bee It Feedback notifications using SendGrid
+
+The message builders return (subject, html) pairs, with the bodies rendered
+from the templates in email_templates.py; messages are queued in
+the email outbox (see email_outbox.py) and delivered through one pooled
+`SendGridClient` per process.
+
+Builders for frequent emails render one body shared by every recipient,
+with SendGrid substitution tags where the per-recipient values go, and
+return the values alongside. The outbox worker sends messages sharing a
+body as one request with a personalization per recipient.
 """
+import functools
+import logging
 import os
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Email, To, Content
-from datetime import datetime, timedelta
-from typing import Optional
-import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from markupsafe import escape
+
+from email_templates import render, render_many, render_with_tags
+
+logger = logging.getLogger(__name__)
 
-SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'noreply@beeit.com.br')
 SENDER_NAME = 'Bee It Feedback'
 
+# Default endpoint; SENDGRID_API_URL points the client elsewhere, e.g. at a
+# local sendgrid_sink.py for load tests
+SENDGRID_API_URL = "https://api.sendgrid.com"
+SENDGRID_SEND_PATH = "/v3/mail/send"
+SENDGRID_MAX_CONNECTIONS = int(os.environ.get('SENDGRID_MAX_CONNECTIONS', '20'))
+SENDGRID_TIMEOUT_SECONDS = float(os.environ.get('SENDGRID_TIMEOUT_SECONDS', '10'))
+
+# Recipients SendGrid accepts in one request
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+
+
+def sendgrid_payload(to_email: str, subject: str, html_content: str) -> dict:
+    """Body of a v3 mail/send request for a single recipient"""
+    return {
+        "personalizations": [{"to": [{"email": to_email}]}],
+        "from": {"email": SENDER_EMAIL, "name": SENDER_NAME},
+        "subject": subject,
+        "content": [{"type": "text/html", "value": html_content}],
+    }
 
-def send_email(to_email: str, subject: str, html_content: str) -> bool:
+
+def personalization(to_email: str, substitutions: Optional[Dict[str, str]] = None, subject: Optional[str] = None) -> dict:
     """
-    Send email via SendGrid
-    
+    One recipient of a bulk request. Substitution values replace their tags
+    verbatim in the HTML, so they are escaped here.
+    """
+    entry = {"to": [{"email": to_email}]}
+    if substitutions:
+        entry["substitutions"] = {tag: str(escape(value)) for tag, value in substitutions.items()}
+    if subject is not None:
+        entry["subject"] = subject
+    return entry
+
+
+def sendgrid_bulk_payload(subject: str, html_content: str, personalizations: List[dict]) -> dict:
+    """Body of a v3 mail/send request sending one template to many recipients"""
+    return {
+        "personalizations": personalizations,
+        "from": {"email": SENDER_EMAIL, "name": SENDER_NAME},
+        "subject": subject,
+        "content": [{"type": "text/html", "value": html_content}],
+    }
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """The Retry-After header of a response, in seconds"""
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class SendGridClient:
+    """
+    Async SendGrid v3 client sharing one connection pool for every send
+
     Args:
-        to_email: Recipient email address
-        subject: Email subject
-        html_content: HTML content of the email
-    
+        api_key: SendGrid API key (defaults to the SENDGRID_API_KEY variable)
+        base_url: API endpoint (defaults to the SENDGRID_API_URL variable,
+            then to SendGrid itself)
+        transport: Optional httpx transport, e.g. the ASGI transport of a
+            `sendgrid_sink.SendGridSink` in tests
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        # Read at construction: .env may be loaded after this module is imported
+        self.api_key = api_key or os.environ.get('SENDGRID_API_KEY')
+        self.base_url = base_url or os.environ.get('SENDGRID_API_URL') or SENDGRID_API_URL
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=SENDGRID_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=SENDGRID_MAX_CONNECTIONS,
+                max_keepalive_connections=SENDGRID_MAX_CONNECTIONS
+            ),
+            transport=transport,
+        )
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    async def send(self, to_email: str, subject: str, html_content: str) -> httpx.Response:
+        """
+        Post one message. The response is returned as is, so callers decide
+        what to retry; network failures raise httpx.HTTPError.
+        """
+        return await self._http.post(SENDGRID_SEND_PATH, json=sendgrid_payload(to_email, subject, html_content))
+
+    async def send_bulk(self, subject: str, html_content: str, personalizations: List[dict]) -> httpx.Response:
+        """Post one template to up to SENDGRID_MAX_PERSONALIZATIONS recipients"""
+        return await self._http.post(
+            SENDGRID_SEND_PATH, json=sendgrid_bulk_payload(subject, html_content, personalizations)
+        )
+
+    async def close(self):
+        await self._http.aclose()
+
+
+async def send_email(client: SendGridClient, to_email: str, subject: str, html_content: str) -> bool:
+    """
+    Send one email right away, bypassing the outbox
+
     Returns:
-        bool: True if sent successfully, False otherwise
+        bool: True if SendGrid accepted the message, False otherwise
     """
-    if not SENDGRID_API_KEY:
-        print("Warning: SENDGRID_API_KEY not configured. Email not sent.")
+    if not client.configured:
+        logger.warning("SENDGRID_API_KEY not configured. Email not sent.")
         return False
     
     try:
-        message = Mail(
-            from_email=Email(SENDER_EMAIL, SENDER_NAME),
-            to_emails=To(to_email),
-            subject=subject,
-            html_content=Content("text/html", html_content)
-        )
-        
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
-        
-        print(f"Email sent to {to_email}: {response.status_code}")
+        response = await client.send(to_email, subject, html_content)
+        logger.info(f"Email sent to {to_email}: {response.status_code}")
         return response.status_code in [200, 201, 202]
-    except Exception as e:
-        print(f"Error sending email to {to_email}: {str(e)}")
+    except httpx.HTTPError as e:
+        logger.error(f"Error sending email to {to_email}: {e}")
         return False
 
 
-def get_email_header():
-    """Returns the common email header with Bee It branding"""
-    return """
-    <div style="background-color: #0F172A; padding: 20px; text-align: center; border-radius: 8px 8px 0 0;">
-        <h1 style="color: #F59E0B; margin: 0; font-family: Arial, sans-serif;">
-            🐝 Bee It Feedback
-        </h1>
-    </div>
-    """
-
-
-def get_email_footer():
-    """Returns the common email footer"""
-    return """
-    <div style="background-color: #1E293B; padding: 15px; text-align: center; border-radius: 0 0 8px 8px; margin-top: 20px;">
-        <p style="color: #94A3B8; font-size: 12px; margin: 0; font-family: Arial, sans-serif;">
-            Este e-mail foi enviado automaticamente pelo sistema Bee It Feedback.<br>
-            Por favor, não responda a este e-mail.
-        </p>
-    </div>
-    """
+@functools.lru_cache(maxsize=None)
+def _new_feedback_template() -> Tuple[str, dict]:
+    return render_with_tags("new_feedback.html", ["colaborador_nome", "gestor_nome", "tipo_feedback", "data_feedback"])
 
 
-def send_new_feedback_notification(
-    colaborador_email: str,
+def new_feedback_email(
     colaborador_nome: str,
     gestor_nome: str,
     tipo_feedback: str,
     data_feedback: str
-) -> bool:
+) -> Tuple[str, str, Dict[str, str]]:
     """
-    Send notification when a new feedback is created
+    Email sent to the collaborator when a new feedback is created
     
     Args:
-        colaborador_email: Employee email
         colaborador_nome: Employee name
         gestor_nome: Manager name
         tipo_feedback: Type of feedback
         data_feedback: Feedback date
-    """
-    subject = f"🆕 Novo Feedback Registrado - {tipo_feedback}"
     
-    html_content = f"""
-    <html>
-    <body style="margin: 0; padding: 20px; background-color: #020617; font-family: Arial, sans-serif;">
-        <div style="max-width: 600px; margin: 0 auto; background-color: #0F172A; border-radius: 8px; overflow: hidden;">
-            {get_email_header()}
-            
-            <div style="padding: 30px; color: #E2E8F0;">
-                <h2 style="color: #F59E0B; margin-top: 0;">Olá, {colaborador_nome}!</h2>
-                
-                <p>Um novo feedback foi registrado para você:</p>
-                
-                <div style="background-color: #1E293B; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #F59E0B;">
-                    <p style="margin: 5px 0;"><strong style="color: #F59E0B;">Tipo:</strong> {tipo_feedback}</p>
-                    <p style="margin: 5px 0;"><strong style="color: #F59E0B;">Gestor:</strong> {gestor_nome}</p>
-                    <p style="margin: 5px 0;"><strong style="color: #F59E0B;">Data:</strong> {data_feedback}</p>
-                </div>
-                
-                <p>Acesse o sistema para visualizar os detalhes completos e dar ciência do feedback.</p>
-                
-                <div style="text-align: center; margin-top: 30px;">
-                    <a href="#" style="background-color: #F59E0B; color: #000; padding: 12px 30px; text-decoration: none; border-radius: 6px; font-weight: bold; display: inline-block;">
-                        Acessar Sistema
-                    </a>
-                </div>
-            </div>
-            
-            {get_email_footer()}
-        </div>
-    </body>
-    </html>
+    Returns:
+        tuple: Subject, the body shared by every new feedback email, and
+            the substitutions filling it in for this recipient
     """
-    
-    return send_email(colaborador_email, subject, html_content)
-
+    subject = f"🆕 Novo Feedback Registrado - {tipo_feedback}"
+    html_content, tags = _new_feedback_template()
+    substitutions = {
+        tags["colaborador_nome"]: colaborador_nome,
+        tags["gestor_nome"]: gestor_nome,
+        tags["tipo_feedback"]: tipo_feedback,
+        tags["data_feedback"]: data_feedback,
+    }
+    return subject, html_content, substitutions
 
-def send_overdue_feedback_notification(
-    gestor_email: str,
-    gestor_nome: str,
-    colaborador_nome: str,
-    data_prevista: str,
-    dias_atraso: int
-) -> bool:
+def overdue_feedbacks_digest_emails(digests: List[dict]) -> List[Tuple[str, str]]:
     """
-    Send notification when a feedback is overdue
+    Daily digests sent to managers listing every overdue feedback
     
     Args:
-        gestor_email: Manager email
-        gestor_nome: Manager name
-        colaborador_nome: Employee name
-        data_prevista: Expected date
-        dias_atraso: Days overdue
-    """
-    subject = f"⚠️ Feedback Atrasado - {colaborador_nome}"
-    
-    html_content = f"""
-    <html>
-    <body style="margin: 0; padding: 20px; background-color: #020617; font-family: Arial, sans-serif;">
-        <div style="max-width: 600px; margin: 0 auto; background-color: #0F172A; border-radius: 8px; overflow: hidden;">
-            {get_email_header()}
-            
-            <div style="padding: 30px; color: #E2E8F0;">
-                <h2 style="color: #EF4444; margin-top: 0;">⚠️ Atenção, {gestor_nome}!</h2>
-                
-                <p>Existe um feedback pendente que está atrasado:</p>
-                
-                <div style="background-color: #1E293B; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #EF4444;">
-                    <p style="margin: 5px 0;"><strong style="color: #F59E0B;">Colaborador:</strong> {colaborador_nome}</p>
-                    <p style="margin: 5px 0;"><strong style="color: #F59E0B;">Data Prevista:</strong> {data_prevista}</p>
-                    <p style="margin: 5px 0;"><strong style="color: #EF4444;">Dias de Atraso:</strong> {dias_atraso} dia(s)</p>
-                </div>
-                
-                <p>Por favor, realize o feedback o mais breve possível para manter o acompanhamento adequado do colaborador.</p>
-                
-                <div style="text-align: center; margin-top: 30px;">
-                    <a href="#" style="background-color: #F59E0B; color: #000; padding: 12px 30px; text-decoration: none; border-radius: 6px; font-weight: bold; display: inline-block;">
-                        Registrar Feedback
-                    </a>
-                </div>
-            </div>
-            
-            {get_email_footer()}
-        </div>
-    </body>
-    </html>
+        digests: Dicts with gestor_nome, feedbacks (up to DIGEST_MAX_ITEMS
+            dicts with colaborador_nome, data_prevista (dd/mm/yyyy) and
+            dias_atraso) and total, the number of overdue feedbacks
+            including those not listed
     """
-    
-    return send_email(gestor_email, subject, html_content)
+    bodies = render_many("overdue_feedbacks_digest.html", digests)
+    return [(f"⚠️ {digest['total']} Feedback(s) Atrasado(s)", body) for digest, body in zip(digests, bodies)]
+
+
+def overdue_feedbacks_digest_email(gestor_nome: str, feedbacks: List[dict], total: int) -> Tuple[str, str]:
+    """Single-recipient form of `overdue_feedbacks_digest_emails`"""
+    return overdue_feedbacks_digest_emails([{"gestor_nome": gestor_nome, "feedbacks": feedbacks, "total": total}])[0]
+
+
+def _action_plans_subject(digest: dict) -> str:
+    if any(plano["dias_restantes"] <= 0 for plano in digest["planos"]):
+        return f"🔴 {digest['total']} Plano(s) de Ação com Prazo Vencido ou Próximo"
+    return f"📅 Lembrete de Prazo - {digest['total']} Plano(s) de Ação"
 
 
-def send_action_plan_deadline_notification(
-    responsavel_email: str,
-    responsavel_nome: str,
-    objetivo: str,
-    prazo_final: str,
-    dias_restantes: int
-) -> bool:
+def action_plans_digest_emails(digests: List[dict]) -> List[Tuple[str, str]]:
     """
-    Send notification when an action plan deadline is approaching
+    Daily digests sent to the people responsible for action plans whose
+    deadline passed or is approaching
     
     Args:
-        responsavel_email: Responsible person's email
-        responsavel_nome: Responsible person's name
-        objetivo: Plan objective
-        prazo_final: Deadline date
-        dias_restantes: Days remaining
+        digests: Dicts with responsavel_nome, planos (up to DIGEST_MAX_ITEMS
+            dicts with objetivo, prazo_final (dd/mm/yyyy) and dias_restantes,
+            most urgent first) and total, the number of plans including
+            those not listed
     """
-    if dias_restantes <= 0:
-        subject = f"🔴 Prazo Vencido - Plano de Ação"
-        urgency_color = "#EF4444"
-        urgency_text = f"O prazo venceu há {abs(dias_restantes)} dia(s)!"
-    elif dias_restantes <= 3:
-        subject = f"🟠 Prazo Próximo - Plano de Ação ({dias_restantes} dias)"
-        urgency_color = "#F59E0B"
-        urgency_text = f"Faltam apenas {dias_restantes} dia(s)!"
-    else:
-        subject = f"📅 Lembrete de Prazo - Plano de Ação ({dias_restantes} dias)"
-        urgency_color = "#3B82F6"
-        urgency_text = f"Faltam {dias_restantes} dia(s) para o prazo."
-    
-    html_content = f"""
-    <html>
-    <body style="margin: 0; padding: 20px; background-color: #020617; font-family: Arial, sans-serif;">
-        <div style="max-width: 600px; margin: 0 auto; background-color: #0F172A; border-radius: 8px; overflow: hidden;">
-            {get_email_header()}
-            
-            <div style="padding: 30px; color: #E2E8F0;">
-                <h2 style="color: {urgency_color}; margin-top: 0;">Olá, {responsavel_nome}!</h2>
-                
-                <p>{urgency_text}</p>
-                
-                <div style="background-color: #1E293B; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid {urgency_color};">
-                    <p style="margin: 5px 0;"><strong style="color: #F59E0B;">Objetivo:</strong></p>
-                    <p style="margin: 5px 0; color: #94A3B8;">{objetivo}</p>
-                    <p style="margin: 15px 0 5px 0;"><strong style="color: #F59E0B;">Prazo Final:</strong> {prazo_final}</p>
-                </div>
-                
-                <p>Acesse o sistema para verificar o progresso e atualizar os itens do plano.</p>
-                
-                <div style="text-align: center; margin-top: 30px;">
-                    <a href="#" style="background-color: #F59E0B; color: #000; padding: 12px 30px; text-decoration: none; border-radius: 6px; font-weight: bold; display: inline-block;">
-                        Ver Plano de Ação
-                    </a>
-                </div>
-            </div>
-            
-            {get_email_footer()}
-        </div>
-    </body>
-    </html>
-    """
-    
-    return send_email(responsavel_email, subject, html_content)
+    bodies = render_many("action_plans_digest.html", digests)
+    return [(_action_plans_subject(digest), body) for digest, body in zip(digests, bodies)]
 
 
-async def send_email_async(to_email: str, subject: str, html_content: str) -> bool:
-    """
-    Async wrapper for sending email to not block API requests
-    """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, send_email, to_email, subject, html_content)
+def action_plans_digest_email(responsavel_nome: str, planos: List[dict], total: int) -> Tuple[str, str]:
+    """Single-recipient form of `action_plans_digest_emails`"""
+    return action_plans_digest_emails([{"responsavel_nome": responsavel_nome, "planos": planos, "total": total}])[0]
+
+
+def configuration_test_email(enviado_por: str) -> Tuple[str, str]:
+    """Email verifying the SendGrid configuration"""
+    subject = "🧪 Teste de E-mail - Bee It Feedback"
+    html_content = render(
+        "configuration_test.html",
+        enviado_em=datetime.now(timezone.utc).strftime("%d/%m/%Y %H:%M:%S"),
+        enviado_por=enviado_por
+    )
+    return subject, html_content
@@ -0,0 +1,74 @@
+"""
+Email templates for Bee It Feedback
+
+Message bodies are Jinja2 templates under templates/email, all extending
+base.html. One environment per process compiles every template when this
+module is imported and keeps it in memory (no reloading, no eviction), and
+the header and footer, which never change, are rendered once and shared by
+every message as ready-made markup. Values are HTML-escaped.
+
+`render_many` renders one template for a list of contexts; it is a
+convenience for the digest builders and costs the same as calling `render`
+per message, the saving being the precompiled environment.
+`render_with_tags` renders a body once with SendGrid substitution tags in
+place of the per-recipient values, so the outbox can send it to many
+recipients in one request.
+"""
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+from markupsafe import Markup
+
+TEMPLATES_DIR = Path(__file__).parent / 'templates' / 'email'
+
+# Rendered once into the `header` and `footer` globals instead of per message
+FRAGMENTS = ("header", "footer")
+
+
+def create_environment() -> Environment:
+    """Environment with every template compiled and the fixed fragments rendered"""
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        undefined=StrictUndefined,
+        # Templates ship with the code: never check the files again
+        auto_reload=False,
+        cache_size=-1,
+    )
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
+    for fragment in FRAGMENTS:
+        env.globals[fragment] = Markup(env.get_template(f"{fragment}.html").render())
+    return env
+
+
+environment = create_environment()
+
+
+def render(name: str, **context) -> str:
+    """Render one email body, e.g. render("new_feedback.html", colaborador_nome=...)"""
+    return environment.get_template(name).render(context)
+
+
+def render_many(name: str, contexts: Iterable[dict]) -> List[str]:
+    """Render the same template once per context"""
+    template = environment.get_template(name)
+    return [template.render(context) for context in contexts]
+
+
+def substitution_tag(field: str) -> str:
+    """Placeholder SendGrid replaces with a recipient's value of `field`"""
+    return f"-{field}-"
+
+
+def render_with_tags(name: str, fields: Iterable[str], **context) -> Tuple[str, dict]:
+    """
+    Render a body shared by many recipients, with a substitution tag in
+    place of each per-recipient field
+
+    Returns:
+        tuple: The HTML and a mapping of field to tag
+    """
+    tags = {field: substitution_tag(field) for field in fields}
+    return render(name, **context, **tags), tags
@@ -0,0 +1,239 @@
+"""
+Bulk exports of feedbacks and action plans for Bee It Feedback
+
+CSV and NDJSON exports are streamed row by row from an aggregation cursor
+that joins the collaborator and manager names, so memory use does not
+depend on the size of the export. XLSX files cannot be streamed; they are
+written to EXPORT_DIR by a background job and downloaded afterwards.
+
+Cells are written as text: free-text values starting with a character a
+spreadsheet would read as a formula get a leading apostrophe. Export jobs
+and their files are removed EXPORT_RETENTION_HOURS after creation by
+`purge_expired_exports`, which runs periodically; a TTL index on the jobs
+backs it up, and files whose job is gone are removed by the same sweep.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, List
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = Path(os.environ.get('EXPORT_DIR', Path(__file__).parent / 'exports'))
+EXPORT_FORMATS = ["csv", "ndjson", "xlsx"]
+EXPORT_BATCH_SIZE = 1000
+EXPORT_RETENTION_HOURS = int(os.environ.get('EXPORT_RETENTION_HOURS', '24'))
+
+# Leading characters that make spreadsheet tools evaluate a cell
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+FEEDBACK_COLUMNS = [
+    "id", "data_feedback", "tipo_feedback", "status_feedback",
+    "colaborador_id", "colaborador_nome", "gestor_id", "gestor_nome",
+    "contexto", "impacto", "expectativa", "pontos_fortes", "pontos_melhoria",
+    "data_proximo_feedback", "ciencia_colaborador", "data_ciencia", "confidencial", "criado_em",
+]
+
+PLAN_COLUMNS = [
+    "id", "feedback_id", "objetivo", "responsavel", "status", "prazo_final",
+    "progresso_percentual", "itens_total", "itens_concluidos",
+    "colaborador_id", "colaborador_nome", "gestor_id", "gestor_nome", "criado_em",
+]
+
+
+def _user_name_lookup(local_field: str, as_field: str) -> List[dict]:
+    return [
+        {"$lookup": {
+            "from": "usuarios",
+            "localField": local_field,
+            "foreignField": "id",
+            "as": as_field
+        }},
+        {"$set": {as_field: {"$first": f"${as_field}.nome"}}},
+    ]
+
+
+def feedback_export_pipeline(query: dict) -> List[dict]:
+    """Aggregation producing one flat export row per feedback, newest first"""
+    return [
+        {"$match": query},
+        {"$sort": {"data_feedback": -1, "id": -1}},
+        *_user_name_lookup("colaborador_id", "colaborador_nome"),
+        *_user_name_lookup("gestor_id", "gestor_nome"),
+        {"$project": {"_id": 0, **{column: 1 for column in FEEDBACK_COLUMNS}}},
+    ]
+
+
+def plan_export_pipeline(query: dict) -> List[dict]:
+    """Aggregation producing one flat export row per action plan with item completion"""
+    return [
+        {"$match": query},
+        {"$sort": {"prazo_final": 1, "id": 1}},
+        {"$lookup": {
+            "from": "itens_plano",
+            "let": {"plano_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$plano_de_acao_id", "$$plano_id"]}}},
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "concluidos": {"$sum": {"$cond": ["$concluido", 1, 0]}}
+                }}
+            ],
+            "as": "itens"
+        }},
+        {"$set": {
+            "itens_total": {"$ifNull": [{"$first": "$itens.total"}, 0]},
+            "itens_concluidos": {"$ifNull": [{"$first": "$itens.concluidos"}, 0]},
+        }},
+        *_user_name_lookup("colaborador_id", "colaborador_nome"),
+        *_user_name_lookup("gestor_id", "gestor_nome"),
+        {"$project": {"_id": 0, **{column: 1 for column in PLAN_COLUMNS}}},
+    ]
+
+
+def _cell(value):
+    if isinstance(value, list):
+        value = "; ".join(str(v) for v in value)
+    if value is None:
+        return ""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Keep user text from running as a formula (CSV injection)
+        return "'" + value
+    return value
+
+
+async def stream_csv(cursor, columns: List[str]) -> AsyncIterator[str]:
+    """Yield CSV text for an aggregation cursor, one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so spreadsheet tools detect UTF-8 accents correctly
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+
+    rows = 0
+    async for doc in cursor:
+        writer.writerow([_cell(doc.get(column)) for column in columns])
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def stream_ndjson(cursor) -> AsyncIterator[str]:
+    """Yield one JSON document per line for an aggregation cursor"""
+    lines = []
+    async for doc in cursor:
+        lines.append(json.dumps(doc, ensure_ascii=False))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def create_export_job(db, tipo: str, user_id: str) -> dict:
+    """Register a pending XLSX export job"""
+    now = datetime.now(timezone.utc)
+    job = {
+        "id": str(uuid.uuid4()),
+        "tipo": tipo,
+        "formato": "xlsx",
+        "status": "pendente",
+        "arquivo": None,
+        "linhas": 0,
+        "erro": None,
+        "criado_por_id": user_id,
+        "criado_em": now.isoformat(),
+        "concluido_em": None,
+        "expira_em": now + timedelta(hours=EXPORT_RETENTION_HOURS),
+    }
+    await db.export_jobs.insert_one(job)
+    del job["_id"]
+    return job
+
+
+def _write_xlsx(rows: List[dict], columns: List[str], path: Path):
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records(rows, columns=columns)
+    for column in columns:
+        frame[column] = frame[column].map(_cell)
+    frame.to_excel(path, index=False, sheet_name="export")
+
+
+async def run_xlsx_export(db, job_id: str, collection: str, pipeline: List[dict], columns: List[str]):
+    """
+    Background job: run the export aggregation and write it to an XLSX file.
+    The spreadsheet is built in a worker thread so the event loop stays free.
+    """
+    await db.export_jobs.update_one({"id": job_id}, {"$set": {"status": "processando"}})
+    try:
+        rows = await db[collection].aggregate(pipeline).to_list(None)
+        EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+        path = EXPORT_DIR / f"{job_id}.xlsx"
+        await asyncio.get_running_loop().run_in_executor(None, _write_xlsx, rows, columns, path)
+        await db.export_jobs.update_one({"id": job_id}, {"$set": {
+            "status": "concluido",
+            "arquivo": str(path),
+            "linhas": len(rows),
+            "concluido_em": datetime.now(timezone.utc).isoformat(),
+        }})
+    except Exception as e:
+        logger.error(f"Error running export job {job_id}: {e}")
+        await db.export_jobs.update_one({"id": job_id}, {"$set": {
+            "status": "erro",
+            "erro": str(e),
+            "concluido_em": datetime.now(timezone.utc).isoformat(),
+        }})
+
+
+def _remove_file(path: Path) -> bool:
+    try:
+        path.unlink()
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.error(f"Error removing export file {path}: {e}")
+        return False
+
+
+async def purge_expired_exports(db) -> int:
+    """
+    Delete export jobs older than EXPORT_RETENTION_HOURS with their files,
+    then any file in EXPORT_DIR whose job no longer exists
+
+    Returns:
+        int: Number of files removed
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=EXPORT_RETENTION_HOURS)
+    expired = await db.export_jobs.find(
+        {"criado_em": {"$lt": cutoff.isoformat()}}, {"_id": 0, "id": 1, "arquivo": 1}
+    ).to_list(None)
+    removed = sum(_remove_file(Path(job["arquivo"])) for job in expired if job.get("arquivo"))
+    if expired:
+        await db.export_jobs.delete_many({"id": {"$in": [job["id"] for job in expired]}})
+
+    if EXPORT_DIR.exists():
+        # Files left behind by jobs the TTL index removed, or by crashes
+        files = {path.stem: path for path in EXPORT_DIR.glob("*.xlsx")}
+        known = {
+            job["id"] for job in await db.export_jobs.find(
+                {"id": {"$in": list(files)}}, {"_id": 0, "id": 1}
+            ).to_list(None)
+        }
+        for job_id, path in files.items():
+            if job_id not in known and path.stat().st_mtime < cutoff.timestamp():
+                removed += _remove_file(path)
+    if removed:
+        logger.info(f"Removed {removed} expired export files")
+    return removed
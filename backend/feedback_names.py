@@ -0,0 +1,149 @@
+"""
+Collaborator and manager names stored on feedback documents
+
+Feedbacks carry `colaborador_nome` and `gestor_nome` from the moment they
+are created, so listing and reading them needs no join with `usuarios`.
+When a user is renamed the new name is fanned out in the background; the
+backfill copies names onto documents written before they were stored.
+
+Run the backfill from the backend directory with:
+
+    python feedback_names.py          # feedbacks missing a stored name
+    python feedback_names.py --all    # rewrite every stored name
+"""
+import logging
+
+from pymongo import UpdateMany, UpdateOne
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Name field -> id field it is resolved from
+NAME_FIELDS = {"colaborador_nome": "colaborador_id", "gestor_nome": "gestor_id"}
+FANOUT_BATCH_SIZE = 1000
+
+
+async def propagate_user_name(db, user_id: str) -> int:
+    """
+    Copy the current name of a user onto every feedback that references it,
+    one update_many per batch of FANOUT_BATCH_SIZE feedbacks. Only documents
+    holding a different name are touched, so the fan-out can be re-run and
+    a later rename simply continues where an earlier one stopped.
+
+    Returns:
+        int: Number of feedbacks updated
+    """
+    updated = 0
+    with metrics.timed("feedback_names.propagate"):
+        while True:
+            user = await db.usuarios.find_one({"id": user_id}, {"_id": 0, "nome": 1})
+            if not user:
+                break
+            nome = user.get("nome")
+            for name_field, id_field in NAME_FIELDS.items():
+                while True:
+                    stale = await db.feedbacks.find(
+                        {id_field: user_id, name_field: {"$ne": nome}}, {"_id": 0, "id": 1}
+                    ).limit(FANOUT_BATCH_SIZE).to_list(FANOUT_BATCH_SIZE)
+                    if not stale:
+                        break
+                    result = await db.feedbacks.update_many(
+                        {"id": {"$in": [f["id"] for f in stale]}, id_field: user_id},
+                        {"$set": {name_field: nome}}
+                    )
+                    updated += result.modified_count
+            # Renamed again while this ran: propagate the newer name too
+            current = await db.usuarios.find_one({"id": user_id}, {"_id": 0, "nome": 1})
+            if not current or current.get("nome") == nome:
+                break
+    metrics.inc("feedback_names.propagated", updated)
+    return updated
+
+
+async def propagate_user_name_task(db, user_id: str):
+    """Background task wrapper: a failed fan-out is logged and left to the backfill"""
+    try:
+        await propagate_user_name(db, user_id)
+    except Exception as e:
+        logger.error(f"Error propagating name of user {user_id}: {e}")
+
+
+async def backfill_feedback_names(db, only_missing: bool = True) -> int:
+    """
+    Store collaborator and manager names on existing feedbacks
+
+    Args:
+        db: Motor database
+        only_missing: Only fill documents without stored names; with False
+            every stored name is rewritten from `usuarios`
+
+    Returns:
+        int: Number of feedbacks updated
+    """
+    if only_missing:
+        cursor = db.feedbacks.aggregate([
+            {"$match": {"$or": [{field: {"$exists": False}} for field in NAME_FIELDS]}},
+            *[
+                stage
+                for name_field, id_field in NAME_FIELDS.items()
+                for stage in (
+                    {"$lookup": {
+                        "from": "usuarios",
+                        "localField": id_field,
+                        "foreignField": "id",
+                        "as": name_field
+                    }},
+                    {"$set": {name_field: {"$first": f"${name_field}.nome"}}},
+                )
+            ],
+            {"$project": {"_id": 0, "id": 1, **{field: 1 for field in NAME_FIELDS}}},
+        ])
+        operations = []
+        updated = 0
+        async for feedback in cursor:
+            operations.append(UpdateOne(
+                {"id": feedback["id"]},
+                {"$set": {field: feedback.get(field) for field in NAME_FIELDS}}
+            ))
+            if len(operations) >= FANOUT_BATCH_SIZE:
+                updated += (await db.feedbacks.bulk_write(operations, ordered=False)).modified_count
+                operations = []
+        if operations:
+            updated += (await db.feedbacks.bulk_write(operations, ordered=False)).modified_count
+        return updated
+
+    # Full rewrite: one UpdateMany per user and role, sent in batches
+    operations = []
+    updated = 0
+    async for user in db.usuarios.find({}, {"_id": 0, "id": 1, "nome": 1}):
+        for name_field, id_field in NAME_FIELDS.items():
+            operations.append(UpdateMany(
+                {id_field: user["id"], name_field: {"$ne": user.get("nome")}},
+                {"$set": {name_field: user.get("nome")}}
+            ))
+        if len(operations) >= FANOUT_BATCH_SIZE:
+            updated += (await db.feedbacks.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        updated += (await db.feedbacks.bulk_write(operations, ordered=False)).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import os
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Store user names on feedback documents")
+    parser.add_argument("--all", action="store_true", help="rewrite every stored name, not only missing ones")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    count = asyncio.run(backfill_feedback_names(client[os.environ['DB_NAME']], only_missing=not args.all))
+    print(f"{count} feedbacks updated")
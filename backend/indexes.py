@@ -0,0 +1,188 @@
+"""
+MongoDB index registry for Bee It Feedback collections
+"""
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+# Every query in server.py filters by the string `id` field, so each collection
+# gets a unique index on it. The remaining entries follow the filters and sorts
+# used by the endpoints.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "usuarios": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("gestor_direto_id", ASCENDING)], name="gestor_direto_id"),
+        IndexModel([("time_id", ASCENDING)], name="time_id"),
+        IndexModel([("papel", ASCENDING)], name="papel"),
+    ],
+    "times": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "feedbacks": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("colaborador_id", ASCENDING), ("data_feedback", DESCENDING), ("id", DESCENDING)],
+            name="colaborador_id_data_feedback_id",
+        ),
+        IndexModel(
+            [("gestor_id", ASCENDING), ("data_feedback", DESCENDING), ("id", DESCENDING)],
+            name="gestor_id_data_feedback_id",
+        ),
+        IndexModel([("data_feedback", DESCENDING), ("id", DESCENDING)], name="data_feedback_id"),
+        IndexModel(
+            [("planos_count", ASCENDING), ("data_feedback", DESCENDING), ("id", DESCENDING)],
+            name="planos_count_data_feedback_id",
+        ),
+        IndexModel([("status_feedback", ASCENDING)], name="status_feedback"),
+        IndexModel([("data_proximo_feedback", ASCENDING)], name="data_proximo_feedback"),
+    ],
+    "planos_acao": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("feedback_id", ASCENDING)], name="feedback_id"),
+        IndexModel([("status", ASCENDING), ("prazo_final", ASCENDING)], name="status_prazo_final"),
+        IndexModel([("prazo_final", ASCENDING), ("id", ASCENDING)], name="prazo_final_id"),
+        # Role-scoped listings: collaborators see their plans, managers their reports'
+        IndexModel(
+            [("colaborador_id", ASCENDING), ("prazo_final", ASCENDING), ("id", ASCENDING)],
+            name="colaborador_id_prazo_final_id",
+        ),
+        IndexModel(
+            [("gestor_id", ASCENDING), ("prazo_final", ASCENDING), ("id", ASCENDING)],
+            name="gestor_id_prazo_final_id",
+        ),
+    ],
+    "itens_plano": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("plano_de_acao_id", ASCENDING)], name="plano_de_acao_id"),
+    ],
+    "checkins": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("plano_de_acao_id", ASCENDING), ("data_checkin", DESCENDING), ("id", DESCENDING)],
+            name="plano_de_acao_id_data_checkin_id",
+        ),
+    ],
+    "org_closure": [
+        IndexModel(
+            [("gestor_id", ASCENDING), ("colaborador_id", ASCENDING)],
+            name="gestor_id_colaborador_id_unique", unique=True,
+        ),
+    ],
+    "notificacoes": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("usuario_id", ASCENDING), ("criado_em", DESCENDING), ("id", DESCENDING)],
+            name="usuario_id_criado_em_id",
+        ),
+        # Notifications about a feedback or plan, removed with it
+        IndexModel([("entidade_id", ASCENDING)], name="entidade_id", sparse=True),
+    ],
+    "email_outbox": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("proxima_tentativa_em", ASCENDING)], name="status_proxima_tentativa_em"),
+        IndexModel([("status", ASCENDING), ("bloqueado_ate", ASCENDING)], name="status_bloqueado_ate"),
+        # Pending messages about a removed item or to a removed user, see cascade.py
+        IndexModel([("entidade_id", ASCENDING)], name="entidade_id", sparse=True),
+        IndexModel([("para", ASCENDING), ("status", ASCENDING)], name="para_status"),
+        # Sent messages are removed once their retention ends
+        IndexModel([("expira_em", ASCENDING)], name="expira_em_ttl", expireAfterSeconds=0),
+    ],
+    "export_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("criado_em", ASCENDING)], name="criado_em"),
+        # Backstop for purge_expired_exports, which also removes the files
+        IndexModel([("expira_em", ASCENDING)], name="expira_em_ttl", expireAfterSeconds=0),
+    ],
+    "notification_ledger": [
+        # One alert per recipient, item, kind and day
+        IndexModel(
+            [("destinatario_id", ASCENDING), ("tipo", ASCENDING), ("dia", ASCENDING), ("entidade_id", ASCENDING)],
+            name="destinatario_id_tipo_dia_entidade_id_unique", unique=True,
+        ),
+        IndexModel([("entidade_id", ASCENDING)], name="entidade_id"),
+        IndexModel([("expira_em", ASCENDING)], name="expira_em_ttl", expireAfterSeconds=0),
+    ],
+}
+
+
+def _key_of(spec) -> tuple:
+    """Normalize an index key document to a comparable tuple"""
+    return tuple((field, int(direction)) for field, direction in spec.items())
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """
+    Create every index in the registry. Safe to run on every startup:
+    MongoDB treats an identical index definition as a no-op. Indexes are
+    created one at a time, so a failing definition skips only itself.
+
+    Returns:
+        dict: Index names created (or confirmed) per collection
+    """
+    applied = {}
+    for collection, models in INDEXES.items():
+        applied[collection] = []
+        for model in models:
+            try:
+                applied[collection] += await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                # A conflicting definition or duplicate data on a unique key must
+                # not keep the API from starting; the audit endpoint reports it.
+                logger.error(f"Could not create index {model.document['name']} on {collection}: {e}")
+    return applied
+
+
+async def audit_indexes(db) -> Dict[str, dict]:
+    """
+    Compare the registry with the indexes that actually exist and report
+    missing, unused and duplicate indexes per collection.
+
+    Usage counts come from `$indexStats` and are reset when mongod restarts.
+    """
+    report = {}
+    for collection, models in INDEXES.items():
+        existing = await db[collection].list_indexes().to_list(None)
+        stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+        ops_by_name = {s["name"]: s["accesses"]["ops"] for s in stats}
+
+        existing_keys = {}
+        for index in existing:
+            existing_keys.setdefault(_key_of(index["key"]), []).append(index["name"])
+
+        expected_keys = {_key_of(m.document["key"]): m.document["name"] for m in models}
+        missing = [name for key, name in expected_keys.items() if key not in existing_keys]
+
+        unused = [
+            index["name"] for index in existing
+            if index["name"] != "_id_" and ops_by_name.get(index["name"], 0) == 0
+        ]
+
+        duplicates = [names for names in existing_keys.values() if len(names) > 1]
+        # An index whose key is a prefix of another index is redundant for reads
+        for key, names in existing_keys.items():
+            for other_key, other_names in existing_keys.items():
+                if key != other_key and len(key) < len(other_key) and other_key[:len(key)] == key:
+                    duplicates.append(names + other_names)
+
+        unknown = [
+            index["name"] for index in existing
+            if index["name"] != "_id_" and _key_of(index["key"]) not in expected_keys
+        ]
+
+        report[collection] = {
+            "indexes": [
+                {"name": index["name"], "key": dict(index["key"]), "ops": ops_by_name.get(index["name"], 0)}
+                for index in existing
+            ],
+            "missing": missing,
+            "unused": unused,
+            "duplicates": duplicates,
+            "not_in_registry": unknown,
+        }
+    return report
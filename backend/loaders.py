@@ -0,0 +1,99 @@
+"""
+Request-scoped batch loaders for Bee It Feedback
+
+Each request gets one `Loaders` instance (see `get_loaders` in server.py).
+Lookups by id made during the same event-loop tick are coalesced into a
+single `{"id": {"$in": [...]}}` query, and repeated ids are answered from the
+per-request cache, so resolving names for a page of documents costs one
+query however many documents reference the same user.
+
+Loaded documents are shared between callers of the same request and must be
+treated as read-only.
+"""
+import asyncio
+from typing import Awaitable, Dict, List, Optional
+
+import metrics
+
+MAX_BATCH_SIZE = 1000
+
+
+class Loader:
+    """Batch and cache lookups by `id` on one collection"""
+
+    def __init__(self, collection, projection: Optional[dict] = None):
+        self.collection = collection
+        self.projection = {"_id": 0, **(projection or {})}
+        self._cache: Dict[str, asyncio.Future] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._scheduled = False
+
+    def load(self, key: str) -> Awaitable[Optional[dict]]:
+        """Document with `id == key`, or None when it does not exist"""
+        future = self._cache.get(key)
+        if future is not None:
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._cache[key] = future
+        self._pending[key] = future
+        if not self._scheduled:
+            # Runs after every callback already queued for this tick, so
+            # lookups issued by concurrently gathered coroutines join the batch
+            self._scheduled = True
+            loop.call_soon(self._dispatch)
+        return future
+
+    async def load_many(self, keys) -> List[Optional[dict]]:
+        """Documents for `keys`, in order, with None for missing ids"""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: str, doc: dict):
+        """Seed the cache with a document the caller already holds"""
+        if key not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(doc)
+            self._cache[key] = future
+
+    def clear(self, key: str):
+        """Forget a cached document, e.g. after the request modified it"""
+        self._cache.pop(key, None)
+
+    def _dispatch(self):
+        self._scheduled = False
+        keys = list(self._pending)
+        batch, self._pending = self._pending, {}
+        for start in range(0, len(keys), MAX_BATCH_SIZE):
+            chunk = {key: batch[key] for key in keys[start:start + MAX_BATCH_SIZE]}
+            asyncio.ensure_future(self._fetch(chunk))
+
+    async def _fetch(self, batch: Dict[str, asyncio.Future]):
+        name = self.collection.name
+        metrics.inc(f"loader.{name}.batches")
+        metrics.inc(f"loader.{name}.keys", len(batch))
+        try:
+            docs = await self.collection.find(
+                {"id": {"$in": list(batch)}}, self.projection
+            ).to_list(len(batch))
+        except Exception as e:
+            for key, future in batch.items():
+                self._cache.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        found = {doc["id"]: doc for doc in docs}
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(key))
+
+
+class Loaders:
+    """The loaders available to one request"""
+
+    def __init__(self, db):
+        self.usuarios = Loader(db.usuarios, {"password": 0})
+        self.times = Loader(db.times)
+        self.feedbacks = Loader(db.feedbacks)
+        self.planos_acao = Loader(db.planos_acao)
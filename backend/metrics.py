@@ -0,0 +1,57 @@
+"""
+In-process metrics registry for Bee It Feedback
+
+Values are per worker process and reset on restart. They are exposed as
+JSON by the admin metrics endpoint.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_timers: Dict[str, dict] = {}
+
+
+def inc(name: str, amount: float = 1):
+    """Add `amount` to a monotonically increasing counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_gauge(name: str, value: float):
+    """Record the current value of a gauge"""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float):
+    """Record one duration sample for a timer"""
+    with _lock:
+        timer = _timers.setdefault(name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        timer["count"] += 1
+        timer["total_seconds"] += seconds
+        timer["max_seconds"] = max(timer["max_seconds"], seconds)
+        timer["last_seconds"] = seconds
+
+
+@contextmanager
+def timed(name: str):
+    """Time the enclosed block and record it with `observe`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot() -> dict:
+    """Return a copy of every metric"""
+    with _lock:
+        timers = {
+            name: {**timer, "avg_seconds": timer["total_seconds"] / timer["count"]}
+            for name, timer in _timers.items()
+        }
+        return {"counters": dict(_counters), "gauges": dict(_gauges), "timers": timers}
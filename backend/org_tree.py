@@ -0,0 +1,132 @@
+"""
+Reporting tree of Bee It Feedback users
+
+A manager's scope is everyone below them in the `gestor_direto_id` chain,
+not only their direct reports. The transitive reports of a manager are
+computed with one `$graphLookup` and stored as rows of the `org_closure`
+table (gestor_id, colaborador_id, profundidade), next to an `org_closure_state`
+document recording the org version they were computed at.
+
+Any change to `gestor_direto_id` or `time_id` bumps the `org` counter in
+`cache_versions`, which makes every stored closure stale; it is recomputed
+the next time it is needed. Each worker also memoizes recent closures and
+re-reads the version at most every ORG_TREE_VERSION_CHECK_SECONDS.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from pymongo import DeleteMany, ReplaceOne
+
+import metrics
+from principal_cache import VERSIONS_COLLECTION
+
+ORG_TREE_VERSION_CHECK_SECONDS = float(os.environ.get('ORG_TREE_VERSION_CHECK_SECONDS', '5'))
+ORG_TREE_MEMO_SIZE = int(os.environ.get('ORG_TREE_MEMO_SIZE', '1000'))
+
+ORG_VERSION_ID = "org"
+CLOSURE_COLLECTION = "org_closure"
+STATE_COLLECTION = "org_closure_state"
+
+
+def reports_pipeline(gestor_id: str) -> List[dict]:
+    """Aggregation on usuarios yielding every direct and indirect report of a manager"""
+    return [
+        {"$match": {"id": gestor_id}},
+        {"$graphLookup": {
+            "from": "usuarios",
+            "startWith": "$id",
+            "connectFromField": "id",
+            "connectToField": "gestor_direto_id",
+            "as": "reports",
+            "depthField": "profundidade"
+        }},
+        {"$unwind": "$reports"},
+        # A reporting cycle would lead back to the manager
+        {"$match": {"reports.id": {"$ne": gestor_id}}},
+        {"$project": {
+            "_id": 0,
+            "colaborador_id": "$reports.id",
+            "profundidade": {"$add": ["$reports.profundidade", 1]}
+        }},
+    ]
+
+
+class OrgTree:
+    """Transitive reports per manager, backed by the closure table"""
+
+    def __init__(self, db, version_check_seconds: float = ORG_TREE_VERSION_CHECK_SECONDS, memo_size: int = ORG_TREE_MEMO_SIZE):
+        self.db = db
+        self.version_check_seconds = version_check_seconds
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, tuple]" = OrderedDict()
+        self._version: Optional[int] = None
+        self._version_checked_at = 0.0
+
+    async def invalidate(self):
+        """Mark every closure stale after a change to reporting lines or teams"""
+        await self.db[VERSIONS_COLLECTION].update_one(
+            {"_id": ORG_VERSION_ID}, {"$inc": {"versao": 1}}, upsert=True
+        )
+        self._memo.clear()
+        self._version_checked_at = 0.0
+
+    async def reports_of(self, gestor_id: str) -> List[str]:
+        """Ids of every user reporting to `gestor_id`, directly or not"""
+        version = await self._current_version()
+
+        memo = self._memo.get(gestor_id)
+        if memo and memo[0] == version:
+            self._memo.move_to_end(gestor_id)
+            metrics.inc("org_tree.memo_hits")
+            return list(memo[1])
+
+        state = await self.db[STATE_COLLECTION].find_one({"_id": gestor_id})
+        if state and state.get("versao") == version:
+            rows = await self.db[CLOSURE_COLLECTION].find(
+                {"gestor_id": gestor_id}, {"_id": 0, "colaborador_id": 1}
+            ).to_list(None)
+            report_ids = [row["colaborador_id"] for row in rows]
+            metrics.inc("org_tree.closure_hits")
+        else:
+            report_ids = await self._compute(gestor_id, version)
+
+        self._memo[gestor_id] = (version, report_ids)
+        self._memo.move_to_end(gestor_id)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return list(report_ids)
+
+    async def _compute(self, gestor_id: str, version: int) -> List[str]:
+        with metrics.timed("org_tree.compute"):
+            rows = await self.db.usuarios.aggregate(reports_pipeline(gestor_id)).to_list(None)
+            report_ids = [row["colaborador_id"] for row in rows]
+
+            # Upserts plus a delete of the leftovers keep concurrent
+            # recomputations from different workers idempotent
+            operations = [
+                ReplaceOne(
+                    {"gestor_id": gestor_id, "colaborador_id": row["colaborador_id"]},
+                    {"gestor_id": gestor_id, **row},
+                    upsert=True
+                )
+                for row in rows
+            ]
+            operations.append(DeleteMany({"gestor_id": gestor_id, "colaborador_id": {"$nin": report_ids}}))
+            await self.db[CLOSURE_COLLECTION].bulk_write(operations, ordered=False)
+            # The version read before computing: a change made meanwhile
+            # leaves the state stale and forces another computation
+            await self.db[STATE_COLLECTION].replace_one(
+                {"_id": gestor_id}, {"_id": gestor_id, "versao": version}, upsert=True
+            )
+        metrics.inc("org_tree.computations")
+        return report_ids
+
+    async def _current_version(self) -> int:
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.version_check_seconds:
+            doc = await self.db[VERSIONS_COLLECTION].find_one({"_id": ORG_VERSION_ID})
+            self._version = doc["versao"] if doc else 0
+            self._version_checked_at = now
+        return self._version
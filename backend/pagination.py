@@ -0,0 +1,237 @@
+"""
+Keyset (cursor) pagination for Bee It Feedback list endpoints
+
+A page is read with a range scan that starts right after the last document
+of the previous page, so the cost of a page does not grow with its depth.
+The position is handed to the client as an opaque cursor built from the
+sort key values of that last document; the sort must end in a unique field
+so the order is stable.
+
+Every list endpoint shares the same contract:
+- `limit` and `cursor` query parameters select the page
+- the body is a plain JSON list and the next page cursor is returned in the
+  `X-Next-Cursor` header (absent on the last page)
+- `include_total=true` adds the `X-Total-Count` header (an estimate when the
+  listing is unfiltered)
+- `format=ndjson` streams every remaining document, one JSON object per line,
+  straight from the database cursor instead of returning one page
+"""
+import base64
+import json
+from typing import Awaitable, Callable, List, Optional, Tuple, Type
+
+from bson import ObjectId
+from fastapi import HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+# Sort key values a cursor may carry
+CURSOR_VALUE_TYPES = (str, int, float, bool)
+
+
+def encode_cursor(values: list) -> str:
+    """Pack sort key values into an opaque URL-safe cursor"""
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Unpack a cursor, rejecting anything that was not produced by `encode_cursor`"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    # Values land in the query as-is: a dict would smuggle in query operators
+    if not all(value is None or isinstance(value, CURSOR_VALUE_TYPES) for value in values):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return values
+
+
+def _cursor_value(field: str, value):
+    return str(value) if field == "_id" else value
+
+
+def _sort_value(field: str, value):
+    if field == "_id":
+        try:
+            return ObjectId(value)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    return value
+
+
+def _projection_for(sort: List[Tuple[str, int]], projection: Optional[dict]) -> Optional[dict]:
+    """Keep `_id` in the result when it is part of the sort key"""
+    if projection and any(field == "_id" for field, _ in sort):
+        projection = {k: v for k, v in projection.items() if k != "_id"}
+        return projection or None
+    return projection
+
+
+def _after_cursor(query: dict, sort: List[Tuple[str, int]], cursor: Optional[str]) -> dict:
+    if not cursor:
+        return query
+    values = [_sort_value(field, value) for (field, _), value in zip(sort, decode_cursor(cursor, len(sort)))]
+    after = keyset_filter(sort, values)
+    return {"$and": [query, after]} if query else after
+
+
+def keyset_filter(sort: List[Tuple[str, int]], values: list) -> dict:
+    """
+    Filter matching the documents that come after `values` in `sort` order
+
+    For a sort on (a desc, id desc) this yields
+    {"$or": [{"a": {"$lt": va}}, {"a": va, "id": {"$lt": vid}}]}
+    """
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        branch = {sort[j][0]: values[j] for j in range(i)}
+        branch[field] = {"$gt" if direction > 0 else "$lt": values[i]}
+        branches.append(branch)
+    return {"$or": branches}
+
+
+async def fetch_page(
+    collection,
+    query: dict,
+    sort: List[Tuple[str, int]],
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[dict] = None
+) -> Tuple[list, Optional[str]]:
+    """
+    Read one page of `collection`
+
+    Args:
+        collection: Motor collection
+        query: Filter for the whole listing
+        sort: Sort key as (field, direction) pairs, ending in a unique field
+        limit: Page size
+        cursor: Cursor returned with the previous page, if any
+        projection: Projection applied to the documents
+
+    Returns:
+        tuple: The page documents and the cursor of the next page (None on the last page)
+    """
+    query = _after_cursor(query, sort, cursor)
+    projection = _projection_for(sort, projection)
+
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor([_cursor_value(field, docs[-1].get(field)) for field, _ in sort])
+    for doc in docs:
+        doc.pop("_id", None)
+    return docs, next_cursor
+
+
+def set_page_headers(response: Response, next_cursor: Optional[str]):
+    """Expose the next page cursor alongside a list response body"""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+class PageParams:
+    """Query parameters shared by every paginated list endpoint"""
+
+    def __init__(self, limit: int, cursor: Optional[str], include_total: bool, format: str):
+        self.limit = limit
+        self.cursor = cursor
+        self.include_total = include_total
+        self.format = format
+
+
+def page_params(default_limit: int = DEFAULT_PAGE_SIZE):
+    """Build the FastAPI dependency reading `PageParams` for an endpoint"""
+    def dependency(
+        limit: int = Query(default_limit, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        include_total: bool = False,
+        format: str = Query("json", pattern="^(json|ndjson)$")
+    ) -> PageParams:
+        return PageParams(limit, cursor, include_total, format)
+    return dependency
+
+
+async def count_matching(collection, query: dict) -> int:
+    """Exact count for filtered listings, metadata estimate for whole collections"""
+    if not query:
+        return await collection.estimated_document_count()
+    return await collection.count_documents(query)
+
+
+async def paginate(
+    collection,
+    query: dict,
+    sort: List[Tuple[str, int]],
+    params: PageParams,
+    response: Response,
+    model: Type[BaseModel],
+    projection: Optional[dict] = None,
+    enrich: Optional[Callable[[list], Awaitable[None]]] = None
+):
+    """
+    Serve a list endpoint according to the shared pagination contract
+
+    Args:
+        collection: Motor collection
+        query: Filter for the whole listing
+        sort: Sort key as (field, direction) pairs, ending in a unique field
+        params: Page parameters of the request
+        response: Response whose headers receive the page metadata
+        model: Response model of a single item
+        projection: Projection applied to the documents
+        enrich: Coroutine completing a batch of documents in place (e.g. joining names)
+
+    Returns:
+        A list of `model` items, or a StreamingResponse in NDJSON mode
+    """
+    total = await count_matching(collection, query) if params.include_total else None
+
+    if params.format == "ndjson":
+        headers = {TOTAL_COUNT_HEADER: str(total)} if total is not None else None
+        return StreamingResponse(
+            _stream(collection, query, sort, params.cursor, model, projection, enrich),
+            media_type="application/x-ndjson",
+            headers=headers
+        )
+
+    docs, next_cursor = await fetch_page(collection, query, sort, params.limit, params.cursor, projection)
+    if enrich and docs:
+        await enrich(docs)
+    set_page_headers(response, next_cursor)
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+    return [model(**doc) for doc in docs]
+
+
+async def _stream(collection, query, sort, cursor, model, projection, enrich):
+    query = _after_cursor(query, sort, cursor)
+    projection = _projection_for(sort, projection)
+    db_cursor = collection.find(query, projection).sort(sort).batch_size(STREAM_BATCH_SIZE)
+
+    batch = []
+    async for doc in db_cursor:
+        doc.pop("_id", None)
+        batch.append(doc)
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield await _render_batch(batch, model, enrich)
+            batch = []
+    if batch:
+        yield await _render_batch(batch, model, enrich)
+
+
+async def _render_batch(batch: list, model, enrich) -> str:
+    if enrich:
+        await enrich(batch)
+    return "".join(model(**doc).model_dump_json() + "\n" for doc in batch)
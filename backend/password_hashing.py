@@ -0,0 +1,70 @@
+"""
+Bounded worker pool for bcrypt password hashing
+
+bcrypt takes ~250 ms per call by design. Running it on the event loop stalls
+every request of the worker, so hashing and verification are dispatched to
+a dedicated thread pool (bcrypt releases the GIL, so threads run in
+parallel). Requests beyond the pool size plus PASSWORD_QUEUE_LIMIT are
+rejected immediately instead of queueing without bound.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import metrics
+
+PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT', '32'))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_POOL_WORKERS, thread_name_prefix="bcrypt")
+_in_flight = 0
+
+
+class PasswordPoolSaturated(Exception):
+    """Raised when the pool already holds its maximum number of pending jobs"""
+
+
+async def _run(operation: str, func, *args):
+    global _in_flight
+    if _in_flight >= PASSWORD_POOL_WORKERS + PASSWORD_QUEUE_LIMIT:
+        metrics.inc("password_pool.rejected")
+        raise PasswordPoolSaturated()
+
+    _in_flight += 1
+    metrics.set_gauge("password_pool.in_flight", _in_flight)
+    submitted = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        metrics.observe("password_pool.queue_wait", started - submitted)
+        try:
+            return func(*args)
+        finally:
+            metrics.observe(f"password_pool.{operation}", time.perf_counter() - started)
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, job)
+    finally:
+        _in_flight -= 1
+        metrics.set_gauge("password_pool.in_flight", _in_flight)
+
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password on the pool. Raises PasswordPoolSaturated when full."""
+    return await _run("hash", _hash, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Check a password on the pool. Raises PasswordPoolSaturated when full."""
+    return await _run("verify", _verify, password, hashed)
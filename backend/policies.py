@@ -0,0 +1,87 @@
+"""
+Read access policy for Bee It Feedback
+
+Every read compiles the caller's scope into the Mongo filter itself, so
+documents the caller may not see are never fetched, there is no check after
+the fact and no id list is truncated:
+
+- ADMIN sees everything
+- GESTOR sees what they authored and everything about themselves or anyone
+  in their reporting tree (see org_tree.py)
+- COLABORADOR sees what is about themselves
+
+Feedbacks and action plans carry `colaborador_id` and `gestor_id`, so they
+are scoped directly. Plan items and check-ins are scoped through their plan.
+"""
+from typing import Optional
+
+ROLE_ADMIN = "ADMIN"
+ROLE_GESTOR = "GESTOR"
+ROLE_COLABORADOR = "COLABORADOR"
+
+# Collections scoped by their own colaborador_id / gestor_id fields
+OWNED_RESOURCES = ("feedbacks", "planos_acao")
+# Collection -> (parent collection, field holding the parent id)
+CHILD_RESOURCES = {
+    "itens_plano": ("planos_acao", "plano_de_acao_id"),
+    "checkins": ("planos_acao", "plano_de_acao_id"),
+}
+
+# Matches no document; used when a scope can never be satisfied
+NOTHING = {"_id": {"$exists": False}}
+
+
+def combine(*filters: Optional[dict]) -> dict:
+    """AND together the non-empty filters"""
+    filters = [f for f in filters if f]
+    if not filters:
+        return {}
+    if len(filters) == 1:
+        return filters[0]
+    return {"$and": filters}
+
+
+class Policy:
+    """Compiles (user, resource, filters) into a single Mongo filter"""
+
+    def __init__(self, org_tree):
+        self.org_tree = org_tree
+
+    async def scope(self, user: dict, resource: str) -> dict:
+        """Filter on `resource` matching exactly the documents `user` may read"""
+        if resource in CHILD_RESOURCES:
+            raise ValueError(f"{resource} is scoped through its parent; use parent_filter")
+        if resource not in OWNED_RESOURCES:
+            raise ValueError(f"No read policy for {resource}")
+
+        if user["papel"] == ROLE_ADMIN:
+            return {}
+        if user["papel"] == ROLE_GESTOR:
+            member_ids = await self.org_tree.reports_of(user["id"])
+            member_ids.append(user["id"])
+            return {"$or": [
+                {"gestor_id": user["id"]},
+                {"colaborador_id": {"$in": member_ids}},
+            ]}
+        if user["papel"] == ROLE_COLABORADOR:
+            return {"colaborador_id": user["id"]}
+        return NOTHING
+
+    async def compile(self, user: dict, resource: str, filters: Optional[dict] = None) -> dict:
+        """The request filters restricted to what `user` may read"""
+        return combine(await self.scope(user, resource), filters)
+
+    async def parent_filter(self, user: dict, resource: str, parent_id: str) -> Optional[dict]:
+        """
+        Filter on the parent collection that matches `parent_id` only if
+        `user` may read it, or None when no check is needed (ADMIN)
+        """
+        parent, _ = CHILD_RESOURCES[resource]
+        if user["papel"] == ROLE_ADMIN:
+            return None
+        return await self.compile(user, parent, {"id": parent_id})
+
+    def child_filter(self, resource: str, parent_id: str, filters: Optional[dict] = None) -> dict:
+        """Filter on a child collection for the documents of one parent"""
+        _, field = CHILD_RESOURCES[resource]
+        return combine({field: parent_id}, filters)
@@ -0,0 +1,115 @@
+"""
+In-process cache of authenticated principals for Bee It Feedback
+
+`get_current_user` runs on every authenticated request. Caching the user
+document by id for a short TTL avoids one `usuarios` round trip per request.
+
+Coherence across uvicorn workers uses a version counter in the
+`cache_versions` collection: every user change bumps it, and each worker
+compares it with the version it last saw at most every
+PRINCIPAL_CACHE_VERSION_CHECK_SECONDS, dropping all entries when it moved.
+A deactivated or deleted user therefore loses access everywhere within that
+window (and immediately on the worker that handled the change).
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import metrics
+
+PRINCIPAL_CACHE_ENABLED = os.environ.get('PRINCIPAL_CACHE_ENABLED', 'true').lower() == 'true'
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get('PRINCIPAL_CACHE_TTL_SECONDS', '60'))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.environ.get('PRINCIPAL_CACHE_MAX_ENTRIES', '10000'))
+PRINCIPAL_CACHE_VERSION_CHECK_SECONDS = float(os.environ.get('PRINCIPAL_CACHE_VERSION_CHECK_SECONDS', '5'))
+
+VERSIONS_COLLECTION = "cache_versions"
+USUARIOS_VERSION_ID = "usuarios"
+
+
+async def bump_users_version(db):
+    """Signal every worker that some user document changed"""
+    await db[VERSIONS_COLLECTION].update_one(
+        {"_id": USUARIOS_VERSION_ID}, {"$inc": {"versao": 1}}, upsert=True
+    )
+
+
+async def get_users_version(db) -> int:
+    doc = await db[VERSIONS_COLLECTION].find_one({"_id": USUARIOS_VERSION_ID})
+    return doc["versao"] if doc else 0
+
+
+class PrincipalCache:
+    """TTL + LRU cache of user documents keyed by user id"""
+
+    def __init__(
+        self,
+        db,
+        enabled: bool = PRINCIPAL_CACHE_ENABLED,
+        ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS,
+        max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES,
+        version_check_seconds: float = PRINCIPAL_CACHE_VERSION_CHECK_SECONDS
+    ):
+        self.db = db
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version_check_seconds = version_check_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._version: Optional[int] = None
+        self._version_checked_at = 0.0
+        self._hits = 0
+        self._lookups = 0
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        """Return a copy of the cached user, or None on a miss"""
+        if not self.enabled:
+            return None
+        await self._check_version()
+
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(user_id, None)
+            self._record(hit=False)
+            return None
+
+        self._entries.move_to_end(user_id)
+        self._record(hit=True)
+        return dict(entry[1])
+
+    def put(self, user_id: str, user: dict):
+        if not self.enabled:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, dict(user))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            metrics.inc("principal_cache.evictions")
+        metrics.set_gauge("principal_cache.entries", len(self._entries))
+
+    async def invalidate(self, user_id: str):
+        """Drop a user here and make every other worker drop its cache too"""
+        self._entries.pop(user_id, None)
+        await bump_users_version(self.db)
+
+    def clear(self):
+        self._entries.clear()
+        metrics.set_gauge("principal_cache.entries", 0)
+
+    async def _check_version(self):
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_seconds:
+            return
+        self._version_checked_at = now
+        version = await get_users_version(self.db)
+        if self._version is not None and version != self._version:
+            self.clear()
+            metrics.inc("principal_cache.remote_invalidations")
+        self._version = version
+
+    def _record(self, hit: bool):
+        if hit:
+            self._hits += 1
+        self._lookups += 1
+        metrics.inc("principal_cache.hits" if hit else "principal_cache.misses")
+        metrics.set_gauge("principal_cache.hit_rate", self._hits / self._lookups)
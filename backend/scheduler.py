@@ -0,0 +1,145 @@
+"""
+Periodic background jobs for Bee It Feedback
+
+Each job runs in an asyncio task inside every uvicorn worker, but only the
+worker holding the job's lease in the `job_leases` collection executes it.
+A lease lasts two intervals. While a run is in progress a heartbeat renews
+it, however long the run takes, and the run is cancelled if the lease
+cannot be kept; when the run ends the lease is renewed from that moment.
+Another worker takes over once it expires (e.g. after the holder stopped).
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List
+
+from pymongo.errors import DuplicateKeyError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LEASES_COLLECTION = "job_leases"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def acquire_lease(db, name: str, ttl_seconds: float) -> bool:
+    """
+    Take or renew the lease for a job
+
+    Returns:
+        bool: True if this worker holds the lease until now + ttl_seconds
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        await db[LEASES_COLLECTION].find_one_and_update(
+            {"_id": name, "$or": [{"owner": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The lease document exists and is held by another live worker
+        return False
+
+
+class LeaseLost(Exception):
+    """The lease of a running job could not be renewed, so the run was cancelled"""
+
+
+class PeriodicJob:
+    """A coroutine function run every `interval_seconds` under a lease"""
+
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[], Awaitable[int]]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+
+    @property
+    def lease_seconds(self) -> float:
+        return self.interval_seconds * 2
+
+    async def run_once(self, db) -> bool:
+        """Run the job if this worker holds its lease. Returns whether it ran."""
+        if not await acquire_lease(db, self.name, self.lease_seconds):
+            return False
+
+        start = time.perf_counter()
+        run = asyncio.ensure_future(self.func())
+        lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(db, run, lost))
+        try:
+            changed = await run
+        except asyncio.CancelledError:
+            if lost.is_set():
+                raise LeaseLost(f"Lease of job {self.name} expired while it ran")
+            raise
+        finally:
+            heartbeat.cancel()
+        duration = time.perf_counter() - start
+        # The next run on any worker waits a full interval from the end of this one
+        await acquire_lease(db, self.name, self.lease_seconds)
+
+        metrics.observe(f"job.{self.name}.duration", duration)
+        metrics.set_gauge(f"job.{self.name}.last_duration_seconds", duration)
+        metrics.set_gauge(f"job.{self.name}.last_run_at", time.time())
+        if changed is not None:
+            metrics.set_gauge(f"job.{self.name}.last_rows_changed", changed)
+            metrics.inc(f"job.{self.name}.rows_changed", changed)
+        return True
+
+    async def _heartbeat(self, db, run: asyncio.Future, lost: asyncio.Event):
+        """Renew the lease while `run` is in progress; cancel it once the lease may have lapsed"""
+        renewed = time.monotonic()
+        while True:
+            await asyncio.sleep(self.lease_seconds / 4)
+            try:
+                held = await acquire_lease(db, self.name, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of job {self.name}: {e}")
+                held = time.monotonic() - renewed < self.lease_seconds / 2
+            else:
+                if held:
+                    renewed = time.monotonic()
+            if not held:
+                metrics.inc(f"job.{self.name}.lease_lost")
+                lost.set()
+                run.cancel()
+                return
+
+    async def run_forever(self, db):
+        while True:
+            try:
+                await self.run_once(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc(f"job.{self.name}.errors")
+                logger.error(f"Error running background job {self.name}: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+class Scheduler:
+    """Starts and stops a set of periodic jobs"""
+
+    def __init__(self, db):
+        self.db = db
+        self.jobs: List[PeriodicJob] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def add_job(self, name: str, interval_seconds: float, func: Callable[[], Awaitable[int]]):
+        self.jobs.append(PeriodicJob(name, interval_seconds, func))
+
+    def start(self):
+        for job in self.jobs:
+            self._tasks.append(asyncio.create_task(job.run_forever(self.db)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,256 @@
+"""
+Local SendGrid stand-in for Bee It Feedback
+
+A small ASGI app implementing the v3 `POST /v3/mail/send` contract, so the
+email pipeline can be load-tested and regression-tested without reaching
+the real provider. It checks the Authorization header and the payload as
+SendGrid does (400 with an `errors` list, at most 1000 personalizations),
+answers 202 with an X-Message-Id, and can be made slow or unreliable:
+
+- SINK_LATENCY_MS / SINK_LATENCY_JITTER_MS: delay added to every request
+- SINK_ERROR_RATE: fraction of requests failing with a 5xx
+- SINK_RATE_LIMIT: requests accepted per second; past it the sink answers
+  429 with Retry-After and X-RateLimit-* headers (0 disables the limit)
+
+Every recipient accepted is recorded, with substitutions applied to the
+subject and body, for assertions:
+
+- GET /sink/messages?para=...&limit=...  recorded messages, newest last
+- GET /sink/stats                       totals and per-second throughput
+- DELETE /sink/messages                 clear messages and counters
+
+In process, pass the sink to the client through httpx's ASGI transport:
+
+    sink = SendGridSink(latency_ms=50, rate_limit=100)
+    client = SendGridClient(api_key="test", transport=httpx.ASGITransport(app=sink.app))
+
+Against a running backend, start it from the backend directory and point
+the app at it with SENDGRID_API_URL=http://localhost:3025 and any
+SENDGRID_API_KEY:
+
+    uvicorn sendgrid_sink:app --port 3025
+"""
+import asyncio
+import math
+import os
+import random
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+SINK_LATENCY_MS = float(os.environ.get('SINK_LATENCY_MS', '0'))
+SINK_LATENCY_JITTER_MS = float(os.environ.get('SINK_LATENCY_JITTER_MS', '0'))
+SINK_ERROR_RATE = float(os.environ.get('SINK_ERROR_RATE', '0'))
+SINK_RATE_LIMIT = int(os.environ.get('SINK_RATE_LIMIT', '0'))
+SINK_MAX_RECORDED = int(os.environ.get('SINK_MAX_RECORDED', '10000'))
+# Seconds of per-second throughput kept for /sink/stats
+SINK_THROUGHPUT_WINDOW = int(os.environ.get('SINK_THROUGHPUT_WINDOW', '120'))
+
+MAX_PERSONALIZATIONS = 1000
+SEND_PATH = "/v3/mail/send"
+ERROR_STATUS_CODES = (500, 502, 503)
+
+
+def _errors(status_code: int, *errors: dict, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse({"errors": list(errors)}, status_code=status_code, headers=headers)
+
+
+def _error(message: str, field: Optional[str] = None) -> dict:
+    return {"message": message, "field": field, "help": None}
+
+
+def _substitute(text: str, substitutions: dict) -> str:
+    for tag, value in substitutions.items():
+        text = text.replace(tag, str(value))
+    return text
+
+
+def validate_payload(payload) -> List[dict]:
+    """SendGrid-style errors for a mail/send body; empty when it is valid"""
+    if not isinstance(payload, dict):
+        return [_error("Invalid JSON body")]
+    errors = []
+    personalizations = payload.get("personalizations")
+    if not isinstance(personalizations, list) or not personalizations:
+        errors.append(_error("The personalizations field is required and must have at least one personalization.",
+                             "personalizations"))
+    elif len(personalizations) > MAX_PERSONALIZATIONS:
+        errors.append(_error(f"The personalizations field cannot have more than {MAX_PERSONALIZATIONS} items.",
+                             "personalizations"))
+    else:
+        for index, entry in enumerate(personalizations):
+            if not isinstance(entry, dict) or not entry.get("to") or not all(
+                isinstance(to, dict) and to.get("email") for to in entry["to"]
+            ):
+                errors.append(_error("Each personalization must have at least one recipient with an email.",
+                                     f"personalizations.{index}.to"))
+            elif not payload.get("subject") and not entry.get("subject"):
+                errors.append(_error("The subject is required.", f"personalizations.{index}.subject"))
+    if not (payload.get("from") or {}).get("email"):
+        errors.append(_error("The from email is required.", "from.email"))
+    content = payload.get("content")
+    if not isinstance(content, list) or not content or not all(
+        isinstance(part, dict) and part.get("type") and part.get("value") for part in content
+    ):
+        errors.append(_error("The content value must be a string at least one character in length.", "content"))
+    return errors
+
+
+class SendGridSink:
+    """State and ASGI app of one stand-in; settings can be changed between runs"""
+
+    def __init__(
+        self,
+        latency_ms: float = SINK_LATENCY_MS,
+        latency_jitter_ms: float = SINK_LATENCY_JITTER_MS,
+        error_rate: float = SINK_ERROR_RATE,
+        rate_limit: int = SINK_RATE_LIMIT,
+        max_recorded: int = SINK_MAX_RECORDED,
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._random = random.Random(seed)
+        self.messages = deque(maxlen=max_recorded)
+        self.reset()
+        self.app = self._create_app()
+
+    def reset(self):
+        self.messages.clear()
+        self.status_codes = Counter()
+        self.recipients = 0
+        self.started = time.monotonic()
+        # Per-second buckets: second -> (requests, recipients accepted)
+        self._per_second = {}
+        self._window_second = 0
+        self._window_requests = 0
+
+    def _count(self, second: int, requests: int = 0, emails: int = 0):
+        previous_requests, previous_emails = self._per_second.get(second, (0, 0))
+        self._per_second[second] = (previous_requests + requests, previous_emails + emails)
+        for old in [s for s in self._per_second if s <= second - SINK_THROUGHPUT_WINDOW]:
+            del self._per_second[old]
+
+    def _rate_limited(self, now: float) -> Optional[JSONResponse]:
+        if not self.rate_limit:
+            return None
+        second = int(now)
+        if second != self._window_second:
+            self._window_second, self._window_requests = second, 0
+        self._window_requests += 1
+        reset = second + 1
+        headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(max(0, self.rate_limit - self._window_requests)),
+            "X-RateLimit-Reset": str(reset),
+        }
+        if self._window_requests <= self.rate_limit:
+            return None
+        headers["Retry-After"] = str(max(1, math.ceil(reset - now)))
+        return _errors(429, _error("too many requests"), headers=headers)
+
+    def _record(self, payload: dict, message_id: str) -> int:
+        received_at = datetime.now(timezone.utc).isoformat()
+        html = next((part["value"] for part in payload["content"] if part["type"] == "text/html"),
+                    payload["content"][0]["value"])
+        for entry in payload["personalizations"]:
+            substitutions = entry.get("substitutions") or {}
+            self.messages.append({
+                "id": message_id,
+                "recebido_em": received_at,
+                "de": payload["from"]["email"],
+                "para": [to["email"] for to in entry["to"]],
+                "assunto": _substitute(entry.get("subject") or payload["subject"], substitutions),
+                "html": _substitute(html, substitutions),
+            })
+        return len(payload["personalizations"])
+
+    async def send(self, request: Request) -> Response:
+        now = time.time()
+        self._count(int(now), requests=1)
+        response = await self._handle(request, now)
+        self.status_codes[response.status_code] += 1
+        return response
+
+    async def _handle(self, request: Request, now: float) -> Response:
+        authorization = request.headers.get("Authorization", "")
+        if not authorization.startswith("Bearer ") or authorization in ("Bearer ", "Bearer None"):
+            return _errors(401, _error("The provided authorization grant is invalid, expired, or revoked"))
+        limited = self._rate_limited(now)
+        if limited:
+            return limited
+
+        delay = self.latency_ms + self._random.uniform(0, self.latency_jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return _errors(self._random.choice(ERROR_STATUS_CODES), _error("simulated provider error"))
+
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        errors = validate_payload(payload)
+        if errors:
+            return _errors(400, *errors)
+
+        message_id = uuid.uuid4().hex
+        accepted = self._record(payload, message_id)
+        self.recipients += accepted
+        self._count(int(time.time()), emails=accepted)
+        return Response(status_code=202, headers={"X-Message-Id": message_id})
+
+    def stats(self) -> dict:
+        """Totals since the last reset and throughput per second over the recent window"""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        per_second = [
+            {"segundo": datetime.fromtimestamp(second, timezone.utc).isoformat(), "requisicoes": requests, "emails": emails}
+            for second, (requests, emails) in sorted(self._per_second.items())
+        ]
+        return {
+            "requisicoes": sum(self.status_codes.values()),
+            "por_status": {str(code): count for code, count in sorted(self.status_codes.items())},
+            "emails_aceitos": self.recipients,
+            "emails_por_segundo_medio": round(self.recipients / elapsed, 2),
+            "emails_por_segundo_pico": max((row["emails"] for row in per_second), default=0),
+            "por_segundo": per_second,
+        }
+
+    def _create_app(self) -> FastAPI:
+        app = FastAPI(title="SendGrid sink", docs_url=None, redoc_url=None, openapi_url=None)
+
+        @app.post(SEND_PATH)
+        async def mail_send(request: Request):
+            return await self.send(request)
+
+        @app.get("/sink/messages")
+        async def list_messages(para: Optional[str] = None, limit: int = 100):
+            messages = [m for m in self.messages if para is None or para in m["para"]]
+            return messages[-limit:] if limit > 0 else []
+
+        @app.delete("/sink/messages")
+        async def clear_messages():
+            self.reset()
+            return {"message": "Sink reiniciado"}
+
+        @app.get("/sink/stats")
+        async def get_stats():
+            return self.stats()
+
+        return app
+
+
+app = SendGridSink().app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get('SINK_PORT', '3025')))
@@ -1,23 +1,73 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, BackgroundTasks, Query, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import List, Literal, Optional, get_args
 import uuid
 from datetime import datetime, timezone, timedelta
-import bcrypt
 import jwt
+from pymongo import ReturnDocument, UpdateOne
 
 # Import email service
-from email_service import (
-    send_new_feedback_notification,
-    send_overdue_feedback_notification,
-    send_action_plan_deadline_notification
+from email_service import configuration_test_email, new_feedback_email, send_email
+from digests import queue_overdue_digests
+from email_outbox import EMAIL_OUTBOX_WORKER_ENABLED, OutboxWorker, enqueue_email, outbox_stats, requeue_email
+from transactions import run_in_transaction
+from indexes import ensure_indexes, audit_indexes
+from scheduler import Scheduler
+import password_hashing
+from principal_cache import PrincipalCache, bump_users_version
+from user_directory import UserDirectory
+from org_tree import OrgTree
+from policies import Policy
+from loaders import Loaders
+from feedback_names import backfill_feedback_names, propagate_user_name_task
+from cascade import (
+    CASCADE_INLINE_LIMIT,
+    JOBS_COLLECTION as CASCADE_JOBS_COLLECTION,
+    create_cascade_job,
+    delete_with_cascade,
+    run_user_cascade_job,
+    user_cascade_size
+)
+from exports import (
+    FEEDBACK_COLUMNS,
+    PLAN_COLUMNS,
+    create_export_job,
+    feedback_export_pipeline,
+    plan_export_pipeline,
+    purge_expired_exports,
+    run_xlsx_export,
+    stream_csv,
+    stream_ndjson
+)
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    TOTAL_COUNT_HEADER,
+    PageParams,
+    fetch_page,
+    page_params,
+    paginate
+)
+import metrics
+from dashboard_counters import (
+    EMPRESA_SCOPE,
+    apply_feedback_change,
+    apply_feedback_changes,
+    apply_plan_change,
+    apply_plan_changes,
+    backfill_plan_owners,
+    get_counters,
+    get_colaborador_counters,
+    reconcile_counters
 )
 
 ROOT_DIR = Path(__file__).parent
@@ -28,11 +78,29 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Authenticated users are cached per worker; see principal_cache.py
+principal_cache = PrincipalCache(db)
+# Names, roles and reporting lines of every user, kept in memory; see user_directory.py
+user_directory = UserDirectory(db)
+# Transitive reports of each manager; see org_tree.py
+org_tree = OrgTree(db)
+# Read scopes compiled into query filters; see policies.py
+policy = Policy(org_tree)
+# Delivers queued emails through a pooled SendGrid client; see email_outbox.py
+outbox_worker = OutboxWorker(db)
+
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'bee-it-feedback-secret-key-2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Dashboard counters are rebuilt from scratch on this interval to repair drift
+COUNTERS_RECONCILE_INTERVAL_SECONDS = int(os.environ.get('COUNTERS_RECONCILE_INTERVAL_SECONDS', '3600'))
+# Overdue feedbacks and plans are flipped to "Atrasado" on this interval
+DEADLINE_SWEEP_INTERVAL_SECONDS = int(os.environ.get('DEADLINE_SWEEP_INTERVAL_SECONDS', '300'))
+# Expired export jobs and their files are removed on this interval
+EXPORT_CLEANUP_INTERVAL_SECONDS = int(os.environ.get('EXPORT_CLEANUP_INTERVAL_SECONDS', '3600'))
+
 # Create the main app
 app = FastAPI(title="Bee It Feedback API")
 
@@ -48,9 +116,13 @@ async def root_health_check():
 
 # ==================== ENUMS & CONSTANTS ====================
 ROLES = ["ADMIN", "GESTOR", "COLABORADOR"]
-FEEDBACK_TYPES = ["1:1", "Avaliação de Desempenho", "Coaching", "Correção de Rota", "Elogio"]
-FEEDBACK_STATUS = ["Em dia", "Aguardando ciência", "Atrasado"]
-ACTION_PLAN_STATUS = ["Não iniciado", "Em andamento", "Concluído", "Atrasado"]
+# Literals validate request bodies (these values also key the dashboard counters)
+FeedbackType = Literal["1:1", "Avaliação de Desempenho", "Coaching", "Correção de Rota", "Elogio"]
+FeedbackStatus = Literal["Em dia", "Aguardando ciência", "Atrasado"]
+ActionPlanStatus = Literal["Não iniciado", "Em andamento", "Concluído", "Atrasado"]
+FEEDBACK_TYPES = list(get_args(FeedbackType))
+FEEDBACK_STATUS = list(get_args(FeedbackStatus))
+ACTION_PLAN_STATUS = list(get_args(ActionPlanStatus))
 RESPONSIBLE_TYPES = ["Colaborador", "Gestor", "Ambos"]
 PROGRESS_TYPES = ["Ruim", "Regular", "Bom"]
 
@@ -118,7 +190,7 @@ class TeamResponse(BaseModel):
 # Feedback Models
 class FeedbackCreate(BaseModel):
     colaborador_id: str
-    tipo_feedback: str
+    tipo_feedback: FeedbackType
     contexto: str
     impacto: str
     expectativa: str
@@ -128,14 +200,14 @@ class FeedbackCreate(BaseModel):
     confidencial: bool = False
 
 class FeedbackUpdate(BaseModel):
-    tipo_feedback: Optional[str] = None
+    tipo_feedback: Optional[FeedbackType] = None
     contexto: Optional[str] = None
     impacto: Optional[str] = None
     expectativa: Optional[str] = None
     pontos_fortes: Optional[List[str]] = None
     pontos_melhoria: Optional[List[str]] = None
     data_proximo_feedback: Optional[str] = None
-    status_feedback: Optional[str] = None
+    status_feedback: Optional[FeedbackStatus] = None
     confidencial: Optional[bool] = None
 
 class FeedbackResponse(BaseModel):
@@ -158,6 +230,29 @@ class FeedbackResponse(BaseModel):
     confidencial: bool
     criado_em: str
 
+class FeedbackFilters:
+    """Query filters shared by the feedback listing and export"""
+    
+    def __init__(
+        self,
+        colaborador_id: Optional[str] = None,
+        gestor_id: Optional[str] = None,
+        time_id: Optional[str] = None,
+        tipo_feedback: Optional[str] = None,
+        status_feedback: Optional[str] = None,
+        data_inicio: Optional[str] = None,
+        data_fim: Optional[str] = None,
+        com_plano: Optional[bool] = None
+    ):
+        self.colaborador_id = colaborador_id
+        self.gestor_id = gestor_id
+        self.time_id = time_id
+        self.tipo_feedback = tipo_feedback
+        self.status_feedback = status_feedback
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self.com_plano = com_plano
+
 # Action Plan Models
 class ActionPlanCreate(BaseModel):
     feedback_id: str
@@ -169,7 +264,7 @@ class ActionPlanUpdate(BaseModel):
     objetivo: Optional[str] = None
     prazo_final: Optional[str] = None
     responsavel: Optional[str] = None
-    status: Optional[str] = None
+    status: Optional[ActionPlanStatus] = None
 
 class ActionPlanResponse(BaseModel):
     id: str
@@ -179,6 +274,8 @@ class ActionPlanResponse(BaseModel):
     responsavel: str
     status: str
     progresso_percentual: int
+    itens_total: int = 0
+    itens_concluidos: int = 0
     criado_em: str
 
 # Action Plan Item Models
@@ -221,16 +318,30 @@ class NotificationResponse(BaseModel):
     tipo: str
     titulo: str
     mensagem: str
+    entidade_id: Optional[str] = None
     lida: bool
     criado_em: str
 
 # ==================== HELPER FUNCTIONS ====================
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def password_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Servidor ocupado. Tente novamente em instantes.",
+        headers={"Retry-After": "1"}
+    )
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hashing.hash_password(password)
+    except password_hashing.PasswordPoolSaturated:
+        raise password_pool_busy()
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return await password_hashing.verify_password(password, hashed)
+    except password_hashing.PasswordPoolSaturated:
+        raise password_pool_busy()
 
 def create_token(user_id: str, email: str, papel: str) -> str:
     expiration = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
@@ -242,13 +353,26 @@ def create_token(user_id: str, email: str, papel: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+def get_loaders() -> Loaders:
+    """Batch loaders shared by every dependency of the same request"""
+    return Loaders(db)
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    loaders: Loaders = Depends(get_loaders)
+) -> dict:
     try:
         token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.usuarios.find_one({"id": payload["user_id"]}, {"_id": 0, "password": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="Usuário não encontrado")
+        user = await principal_cache.get(payload["user_id"])
+        if user is None:
+            user = await db.usuarios.find_one({"id": payload["user_id"]}, {"_id": 0, "password": 0})
+            if not user:
+                raise HTTPException(status_code=401, detail="Usuário não encontrado")
+            principal_cache.put(user["id"], user)
+        if not user.get("ativo", True):
+            raise HTTPException(status_code=401, detail="Usuário desativado")
+        loaders.usuarios.prime(user["id"], user)
         return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expirado")
@@ -265,84 +389,389 @@ async def require_gestor_or_admin(user: dict = Depends(get_current_user)) -> dic
         raise HTTPException(status_code=403, detail="Acesso negado. Apenas gestores ou administradores.")
     return user
 
-async def create_notification(usuario_id: str, tipo: str, titulo: str, mensagem: str):
+async def attach_user_names(loaders: Loaders, docs: list, **fields: str):
+    """
+    Resolve user names for a batch of documents from the user directory, or
+    through the request's user loader while the directory is not loaded
+    
+    Args:
+        loaders: Loaders of the current request
+        docs: Documents to complete in place
+        fields: Name field to fill -> id field to resolve, e.g. gestor_nome="gestor_id"
+    """
+    user_ids = list({doc[id_field] for doc in docs for id_field in fields.values() if doc.get(id_field)})
+    if user_directory.ready:
+        user_map = {user_id: user_directory.name_of(user_id) for user_id in user_ids}
+    else:
+        users = await loaders.usuarios.load_many(user_ids)
+        user_map = {u["id"]: u.get("nome") for u in users if u}
+    for doc in docs:
+        for name_field, id_field in fields.items():
+            doc[name_field] = user_map.get(doc.get(id_field))
+
+async def attach_feedback_names(loaders: Loaders, feedbacks: list):
+    """
+    Feedbacks store the collaborator and manager names; only documents
+    written before that (and not backfilled yet) are completed here
+    """
+    legacy = [f for f in feedbacks if "colaborador_nome" not in f or "gestor_nome" not in f]
+    if legacy:
+        await attach_user_names(loaders, legacy, colaborador_nome="colaborador_id", gestor_nome="gestor_id")
+
+async def team_member_ids(time_id: str) -> List[str]:
+    if user_directory.ready:
+        return user_directory.members_of_team(time_id)
+    members = await db.usuarios.find({"time_id": time_id}, {"_id": 0, "id": 1}).to_list(None)
+    return [m["id"] for m in members]
+
+async def create_notification(
+    usuario_id: str,
+    tipo: str,
+    titulo: str,
+    mensagem: str,
+    entidade_id: Optional[str] = None,
+    session=None
+):
     notification = {
         "id": str(uuid.uuid4()),
         "usuario_id": usuario_id,
         "tipo": tipo,
         "titulo": titulo,
         "mensagem": mensagem,
+        # Feedback or plan the notification is about, deleted along with it
+        "entidade_id": entidade_id,
         "lida": False,
         "criado_em": datetime.now(timezone.utc).isoformat()
     }
-    await db.notificacoes.insert_one(notification)
+    await db.notificacoes.insert_one(notification, session=session)
+
+def iso_before_expr(field: str, now_iso: str) -> dict:
+    """Aggregation expression: the ISO date string in `field` lies before `now_iso`"""
+    return {"$and": [
+        {"$eq": [{"$type": field}, "string"]},
+        {"$ne": [field, ""]},
+        {"$lt": [field, now_iso]}
+    ]}
+
+def feedback_status_expr(now_iso: str) -> dict:
+    """Aggregation expression deriving `status_feedback` from acknowledgment and dates"""
+    return {"$switch": {
+        "branches": [
+            {"case": {"$eq": ["$ciencia_colaborador", True]}, "then": "Em dia"},
+            {"case": iso_before_expr("$data_proximo_feedback", now_iso), "then": "Atrasado"},
+        ],
+        "default": "Aguardando ciência"
+    }}
+
+def derive_feedback_status(feedback: dict, now: datetime) -> str:
+    """The status `feedback_status_expr` gives a feedback, computed in Python"""
+    if feedback.get("ciencia_colaborador") is True:
+        return "Em dia"
+    proximo = feedback.get("data_proximo_feedback")
+    if isinstance(proximo, str) and proximo != "" and proximo < now.isoformat():
+        return "Atrasado"
+    return "Aguardando ciência"
+
+def feedback_update_pipeline(update_dict: dict, now: datetime) -> List[dict]:
+    """
+    Pipeline update applying edited fields and re-deriving the status in the
+    same atomic write. Values are wrapped in $literal so user text starting
+    with "$" is never read as a field path.
+    """
+    return [
+        {"$set": {field: {"$literal": value} for field, value in update_dict.items()}},
+        {"$set": {"status_feedback": feedback_status_expr(now.isoformat())}},
+    ]
 
-async def update_feedback_status(feedback_id: str):
-    """Update feedback status based on acknowledgment and dates"""
-    feedback = await db.feedbacks.find_one({"id": feedback_id}, {"_id": 0})
-    if not feedback:
-        return
+def deadline_passed(prazo_final: Optional[str], now: datetime) -> bool:
+    """Whether an ISO deadline lies before `now` (unparseable dates never expire)"""
+    if not prazo_final:
+        return False
+    try:
+        prazo = datetime.fromisoformat(prazo_final.replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    if prazo.tzinfo is None:
+        prazo = prazo.replace(tzinfo=timezone.utc)
+    return prazo < now
+
+def compute_plan_status(plano: dict, progresso: int, now: datetime) -> str:
+    """Derive the action plan status from its progress and deadline"""
+    new_status = plano.get("status", "Não iniciado")
     
-    new_status = feedback.get("status_feedback", "Em dia")
-    
-    if feedback.get("ciencia_colaborador"):
-        new_status = "Em dia"
-    elif feedback.get("data_proximo_feedback"):
-        try:
-            proximo = datetime.fromisoformat(feedback["data_proximo_feedback"].replace("Z", "+00:00"))
-            if proximo.replace(tzinfo=None) < datetime.now():
-                new_status = "Atrasado"
-            else:
-                new_status = "Aguardando ciência"
-        except:
-            new_status = "Aguardando ciência"
-    else:
-        new_status = "Aguardando ciência"
+    if progresso == 100:
+        new_status = "Concluído"
+    elif progresso > 0:
+        new_status = "Em andamento"
     
-    await db.feedbacks.update_one({"id": feedback_id}, {"$set": {"status_feedback": new_status}})
+    # Check if deadline passed
+    if new_status != "Concluído" and deadline_passed(plano.get("prazo_final"), now):
+        new_status = "Atrasado"
+    
+    return new_status
+
+def with_deadline_status(plano: dict, now: datetime) -> dict:
+    """Report an overdue plan as "Atrasado" at read time without writing it back"""
+    if plano.get("status") != "Concluído" and deadline_passed(plano.get("prazo_final"), now):
+        plano["status"] = "Atrasado"
+    return plano
+
+def plan_status_filter(status: str, now: datetime) -> dict:
+    """Mongo filter matching plans whose read-time status equals `status`"""
+    overdue = {"prazo_final": {"$gt": "", "$lt": now.isoformat()}, "status": {"$ne": "Concluído"}}
+    if status == "Atrasado":
+        return {"$or": [{"status": "Atrasado"}, overdue]}
+    if status == "Concluído":
+        return {"status": status}
+    return {"status": status, "prazo_final": {"$not": {"$gt": "", "$lt": now.isoformat()}}}
+
+def plan_progress_pipeline(total_delta: int, done_delta: int, now: datetime) -> List[dict]:
+    """
+    Pipeline update moving a plan's item counters and deriving progress and
+    status from them, evaluated atomically by the server
+    (same rules as `compute_plan_status`)
+    """
+    overdue = iso_before_expr("$prazo_final", now.isoformat())
+    return [
+        {"$set": {
+            "itens_total": {"$add": [{"$ifNull": ["$itens_total", 0]}, total_delta]},
+            "itens_concluidos": {"$add": [{"$ifNull": ["$itens_concluidos", 0]}, done_delta]},
+        }},
+        # A plan without items keeps its last progress
+        {"$set": {"progresso_percentual": {"$cond": [
+            {"$gt": ["$itens_total", 0]},
+            {"$toInt": {"$trunc": {"$multiply": [{"$divide": ["$itens_concluidos", "$itens_total"]}, 100]}}},
+            {"$ifNull": ["$progresso_percentual", 0]}
+        ]}}},
+        {"$set": {"status": {"$switch": {
+            "branches": [
+                {"case": {"$eq": ["$progresso_percentual", 100]}, "then": "Concluído"},
+                {"case": {"$and": [
+                    overdue,
+                    {"$or": [{"$gt": ["$progresso_percentual", 0]}, {"$ne": ["$status", "Concluído"]}]}
+                ]}, "then": "Atrasado"},
+                {"case": {"$gt": ["$progresso_percentual", 0]}, "then": "Em andamento"},
+            ],
+            "default": "$status"
+        }}}},
+    ]
 
-async def update_action_plan_progress(plano_id: str):
-    """Calculate and update action plan progress based on items"""
-    items = await db.itens_plano.find({"plano_de_acao_id": plano_id}, {"_id": 0}).to_list(100)
-    if not items:
-        return
+def derive_plan_progress(plano: dict, total_delta: int, done_delta: int, now: datetime) -> dict:
+    """The plan as `plan_progress_pipeline` leaves it, computed from its previous state"""
+    total = plano.get("itens_total", 0) + total_delta
+    concluidos = plano.get("itens_concluidos", 0) + done_delta
+    progresso = int((concluidos / total) * 100) if total > 0 else plano.get("progresso_percentual", 0)
     
-    total = len(items)
-    concluidos = sum(1 for item in items if item.get("concluido"))
-    progresso = int((concluidos / total) * 100) if total > 0 else 0
+    status = plano.get("status", "Não iniciado")
+    prazo = plano.get("prazo_final")
+    overdue = isinstance(prazo, str) and prazo != "" and prazo < now.isoformat()
+    if progresso == 100:
+        status = "Concluído"
+    elif overdue and (progresso > 0 or status != "Concluído"):
+        status = "Atrasado"
+    elif progresso > 0:
+        status = "Em andamento"
     
-    # Update status
-    plano = await db.planos_acao.find_one({"id": plano_id}, {"_id": 0})
+    return {**plano, "itens_total": total, "itens_concluidos": concluidos,
+            "progresso_percentual": progresso, "status": status}
+
+async def apply_item_delta(plano_id: str, total_delta: int, done_delta: int):
+    """
+    Record added, removed or toggled items on their plan: counters, progress
+    and status change in one atomic update, so concurrent item changes never
+    overwrite each other
+    """
+    now = datetime.now(timezone.utc)
+    plano = await db.planos_acao.find_one_and_update(
+        {"id": plano_id}, plan_progress_pipeline(total_delta, done_delta, now), {"_id": 0}
+    )
     if not plano:
         return
+    updated = derive_plan_progress(plano, total_delta, done_delta, now)
+    if updated["status"] != plano.get("status"):
+        await apply_plan_change(db, plano, updated)
+
+async def recompute_action_plans(plan_ids: Optional[List[str]] = None) -> int:
+    """
+    Recompute item counters, progress and status for many plans at once: one aggregation
+    joins each plan with its item totals and the changed plans are written
+    back with a single bulk_write per 1000 plans.
     
-    new_status = plano.get("status", "Não iniciado")
+    Returns:
+        int: Number of plans whose progress or status changed
+    """
+    now = datetime.now(timezone.utc)
+    match = {"id": {"$in": plan_ids}} if plan_ids is not None else {}
+    cursor = db.planos_acao.aggregate([
+        {"$match": match},
+        {"$lookup": {
+            "from": "itens_plano",
+            "let": {"plano_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$plano_de_acao_id", "$$plano_id"]}}},
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "concluidos": {"$sum": {"$cond": ["$concluido", 1, 0]}}
+                }}
+            ],
+            "as": "itens"
+        }},
+        {"$project": {"_id": 0}}
+    ])
+    
+    changed = 0
+    operations = []
+    transitions = []
+    async for plano in cursor:
+        itens = plano.pop("itens")
+        total = itens[0]["total"] if itens else 0
+        concluidos = itens[0]["concluidos"] if itens else 0
+        if total:
+            progresso = int((concluidos / total) * 100)
+        else:
+            progresso = plano.get("progresso_percentual", 0)
+        new_status = compute_plan_status(plano, progresso, now)
+        if (progresso == plano.get("progresso_percentual") and new_status == plano.get("status")
+                and total == plano.get("itens_total") and concluidos == plano.get("itens_concluidos")):
+            continue
+        # Only written if no item change moved the counters since they were read
+        operations.append(UpdateOne(
+            {"id": plano["id"], "itens_total": plano.get("itens_total"), "itens_concluidos": plano.get("itens_concluidos")},
+            {"$set": {
+                "progresso_percentual": progresso,
+                "status": new_status,
+                "itens_total": total,
+                "itens_concluidos": concluidos
+            }}
+        ))
+        transitions.append((plano, {**plano, "status": new_status}))
+        changed += 1
+        if len(operations) >= 1000:
+            await db.planos_acao.bulk_write(operations, ordered=False)
+            await apply_plan_changes(db, transitions)
+            operations = []
+            transitions = []
+    if operations:
+        await db.planos_acao.bulk_write(operations, ordered=False)
+        await apply_plan_changes(db, transitions)
+    return changed
+
+async def sweep_overdue_statuses() -> int:
+    """
+    Flip feedbacks and action plans whose deadline has passed to "Atrasado"
+    with one ranged update_many per collection. The affected documents are
+    grouped first so the dashboard counters move by the same amounts.
     
-    if progresso == 100:
-        new_status = "Concluído"
-    elif progresso > 0:
-        new_status = "Em andamento"
+    Returns:
+        int: Number of feedbacks and plans changed
+    """
+    now = datetime.now(timezone.utc).isoformat()
     
-    # Check if deadline passed
-    if plano.get("prazo_final"):
-        try:
-            prazo = datetime.fromisoformat(plano["prazo_final"].replace("Z", "+00:00"))
-            if prazo.replace(tzinfo=None) < datetime.now() and new_status != "Concluído":
-                new_status = "Atrasado"
-        except:
-            pass
-    
-    await db.planos_acao.update_one(
-        {"id": plano_id}, 
-        {"$set": {"progresso_percentual": progresso, "status": new_status}}
+    # "$gt": "" leaves out feedbacks without a follow-up date, which
+    # derive_feedback_status and iso_before_expr never treat as overdue
+    feedbacks_filter = {
+        "data_proximo_feedback": {"$gt": "", "$lt": now},
+        "ciencia_colaborador": False,
+        "status_feedback": {"$ne": "Atrasado"}
+    }
+    feedback_groups = await db.feedbacks.aggregate([
+        {"$match": feedbacks_filter},
+        {"$group": {
+            "_id": {
+                "colaborador_id": "$colaborador_id",
+                "gestor_id": "$gestor_id",
+                "status_feedback": "$status_feedback",
+                "tipo_feedback": "$tipo_feedback",
+                "ciencia_colaborador": "$ciencia_colaborador"
+            },
+            "count": {"$sum": 1}
+        }}
+    ]).to_list(None)
+    feedbacks_result = await db.feedbacks.update_many(
+        feedbacks_filter, {"$set": {"status_feedback": "Atrasado"}}
     )
+    await apply_feedback_changes(db, [
+        (g["_id"], {**g["_id"], "status_feedback": "Atrasado"}, g["count"]) for g in feedback_groups
+    ])
+    
+    plans_filter = {
+        "prazo_final": {"$gt": "", "$lt": now},
+        "status": {"$nin": ["Concluído", "Atrasado"]}
+    }
+    plan_groups = await db.planos_acao.aggregate([
+        {"$match": plans_filter},
+        {"$group": {
+            "_id": {"colaborador_id": "$colaborador_id", "gestor_id": "$gestor_id", "status": "$status"},
+            "count": {"$sum": 1}
+        }}
+    ]).to_list(None)
+    plans_result = await db.planos_acao.update_many(plans_filter, {"$set": {"status": "Atrasado"}})
+    await apply_plan_changes(db, [
+        (g["_id"], {**g["_id"], "status": "Atrasado"}, g["count"]) for g in plan_groups
+    ])
+    
+    metrics.set_gauge("deadline_sweep.last_feedbacks_changed", feedbacks_result.modified_count)
+    metrics.set_gauge("deadline_sweep.last_plans_changed", plans_result.modified_count)
+    return feedbacks_result.modified_count + plans_result.modified_count
+
+async def reconcile_plan_counts() -> int:
+    """
+    Rebuild `planos_count` on feedbacks from planos_acao, filling it on
+    feedbacks that predate the field and repairing drift. Each write is
+    conditional on the value that was read, so a plan created or deleted
+    meanwhile is never overwritten; the next run picks it up.
+    
+    Returns:
+        int: Number of feedbacks whose count changed
+    """
+    cursor = db.feedbacks.aggregate([
+        {"$lookup": {
+            "from": "planos_acao",
+            "let": {"feedback_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$feedback_id", "$$feedback_id"]}}},
+                {"$count": "total"}
+            ],
+            "as": "planos"
+        }},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "planos_count": 1,
+            "total": {"$ifNull": [{"$first": "$planos.total"}, 0]}
+        }},
+        {"$match": {"$expr": {"$ne": ["$planos_count", "$total"]}}}
+    ])
+    
+    changed = 0
+    operations = []
+    async for feedback in cursor:
+        current = feedback["planos_count"] if "planos_count" in feedback else {"$exists": False}
+        operations.append(UpdateOne(
+            {"id": feedback["id"], "planos_count": current},
+            {"$set": {"planos_count": feedback["total"]}}
+        ))
+        changed += 1
+        if len(operations) >= 1000:
+            await db.feedbacks.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db.feedbacks.bulk_write(operations, ordered=False)
+    return changed
+
+async def refresh_dashboard_counters() -> int:
+    """Recompute plan progress and plan counts in bulk, then rebuild the dashboard counters"""
+    await recompute_action_plans()
+    await reconcile_plan_counts()
+    return await reconcile_counters(db)
 
 # ==================== AUTH ENDPOINTS ====================
 
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(request: LoginRequest):
     user = await db.usuarios.find_one({"email": request.email}, {"_id": 0})
-    if not user or not verify_password(request.password, user["password"]):
+    if not user or not await verify_password(request.password, user["password"]):
         raise HTTPException(status_code=401, detail="Email ou senha inválidos")
     
     if not user.get("ativo", True):
@@ -371,7 +800,7 @@ async def create_user(user_data: UserCreate, admin: dict = Depends(require_admin
         "id": str(uuid.uuid4()),
         "nome": user_data.nome,
         "email": user_data.email,
-        "password": hash_password(user_data.password),
+        "password": await hash_password(user_data.password),
         "papel": user_data.papel,
         "time_id": user_data.time_id,
         "gestor_direto_id": user_data.gestor_direto_id,
@@ -380,6 +809,9 @@ async def create_user(user_data: UserCreate, admin: dict = Depends(require_admin
     }
     
     await db.usuarios.insert_one(user)
+    await bump_users_version(db)
+    if user["gestor_direto_id"] or user["time_id"]:
+        await org_tree.invalidate()
     del user["password"]
     del user["_id"]
     
@@ -387,9 +819,11 @@ async def create_user(user_data: UserCreate, admin: dict = Depends(require_admin
 
 @api_router.get("/users", response_model=List[UserResponse])
 async def list_users(
+    response: Response,
     papel: Optional[str] = None,
     time_id: Optional[str] = None,
     ativo: Optional[bool] = None,
+    page: PageParams = Depends(page_params()),
     user: dict = Depends(get_current_user)
 ):
     query = {}
@@ -400,35 +834,90 @@ async def list_users(
     if ativo is not None:
         query["ativo"] = ativo
     
-    users = await db.usuarios.find(query, {"_id": 0, "password": 0}).to_list(1000)
-    return [UserResponse(**u) for u in users]
+    return await paginate(
+        db.usuarios, query, [("_id", 1)], page, response, UserResponse, {"_id": 0, "password": 0}
+    )
 
 @api_router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str, user: dict = Depends(get_current_user)):
-    found = await db.usuarios.find_one({"id": user_id}, {"_id": 0, "password": 0})
+async def get_user(
+    user_id: str,
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    found = await loaders.usuarios.load(user_id)
     if not found:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     return UserResponse(**found)
 
 @api_router.put("/users/{user_id}", response_model=UserResponse)
-async def update_user(user_id: str, user_data: UserUpdate, admin: dict = Depends(require_admin)):
+async def update_user(
+    user_id: str,
+    user_data: UserUpdate,
+    background_tasks: BackgroundTasks,
+    admin: dict = Depends(require_admin)
+):
     update_dict = {k: v for k, v in user_data.model_dump().items() if v is not None}
     if not update_dict:
         raise HTTPException(status_code=400, detail="Nenhum campo para atualizar")
     
-    result = await db.usuarios.update_one({"id": user_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    updated = await db.usuarios.find_one_and_update(
+        {"id": user_id},
+        {"$set": update_dict},
+        {"_id": 0, "password": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     
-    updated = await db.usuarios.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    # Cache versions are bumped concurrently: one more round trip, not two
+    invalidations = [principal_cache.invalidate(user_id)]
+    if "gestor_direto_id" in update_dict or "time_id" in update_dict:
+        invalidations.append(org_tree.invalidate())
+    await asyncio.gather(*invalidations)
+    
+    # Rewrite the name stored on the user's feedbacks
+    if "nome" in update_dict:
+        background_tasks.add_task(propagate_user_name_task, db, user_id)
+    
     return UserResponse(**updated)
 
+async def run_user_deletion(job_id: str, user_id: str):
+    await run_user_cascade_job(db, job_id, user_id)
+    await asyncio.gather(principal_cache.invalidate(user_id), org_tree.invalidate())
+
 @api_router.delete("/users/{user_id}")
-async def delete_user(user_id: str, admin: dict = Depends(require_admin)):
-    result = await db.usuarios.delete_one({"id": user_id})
-    if result.deleted_count == 0:
+async def delete_user(
+    user_id: str,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    admin: dict = Depends(require_admin)
+):
+    if not await db.usuarios.count_documents({"id": user_id}, limit=1):
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
-    return {"message": "Usuário removido com sucesso"}
+    
+    # Feedbacks given or received go with the user. Large histories are
+    # removed by a background job; the user loses access right away.
+    size = await user_cascade_size(db, user_id)
+    if size > CASCADE_INLINE_LIMIT:
+        await db.usuarios.update_one({"id": user_id}, {"$set": {"ativo": False}})
+        await principal_cache.invalidate(user_id)
+        job = await create_cascade_job(db, user_id, admin["id"], size)
+        background_tasks.add_task(run_user_deletion, job["id"], user_id)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return job
+    
+    deleted = await delete_with_cascade(db, user_ids=[user_id])
+    if not deleted.get("usuarios"):
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    await asyncio.gather(principal_cache.invalidate(user_id), org_tree.invalidate())
+    return {"message": "Usuário removido com sucesso", "removidos": deleted}
+
+@api_router.get("/admin/cascade-jobs/{job_id}")
+async def get_cascade_job(job_id: str, admin: dict = Depends(require_admin)):
+    job = await db[CASCADE_JOBS_COLLECTION].find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+    return job
 
 # ==================== TEAM ENDPOINTS ====================
 
@@ -449,13 +938,20 @@ async def create_team(team_data: TeamCreate, admin: dict = Depends(require_admin
     return TeamResponse(**team)
 
 @api_router.get("/teams", response_model=List[TeamResponse])
-async def list_teams(user: dict = Depends(get_current_user)):
-    teams = await db.times.find({}, {"_id": 0}).to_list(100)
-    return [TeamResponse(**t) for t in teams]
+async def list_teams(
+    response: Response,
+    page: PageParams = Depends(page_params()),
+    user: dict = Depends(get_current_user)
+):
+    return await paginate(db.times, {}, [("_id", 1)], page, response, TeamResponse, {"_id": 0})
 
 @api_router.get("/teams/{team_id}", response_model=TeamResponse)
-async def get_team(team_id: str, user: dict = Depends(get_current_user)):
-    team = await db.times.find_one({"id": team_id}, {"_id": 0})
+async def get_team(
+    team_id: str,
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    team = await loaders.times.load(team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Time não encontrado")
     return TeamResponse(**team)
@@ -466,11 +962,11 @@ async def update_team(team_id: str, team_data: TeamUpdate, admin: dict = Depends
     if not update_dict:
         raise HTTPException(status_code=400, detail="Nenhum campo para atualizar")
     
-    result = await db.times.update_one({"id": team_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    updated = await db.times.find_one_and_update(
+        {"id": team_id}, {"$set": update_dict}, {"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if not updated:
         raise HTTPException(status_code=404, detail="Time não encontrado")
-    
-    updated = await db.times.find_one({"id": team_id}, {"_id": 0})
     return TeamResponse(**updated)
 
 @api_router.delete("/teams/{team_id}")
@@ -482,17 +978,51 @@ async def delete_team(team_id: str, admin: dict = Depends(require_admin)):
 
 # ==================== FEEDBACK ENDPOINTS ====================
 
+async def build_feedback_query(user: dict, filters: FeedbackFilters) -> dict:
+    """Compile the role scope and request filters into a feedbacks query"""
+    query = {}
+    
+    if filters.colaborador_id:
+        query["colaborador_id"] = filters.colaborador_id
+    if filters.gestor_id:
+        query["gestor_id"] = filters.gestor_id
+    if filters.tipo_feedback:
+        query["tipo_feedback"] = filters.tipo_feedback
+    if filters.status_feedback:
+        query["status_feedback"] = filters.status_feedback
+    if filters.data_inicio:
+        query["data_feedback"] = {"$gte": filters.data_inicio}
+    if filters.data_fim:
+        if "data_feedback" in query:
+            query["data_feedback"]["$lte"] = filters.data_fim
+        else:
+            query["data_feedback"] = {"$lte": filters.data_fim}
+    
+    # Filter by team
+    if filters.time_id:
+        query["colaborador_id"] = {"$in": await team_member_ids(filters.time_id)}
+    
+    # Filter by action plan existence (planos_count is maintained by the plan endpoints)
+    if filters.com_plano is not None:
+        query["planos_count"] = {"$gt": 0} if filters.com_plano else {"$in": [0, None]}
+    
+    return await policy.compile(user, "feedbacks", query)
+
 @api_router.post("/feedbacks", response_model=FeedbackResponse)
-async def create_feedback(feedback_data: FeedbackCreate, background_tasks: BackgroundTasks, user: dict = Depends(require_gestor_or_admin)):
+async def create_feedback(
+    feedback_data: FeedbackCreate,
+    user: dict = Depends(require_gestor_or_admin),
+    loaders: Loaders = Depends(get_loaders)
+):
     # Get collaborator info
-    colaborador = await db.usuarios.find_one({"id": feedback_data.colaborador_id}, {"_id": 0})
+    colaborador = await loaders.usuarios.load(feedback_data.colaborador_id)
     if not colaborador:
         raise HTTPException(status_code=404, detail="Colaborador não encontrado")
     
     # Calculate next feedback date if not provided
     data_proximo = feedback_data.data_proximo_feedback
     if not data_proximo and colaborador.get("time_id"):
-        time = await db.times.find_one({"id": colaborador["time_id"]}, {"_id": 0})
+        time = await loaders.times.load(colaborador["time_id"])
         if time:
             dias = time.get("frequencia_padrao_feedback_dias", 30)
             data_proximo = (datetime.now(timezone.utc) + timedelta(days=dias)).isoformat()
@@ -513,274 +1043,232 @@ async def create_feedback(feedback_data: FeedbackCreate, background_tasks: Backg
         "ciencia_colaborador": False,
         "data_ciencia": None,
         "confidencial": feedback_data.confidencial,
+        "colaborador_nome": colaborador.get("nome"),
+        "gestor_nome": user.get("nome"),
+        "planos_count": 0,
         "criado_em": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.feedbacks.insert_one(feedback)
-    del feedback["_id"]
-    
-    # Create notification
-    await create_notification(
-        feedback_data.colaborador_id,
-        "novo_feedback",
-        "Novo Feedback Recebido",
-        f"Você recebeu um novo feedback do tipo {feedback_data.tipo_feedback}"
-    )
-    
-    # Send email notification to collaborator (in background)
-    if colaborador.get("email"):
-        data_formatada = datetime.now(timezone.utc).strftime("%d/%m/%Y")
-        background_tasks.add_task(
-            send_new_feedback_notification,
-            colaborador.get("email"),
-            colaborador.get("nome", "Colaborador"),
-            user.get("nome", "Gestor"),
-            feedback_data.tipo_feedback,
-            data_formatada
+    # The feedback, its counters, the notification and the email to the
+    # collaborator are written together
+    async def record(session):
+        await db.feedbacks.insert_one(dict(feedback), session=session)
+        await apply_feedback_change(db, None, feedback, session=session)
+        await create_notification(
+            feedback_data.colaborador_id,
+            "novo_feedback",
+            "Novo Feedback Recebido",
+            f"Você recebeu um novo feedback do tipo {feedback_data.tipo_feedback}",
+            entidade_id=feedback["id"],
+            session=session
         )
-    
-    feedback["colaborador_nome"] = colaborador.get("nome")
-    feedback["gestor_nome"] = user.get("nome")
+        if colaborador.get("email"):
+            assunto, html, substituicoes = new_feedback_email(
+                colaborador.get("nome", "Colaborador"),
+                user.get("nome", "Gestor"),
+                feedback_data.tipo_feedback,
+                datetime.now(timezone.utc).strftime("%d/%m/%Y")
+            )
+            await enqueue_email(
+                db, colaborador["email"], assunto, html, "novo_feedback",
+                entidade_id=feedback["id"], substituicoes=substituicoes, session=session
+            )
+    
+    await run_in_transaction(db, record)
     
     return FeedbackResponse(**feedback)
 
 @api_router.get("/feedbacks", response_model=List[FeedbackResponse])
 async def list_feedbacks(
-    colaborador_id: Optional[str] = None,
-    gestor_id: Optional[str] = None,
-    time_id: Optional[str] = None,
-    tipo_feedback: Optional[str] = None,
-    status_feedback: Optional[str] = None,
-    data_inicio: Optional[str] = None,
-    data_fim: Optional[str] = None,
-    com_plano: Optional[bool] = None,
-    user: dict = Depends(get_current_user)
+    response: Response,
+    filters: FeedbackFilters = Depends(),
+    page: PageParams = Depends(page_params()),
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    query = {}
+    query = await build_feedback_query(user, filters)
     
-    # Role-based filtering
-    if user["papel"] == "COLABORADOR":
-        query["colaborador_id"] = user["id"]
-    elif user["papel"] == "GESTOR":
-        # Gestors can see feedbacks they created or for their team
-        if not colaborador_id and not gestor_id:
-            team_members = await db.usuarios.find(
-                {"gestor_direto_id": user["id"]}, {"_id": 0, "id": 1}
-            ).to_list(100)
-            member_ids = [m["id"] for m in team_members]
-            member_ids.append(user["id"])
-            query["$or"] = [
-                {"gestor_id": user["id"]},
-                {"colaborador_id": {"$in": member_ids}}
-            ]
+    async def attach_names(feedbacks: list):
+        await attach_feedback_names(loaders, feedbacks)
     
-    if colaborador_id:
-        query["colaborador_id"] = colaborador_id
-    if gestor_id:
-        query["gestor_id"] = gestor_id
-    if tipo_feedback:
-        query["tipo_feedback"] = tipo_feedback
-    if status_feedback:
-        query["status_feedback"] = status_feedback
-    if data_inicio:
-        query["data_feedback"] = {"$gte": data_inicio}
-    if data_fim:
-        if "data_feedback" in query:
-            query["data_feedback"]["$lte"] = data_fim
-        else:
-            query["data_feedback"] = {"$lte": data_fim}
-    
-    # Filter by team
-    if time_id:
-        team_users = await db.usuarios.find({"time_id": time_id}, {"_id": 0, "id": 1}).to_list(100)
-        user_ids = [u["id"] for u in team_users]
-        query["colaborador_id"] = {"$in": user_ids}
-    
-    feedbacks = await db.feedbacks.find(query, {"_id": 0}).sort("data_feedback", -1).to_list(1000)
-    
-    # Filter by action plan existence
-    if com_plano is not None:
-        feedback_ids_with_plan = set()
-        plans = await db.planos_acao.find({}, {"_id": 0, "feedback_id": 1}).to_list(1000)
-        feedback_ids_with_plan = {p["feedback_id"] for p in plans}
-        
-        if com_plano:
-            feedbacks = [f for f in feedbacks if f["id"] in feedback_ids_with_plan]
-        else:
-            feedbacks = [f for f in feedbacks if f["id"] not in feedback_ids_with_plan]
-    
-    # Batch fetch user names to avoid N+1 queries
-    if feedbacks:
-        user_ids = set()
-        for f in feedbacks:
-            user_ids.add(f["colaborador_id"])
-            user_ids.add(f["gestor_id"])
-        
-        users = await db.usuarios.find({"id": {"$in": list(user_ids)}}, {"_id": 0, "id": 1, "nome": 1}).to_list(len(user_ids))
-        user_map = {u["id"]: u.get("nome") for u in users}
-        
-        for feedback in feedbacks:
-            feedback["colaborador_nome"] = user_map.get(feedback["colaborador_id"])
-            feedback["gestor_nome"] = user_map.get(feedback["gestor_id"])
-    
-    return [FeedbackResponse(**f) for f in feedbacks]
+    # Newest first; id breaks ties so pages never overlap or skip
+    return await paginate(
+        db.feedbacks, query, [("data_feedback", -1), ("id", -1)], page, response,
+        FeedbackResponse, {"_id": 0}, attach_names
+    )
 
 @api_router.get("/feedbacks/{feedback_id}", response_model=FeedbackResponse)
-async def get_feedback(feedback_id: str, user: dict = Depends(get_current_user)):
-    feedback = await db.feedbacks.find_one({"id": feedback_id}, {"_id": 0})
+async def get_feedback(
+    feedback_id: str,
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    # Feedbacks outside the caller's scope are reported as not found
+    feedback = await db.feedbacks.find_one(
+        await policy.compile(user, "feedbacks", {"id": feedback_id}), {"_id": 0}
+    )
     if not feedback:
         raise HTTPException(status_code=404, detail="Feedback não encontrado")
     
-    # Check permissions
-    if user["papel"] == "COLABORADOR" and feedback["colaborador_id"] != user["id"]:
-        raise HTTPException(status_code=403, detail="Acesso negado")
-    
-    colab = await db.usuarios.find_one({"id": feedback["colaborador_id"]}, {"_id": 0, "nome": 1})
-    gestor = await db.usuarios.find_one({"id": feedback["gestor_id"]}, {"_id": 0, "nome": 1})
-    feedback["colaborador_nome"] = colab.get("nome") if colab else None
-    feedback["gestor_nome"] = gestor.get("nome") if gestor else None
+    await attach_feedback_names(loaders, [feedback])
     
     return FeedbackResponse(**feedback)
 
 @api_router.put("/feedbacks/{feedback_id}", response_model=FeedbackResponse)
-async def update_feedback(feedback_id: str, feedback_data: FeedbackUpdate, user: dict = Depends(require_gestor_or_admin)):
-    feedback = await db.feedbacks.find_one({"id": feedback_id}, {"_id": 0})
-    if not feedback:
-        raise HTTPException(status_code=404, detail="Feedback não encontrado")
-    
-    # Check if user is the creator or admin
-    if user["papel"] != "ADMIN" and feedback["gestor_id"] != user["id"]:
-        raise HTTPException(status_code=403, detail="Acesso negado")
-    
+async def update_feedback(
+    feedback_id: str,
+    feedback_data: FeedbackUpdate,
+    user: dict = Depends(require_gestor_or_admin),
+    loaders: Loaders = Depends(get_loaders)
+):
     update_dict = {k: v for k, v in feedback_data.model_dump().items() if v is not None}
     if not update_dict:
         raise HTTPException(status_code=400, detail="Nenhum campo para atualizar")
     
-    await db.feedbacks.update_one({"id": feedback_id}, {"$set": update_dict})
-    await update_feedback_status(feedback_id)
+    # Only the creator or an admin may edit: the check is part of the filter
+    query = {"id": feedback_id}
+    if user["papel"] != "ADMIN":
+        query["gestor_id"] = user["id"]
     
-    updated = await db.feedbacks.find_one({"id": feedback_id}, {"_id": 0})
+    # Fields and derived status are written in one atomic update; the
+    # previous document comes back with it for the dashboard counters
+    now = datetime.now(timezone.utc)
+    feedback = await db.feedbacks.find_one_and_update(
+        query, feedback_update_pipeline(update_dict, now), {"_id": 0}
+    )
+    if not feedback:
+        if await db.feedbacks.count_documents({"id": feedback_id}, limit=1):
+            raise HTTPException(status_code=403, detail="Acesso negado")
+        raise HTTPException(status_code=404, detail="Feedback não encontrado")
+    
+    updated = {**feedback, **update_dict}
+    updated["status_feedback"] = derive_feedback_status(updated, now)
+    await apply_feedback_change(db, feedback, updated)
+    loaders.feedbacks.clear(feedback_id)
     
-    colab = await db.usuarios.find_one({"id": updated["colaborador_id"]}, {"_id": 0, "nome": 1})
-    gestor = await db.usuarios.find_one({"id": updated["gestor_id"]}, {"_id": 0, "nome": 1})
-    updated["colaborador_nome"] = colab.get("nome") if colab else None
-    updated["gestor_nome"] = gestor.get("nome") if gestor else None
+    await attach_feedback_names(loaders, [updated])
     
     return FeedbackResponse(**updated)
 
 @api_router.post("/feedbacks/{feedback_id}/acknowledge")
-async def acknowledge_feedback(feedback_id: str, user: dict = Depends(get_current_user)):
-    feedback = await db.feedbacks.find_one({"id": feedback_id}, {"_id": 0})
+async def acknowledge_feedback(
+    feedback_id: str,
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    feedback = await loaders.feedbacks.load(feedback_id)
     if not feedback:
         raise HTTPException(status_code=404, detail="Feedback não encontrado")
     
     if feedback["colaborador_id"] != user["id"]:
         raise HTTPException(status_code=403, detail="Apenas o colaborador pode confirmar ciência")
     
-    await db.feedbacks.update_one(
-        {"id": feedback_id},
-        {"$set": {
-            "ciencia_colaborador": True,
-            "data_ciencia": datetime.now(timezone.utc).isoformat(),
-            "status_feedback": "Em dia"
-        }}
-    )
+    ciencia = {
+        "ciencia_colaborador": True,
+        "data_ciencia": datetime.now(timezone.utc).isoformat(),
+        "status_feedback": "Em dia"
+    }
+    await db.feedbacks.update_one({"id": feedback_id}, {"$set": ciencia})
+    await apply_feedback_change(db, feedback, {**feedback, **ciencia})
+    loaders.feedbacks.clear(feedback_id)
     
     return {"message": "Ciência confirmada com sucesso"}
 
 @api_router.delete("/feedbacks/{feedback_id}")
 async def delete_feedback(feedback_id: str, user: dict = Depends(require_admin)):
-    result = await db.feedbacks.delete_one({"id": feedback_id})
-    if result.deleted_count == 0:
+    # Plans, items, check-ins and notifications go with the feedback
+    deleted = await delete_with_cascade(db, feedback_ids=[feedback_id])
+    if not deleted.get("feedbacks"):
         raise HTTPException(status_code=404, detail="Feedback não encontrado")
     
-    # Delete related action plans and items
-    plans = await db.planos_acao.find({"feedback_id": feedback_id}, {"_id": 0, "id": 1}).to_list(100)
-    for plan in plans:
-        await db.itens_plano.delete_many({"plano_de_acao_id": plan["id"]})
-        await db.checkins.delete_many({"plano_de_acao_id": plan["id"]})
-    await db.planos_acao.delete_many({"feedback_id": feedback_id})
-    
-    return {"message": "Feedback removido com sucesso"}
+    return {"message": "Feedback removido com sucesso", "removidos": deleted}
 
 # ==================== ACTION PLAN ENDPOINTS ====================
 
 @api_router.post("/action-plans", response_model=ActionPlanResponse)
-async def create_action_plan(plan_data: ActionPlanCreate, user: dict = Depends(require_gestor_or_admin)):
+async def create_action_plan(
+    plan_data: ActionPlanCreate,
+    user: dict = Depends(require_gestor_or_admin),
+    loaders: Loaders = Depends(get_loaders)
+):
     # Verify feedback exists
-    feedback = await db.feedbacks.find_one({"id": plan_data.feedback_id}, {"_id": 0})
+    feedback = await loaders.feedbacks.load(plan_data.feedback_id)
     if not feedback:
         raise HTTPException(status_code=404, detail="Feedback não encontrado")
     
     plan = {
         "id": str(uuid.uuid4()),
         "feedback_id": plan_data.feedback_id,
+        "colaborador_id": feedback["colaborador_id"],
+        "gestor_id": feedback["gestor_id"],
         "objetivo": plan_data.objetivo,
         "prazo_final": plan_data.prazo_final,
         "responsavel": plan_data.responsavel,
         "status": "Não iniciado",
         "progresso_percentual": 0,
+        "itens_total": 0,
+        "itens_concluidos": 0,
         "criado_em": datetime.now(timezone.utc).isoformat()
     }
     
     await db.planos_acao.insert_one(plan)
     del plan["_id"]
+    await db.feedbacks.update_one({"id": plan_data.feedback_id}, {"$inc": {"planos_count": 1}})
+    await apply_plan_change(db, None, plan)
     
     # Notify collaborator
     await create_notification(
         feedback["colaborador_id"],
         "novo_plano",
         "Novo Plano de Ação",
-        f"Um plano de ação foi criado para o seu feedback"
+        f"Um plano de ação foi criado para o seu feedback",
+        entidade_id=plan["id"]
     )
     
     return ActionPlanResponse(**plan)
 
 @api_router.get("/action-plans", response_model=List[ActionPlanResponse])
 async def list_action_plans(
+    response: Response,
     feedback_id: Optional[str] = None,
+    colaborador_id: Optional[str] = None,
     status: Optional[str] = None,
     responsavel: Optional[str] = None,
+    page: PageParams = Depends(page_params()),
     user: dict = Depends(get_current_user)
 ):
     query = {}
     
     if feedback_id:
         query["feedback_id"] = feedback_id
+    if colaborador_id:
+        query["colaborador_id"] = colaborador_id
+    now = datetime.now(timezone.utc)
     if status:
-        query["status"] = status
+        query.update(plan_status_filter(status, now))
     if responsavel:
         query["responsavel"] = responsavel
     
-    # Filter based on role
-    if user["papel"] == "COLABORADOR":
-        user_feedbacks = await db.feedbacks.find(
-            {"colaborador_id": user["id"]}, {"_id": 0, "id": 1}
-        ).to_list(100)
-        feedback_ids = [f["id"] for f in user_feedbacks]
-        query["feedback_id"] = {"$in": feedback_ids}
-    
-    plans = await db.planos_acao.find(query, {"_id": 0}).sort("prazo_final", 1).to_list(1000)
-    
-    # Update statuses based on deadlines
-    for plan in plans:
-        await update_action_plan_progress(plan["id"])
+    query = await policy.compile(user, "planos_acao", query)
     
-    # Refresh data
-    plans = await db.planos_acao.find(query, {"_id": 0}).sort("prazo_final", 1).to_list(1000)
+    async def apply_deadlines(plans: list):
+        for plan in plans:
+            with_deadline_status(plan, now)
     
-    return [ActionPlanResponse(**p) for p in plans]
+    return await paginate(
+        db.planos_acao, query, [("prazo_final", 1), ("id", 1)], page, response,
+        ActionPlanResponse, {"_id": 0}, apply_deadlines
+    )
 
 @api_router.get("/action-plans/{plan_id}", response_model=ActionPlanResponse)
 async def get_action_plan(plan_id: str, user: dict = Depends(get_current_user)):
-    plan = await db.planos_acao.find_one({"id": plan_id}, {"_id": 0})
+    plan = await db.planos_acao.find_one(
+        await policy.compile(user, "planos_acao", {"id": plan_id}), {"_id": 0}
+    )
     if not plan:
         raise HTTPException(status_code=404, detail="Plano de ação não encontrado")
     
-    await update_action_plan_progress(plan_id)
-    plan = await db.planos_acao.find_one({"id": plan_id}, {"_id": 0})
-    
-    return ActionPlanResponse(**plan)
+    return ActionPlanResponse(**with_deadline_status(plan, datetime.now(timezone.utc)))
 
 @api_router.put("/action-plans/{plan_id}", response_model=ActionPlanResponse)
 async def update_action_plan(plan_id: str, plan_data: ActionPlanUpdate, user: dict = Depends(require_gestor_or_admin)):
@@ -788,31 +1276,62 @@ async def update_action_plan(plan_id: str, plan_data: ActionPlanUpdate, user: di
     if not update_dict:
         raise HTTPException(status_code=400, detail="Nenhum campo para atualizar")
     
-    result = await db.planos_acao.update_one({"id": plan_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    previous = await db.planos_acao.find_one_and_update(
+        {"id": plan_id}, {"$set": update_dict}, {"_id": 0}
+    )
+    if not previous:
         raise HTTPException(status_code=404, detail="Plano de ação não encontrado")
     
-    updated = await db.planos_acao.find_one({"id": plan_id}, {"_id": 0})
+    updated = {**previous, **update_dict}
+    await apply_plan_change(db, previous, updated)
     return ActionPlanResponse(**updated)
 
 @api_router.delete("/action-plans/{plan_id}")
 async def delete_action_plan(plan_id: str, user: dict = Depends(require_gestor_or_admin)):
-    result = await db.planos_acao.delete_one({"id": plan_id})
-    if result.deleted_count == 0:
+    # Items, check-ins and notifications go with the plan
+    deleted = await delete_with_cascade(db, plan_ids=[plan_id])
+    if not deleted.get("planos_acao"):
         raise HTTPException(status_code=404, detail="Plano de ação não encontrado")
     
-    # Delete related items and check-ins
-    await db.itens_plano.delete_many({"plano_de_acao_id": plan_id})
-    await db.checkins.delete_many({"plano_de_acao_id": plan_id})
-    
-    return {"message": "Plano de ação removido com sucesso"}
+    return {"message": "Plano de ação removido com sucesso", "removidos": deleted}
 
 # ==================== ACTION PLAN ITEM ENDPOINTS ====================
 
+async def paginate_plan_children(
+    resource: str,
+    plano_de_acao_id: str,
+    user: dict,
+    sort: list,
+    page: PageParams,
+    response: Response,
+    model,
+    enrich=None
+):
+    """
+    List the items or check-ins of a plan. Whether the caller may see the
+    plan is checked concurrently with the page read, so it adds no round trip.
+    """
+    parent = await policy.parent_filter(user, resource, plano_de_acao_id)
+    listing = paginate(
+        db[resource], policy.child_filter(resource, plano_de_acao_id), sort, page, response,
+        model, {"_id": 0}, enrich
+    )
+    if parent is None:
+        return await listing
+    
+    visible, result = await asyncio.gather(db.planos_acao.count_documents(parent, limit=1), listing)
+    if not visible:
+        raise HTTPException(status_code=404, detail="Plano de ação não encontrado")
+    return result
+
 @api_router.post("/action-plan-items", response_model=ActionPlanItemResponse)
-async def create_action_plan_item(item_data: ActionPlanItemCreate, user: dict = Depends(get_current_user)):
+async def create_action_plan_item(
+    item_data: ActionPlanItemCreate,
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
     # Verify plan exists
-    plan = await db.planos_acao.find_one({"id": item_data.plano_de_acao_id}, {"_id": 0})
+    plan = await loaders.planos_acao.load(item_data.plano_de_acao_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plano de ação não encontrado")
     
@@ -827,58 +1346,59 @@ async def create_action_plan_item(item_data: ActionPlanItemCreate, user: dict =
     await db.itens_plano.insert_one(item)
     del item["_id"]
     
-    await update_action_plan_progress(item_data.plano_de_acao_id)
+    await apply_item_delta(item_data.plano_de_acao_id, 1, 0)
     
     return ActionPlanItemResponse(**item)
 
 @api_router.get("/action-plan-items", response_model=List[ActionPlanItemResponse])
 async def list_action_plan_items(
+    response: Response,
     plano_de_acao_id: str,
+    page: PageParams = Depends(page_params()),
     user: dict = Depends(get_current_user)
 ):
-    items = await db.itens_plano.find({"plano_de_acao_id": plano_de_acao_id}, {"_id": 0}).to_list(100)
-    return [ActionPlanItemResponse(**i) for i in items]
+    return await paginate_plan_children(
+        "itens_plano", plano_de_acao_id, user, [("_id", 1)], page, response, ActionPlanItemResponse
+    )
 
 @api_router.put("/action-plan-items/{item_id}", response_model=ActionPlanItemResponse)
 async def update_action_plan_item(item_id: str, item_data: ActionPlanItemUpdate, user: dict = Depends(get_current_user)):
-    item = await db.itens_plano.find_one({"id": item_id}, {"_id": 0})
-    if not item:
-        raise HTTPException(status_code=404, detail="Item não encontrado")
-    
     update_dict = {k: v for k, v in item_data.model_dump().items() if v is not None}
     if not update_dict:
         raise HTTPException(status_code=400, detail="Nenhum campo para atualizar")
     
-    await db.itens_plano.update_one({"id": item_id}, {"$set": update_dict})
+    # The previous state tells exactly how this update moved the plan's counters
+    item = await db.itens_plano.find_one_and_update({"id": item_id}, {"$set": update_dict}, {"_id": 0})
+    if not item:
+        raise HTTPException(status_code=404, detail="Item não encontrado")
     
-    # Update plan progress
-    await update_action_plan_progress(item["plano_de_acao_id"])
+    if "concluido" in update_dict:
+        done_delta = int(update_dict["concluido"]) - int(bool(item.get("concluido")))
+        if done_delta:
+            await apply_item_delta(item["plano_de_acao_id"], 0, done_delta)
     
-    updated = await db.itens_plano.find_one({"id": item_id}, {"_id": 0})
-    return ActionPlanItemResponse(**updated)
+    return ActionPlanItemResponse(**{**item, **update_dict})
 
 @api_router.delete("/action-plan-items/{item_id}")
 async def delete_action_plan_item(item_id: str, user: dict = Depends(get_current_user)):
-    item = await db.itens_plano.find_one({"id": item_id}, {"_id": 0})
+    item = await db.itens_plano.find_one_and_delete({"id": item_id}, {"_id": 0})
     if not item:
         raise HTTPException(status_code=404, detail="Item não encontrado")
     
-    plan_id = item["plano_de_acao_id"]
-    
-    result = await db.itens_plano.delete_one({"id": item_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Item não encontrado")
-    
-    await update_action_plan_progress(plan_id)
+    await apply_item_delta(item["plano_de_acao_id"], -1, -int(bool(item.get("concluido"))))
     
     return {"message": "Item removido com sucesso"}
 
 # ==================== CHECK-IN ENDPOINTS ====================
 
 @api_router.post("/checkins", response_model=CheckInResponse)
-async def create_checkin(checkin_data: CheckInCreate, user: dict = Depends(get_current_user)):
+async def create_checkin(
+    checkin_data: CheckInCreate,
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
     # Verify plan exists
-    plan = await db.planos_acao.find_one({"id": checkin_data.plano_de_acao_id}, {"_id": 0})
+    plan = await loaders.planos_acao.load(checkin_data.plano_de_acao_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plano de ação não encontrado")
     
@@ -900,30 +1420,32 @@ async def create_checkin(checkin_data: CheckInCreate, user: dict = Depends(get_c
 
 @api_router.get("/checkins", response_model=List[CheckInResponse])
 async def list_checkins(
+    response: Response,
     plano_de_acao_id: str,
-    user: dict = Depends(get_current_user)
+    page: PageParams = Depends(page_params()),
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    checkins = await db.checkins.find(
-        {"plano_de_acao_id": plano_de_acao_id}, {"_id": 0}
-    ).sort("data_checkin", -1).to_list(100)
-    
-    for checkin in checkins:
-        registrador = await db.usuarios.find_one(
-            {"id": checkin["registrado_por_id"]}, {"_id": 0, "nome": 1}
-        )
-        checkin["registrado_por_nome"] = registrador.get("nome") if registrador else None
+    async def attach_names(checkins: list):
+        await attach_user_names(loaders, checkins, registrado_por_nome="registrado_por_id")
     
-    return [CheckInResponse(**c) for c in checkins]
+    return await paginate_plan_children(
+        "checkins", plano_de_acao_id, user, [("data_checkin", -1), ("id", -1)], page, response,
+        CheckInResponse, attach_names
+    )
 
 # ==================== NOTIFICATION ENDPOINTS ====================
 
 @api_router.get("/notifications", response_model=List[NotificationResponse])
-async def list_notifications(user: dict = Depends(get_current_user)):
-    notifications = await db.notificacoes.find(
-        {"usuario_id": user["id"]}, {"_id": 0}
-    ).sort("criado_em", -1).to_list(50)
-    
-    return [NotificationResponse(**n) for n in notifications]
+async def list_notifications(
+    response: Response,
+    page: PageParams = Depends(page_params(50)),
+    user: dict = Depends(get_current_user)
+):
+    return await paginate(
+        db.notificacoes, {"usuario_id": user["id"]}, [("criado_em", -1), ("id", -1)], page, response,
+        NotificationResponse, {"_id": 0}
+    )
 
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, user: dict = Depends(get_current_user)):
@@ -946,26 +1468,31 @@ async def mark_all_notifications_read(user: dict = Depends(get_current_user)):
 # ==================== DASHBOARD ENDPOINTS ====================
 
 @api_router.get("/dashboard/gestor")
-async def get_gestor_dashboard(user: dict = Depends(require_gestor_or_admin)):
+async def get_gestor_dashboard(
+    user: dict = Depends(require_gestor_or_admin),
+    loaders: Loaders = Depends(get_loaders)
+):
     now = datetime.now(timezone.utc)
     seven_days = (now + timedelta(days=7)).isoformat()
     thirty_days = (now + timedelta(days=30)).isoformat()
     
     # Get team members
     if user["papel"] == "ADMIN":
-        team_members = await db.usuarios.find({"papel": "COLABORADOR"}, {"_id": 0}).to_list(100)
+        if user_directory.ready:
+            member_ids = user_directory.ids_with_role("COLABORADOR")
+        else:
+            team_members = await db.usuarios.find({"papel": "COLABORADOR"}, {"_id": 0, "id": 1}).to_list(None)
+            member_ids = [m["id"] for m in team_members]
     else:
-        team_members = await db.usuarios.find(
-            {"gestor_direto_id": user["id"]}, {"_id": 0}
-        ).to_list(100)
+        member_ids = await org_tree.reports_of(user["id"])
     
-    member_ids = [m["id"] for m in team_members]
+    # Per-collaborator tallies from the materialized counters
+    member_counters = await get_colaborador_counters(db, member_ids)
     
     # Feedbacks atrasados
-    feedbacks_atrasados = await db.feedbacks.count_documents({
-        "colaborador_id": {"$in": member_ids},
-        "status_feedback": "Atrasado"
-    })
+    feedbacks_atrasados = sum(
+        c.get("feedbacks_por_status", {}).get("Atrasado", 0) for c in member_counters
+    )
     
     # Feedbacks vencendo em 7 dias
     feedbacks_7_dias = await db.feedbacks.count_documents({
@@ -991,28 +1518,20 @@ async def get_gestor_dashboard(user: dict = Depends(require_gestor_or_admin)):
     colaboradores_sem_feedback = len(member_ids) - len(members_with_recent_feedback)
     
     # Planos de ação atrasados
-    planos_atrasados = await db.planos_acao.count_documents({
-        "status": "Atrasado"
-    })
+    empresa = await get_counters(db, EMPRESA_SCOPE)
+    planos_atrasados = empresa.get("planos_por_status", {}).get("Atrasado", 0)
     
     # Aguardando ciência
-    aguardando_ciencia = await db.feedbacks.count_documents({
-        "colaborador_id": {"$in": member_ids},
-        "status_feedback": "Aguardando ciência"
-    })
+    aguardando_ciencia = sum(
+        c.get("feedbacks_por_status", {}).get("Aguardando ciência", 0) for c in member_counters
+    )
     
     # Recent feedbacks
     recent_feedbacks = await db.feedbacks.find(
         {"colaborador_id": {"$in": member_ids}}, {"_id": 0}
     ).sort("data_feedback", -1).limit(5).to_list(5)
     
-    # Batch fetch user names
-    if recent_feedbacks:
-        user_ids = list(set(f["colaborador_id"] for f in recent_feedbacks))
-        users = await db.usuarios.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "nome": 1}).to_list(len(user_ids))
-        user_map = {u["id"]: u.get("nome") for u in users}
-        for feedback in recent_feedbacks:
-            feedback["colaborador_nome"] = user_map.get(feedback["colaborador_id"])
+    await attach_feedback_names(loaders, recent_feedbacks)
     
     return {
         "feedbacks_atrasados": feedbacks_atrasados,
@@ -1026,31 +1545,22 @@ async def get_gestor_dashboard(user: dict = Depends(require_gestor_or_admin)):
     }
 
 @api_router.get("/dashboard/colaborador")
-async def get_colaborador_dashboard(user: dict = Depends(get_current_user)):
+async def get_colaborador_dashboard(
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    counters = await get_counters(db, f"colaborador:{user['id']}")
+    planos_por_status = counters.get("planos_por_status", {})
+    
     # Total feedbacks received
-    total_feedbacks = await db.feedbacks.count_documents({"colaborador_id": user["id"]})
+    total_feedbacks = counters.get("feedbacks_total", 0)
     
     # Pending acknowledgment
-    pendente_ciencia = await db.feedbacks.count_documents({
-        "colaborador_id": user["id"],
-        "ciencia_colaborador": False
-    })
+    pendente_ciencia = counters.get("aguardando_ciencia", 0)
     
     # Active action plans
-    user_feedbacks = await db.feedbacks.find(
-        {"colaborador_id": user["id"]}, {"_id": 0, "id": 1}
-    ).to_list(100)
-    feedback_ids = [f["id"] for f in user_feedbacks]
-    
-    planos_ativos = await db.planos_acao.count_documents({
-        "feedback_id": {"$in": feedback_ids},
-        "status": {"$in": ["Não iniciado", "Em andamento"]}
-    })
-    
-    planos_atrasados = await db.planos_acao.count_documents({
-        "feedback_id": {"$in": feedback_ids},
-        "status": "Atrasado"
-    })
+    planos_ativos = planos_por_status.get("Não iniciado", 0) + planos_por_status.get("Em andamento", 0)
+    planos_atrasados = planos_por_status.get("Atrasado", 0)
     
     # Last feedback
     ultimo_feedback = await db.feedbacks.find_one(
@@ -1067,13 +1577,7 @@ async def get_colaborador_dashboard(user: dict = Depends(get_current_user)):
         {"colaborador_id": user["id"]}, {"_id": 0}
     ).sort("data_feedback", -1).limit(5).to_list(5)
     
-    # Batch fetch gestor names
-    if recent_feedbacks:
-        gestor_ids = list(set(f["gestor_id"] for f in recent_feedbacks))
-        gestores = await db.usuarios.find({"id": {"$in": gestor_ids}}, {"_id": 0, "id": 1, "nome": 1}).to_list(len(gestor_ids))
-        gestor_map = {g["id"]: g.get("nome") for g in gestores}
-        for feedback in recent_feedbacks:
-            feedback["gestor_nome"] = gestor_map.get(feedback["gestor_id"])
+    await attach_feedback_names(loaders, recent_feedbacks)
     
     return {
         "total_feedbacks": total_feedbacks,
@@ -1086,51 +1590,70 @@ async def get_colaborador_dashboard(user: dict = Depends(get_current_user)):
 
 @api_router.get("/dashboard/admin")
 async def get_admin_dashboard(user: dict = Depends(require_admin)):
-    # Total users by role
-    total_usuarios = await db.usuarios.count_documents({})
-    total_admins = await db.usuarios.count_documents({"papel": "ADMIN"})
-    total_gestores = await db.usuarios.count_documents({"papel": "GESTOR"})
-    total_colaboradores = await db.usuarios.count_documents({"papel": "COLABORADOR"})
+    # One aggregation per user/team collection plus the company counters, run concurrently
+    usuarios_result, total_times, empresa = await asyncio.gather(
+        db.usuarios.aggregate([
+            {"$group": {"_id": "$papel", "count": {"$sum": 1}}}
+        ]).to_list(None),
+        db.times.count_documents({}),
+        get_counters(db, EMPRESA_SCOPE)
+    )
     
-    # Total teams
-    total_times = await db.times.count_documents({})
+    # Total users by role
+    usuarios_por_papel = {r["_id"]: r["count"] for r in usuarios_result}
     
     # Total feedbacks
-    total_feedbacks = await db.feedbacks.count_documents({})
-    feedbacks_atrasados = await db.feedbacks.count_documents({"status_feedback": "Atrasado"})
-    feedbacks_aguardando = await db.feedbacks.count_documents({"status_feedback": "Aguardando ciência"})
+    feedbacks_por_status = empresa.get("feedbacks_por_status", {})
+    tipos = empresa.get("feedbacks_por_tipo", {})
     
     # Total action plans
-    total_planos = await db.planos_acao.count_documents({})
-    planos_atrasados = await db.planos_acao.count_documents({"status": "Atrasado"})
-    planos_concluidos = await db.planos_acao.count_documents({"status": "Concluído"})
+    planos_por_status = empresa.get("planos_por_status", {})
     
     # Feedbacks by type
-    feedbacks_por_tipo = {}
-    for tipo in FEEDBACK_TYPES:
-        count = await db.feedbacks.count_documents({"tipo_feedback": tipo})
-        feedbacks_por_tipo[tipo] = count
+    feedbacks_por_tipo = {tipo: tipos.get(tipo, 0) for tipo in FEEDBACK_TYPES}
     
     return {
-        "total_usuarios": total_usuarios,
-        "total_admins": total_admins,
-        "total_gestores": total_gestores,
-        "total_colaboradores": total_colaboradores,
+        "total_usuarios": sum(usuarios_por_papel.values()),
+        "total_admins": usuarios_por_papel.get("ADMIN", 0),
+        "total_gestores": usuarios_por_papel.get("GESTOR", 0),
+        "total_colaboradores": usuarios_por_papel.get("COLABORADOR", 0),
         "total_times": total_times,
-        "total_feedbacks": total_feedbacks,
-        "feedbacks_atrasados": feedbacks_atrasados,
-        "feedbacks_aguardando": feedbacks_aguardando,
-        "total_planos": total_planos,
-        "planos_atrasados": planos_atrasados,
-        "planos_concluidos": planos_concluidos,
+        "total_feedbacks": empresa.get("feedbacks_total", 0),
+        "feedbacks_atrasados": feedbacks_por_status.get("Atrasado", 0),
+        "feedbacks_aguardando": feedbacks_por_status.get("Aguardando ciência", 0),
+        "total_planos": empresa.get("planos_total", 0),
+        "planos_atrasados": planos_por_status.get("Atrasado", 0),
+        "planos_concluidos": planos_por_status.get("Concluído", 0),
         "feedbacks_por_tipo": feedbacks_por_tipo
     }
 
 # ==================== COLLABORATOR PROFILE ====================
 
+def recurring_points_pipeline(query: dict, top: int = 5) -> List[dict]:
+    """The most frequent strengths and improvements across every matching feedback"""
+    def most_frequent(field: str) -> List[dict]:
+        return [
+            {"$unwind": f"${field}"},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": top},
+        ]
+    return [
+        {"$match": query},
+        {"$project": {"_id": 0, "pontos_fortes": 1, "pontos_melhoria": 1}},
+        {"$facet": {
+            "pontos_fortes": most_frequent("pontos_fortes"),
+            "pontos_melhoria": most_frequent("pontos_melhoria"),
+        }},
+    ]
+
 @api_router.get("/collaborator-profile/{colaborador_id}")
-async def get_collaborator_profile(colaborador_id: str, user: dict = Depends(get_current_user)):
-    colaborador = await db.usuarios.find_one({"id": colaborador_id}, {"_id": 0, "password": 0})
+async def get_collaborator_profile(
+    colaborador_id: str,
+    user: dict = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
+    colaborador = await loaders.usuarios.load(colaborador_id)
     if not colaborador:
         raise HTTPException(status_code=404, detail="Colaborador não encontrado")
     
@@ -1138,50 +1661,35 @@ async def get_collaborator_profile(colaborador_id: str, user: dict = Depends(get
     if user["papel"] == "COLABORADOR" and user["id"] != colaborador_id:
         raise HTTPException(status_code=403, detail="Acesso negado")
     
-    # Get team info
-    team = None
-    if colaborador.get("time_id"):
-        team = await db.times.find_one({"id": colaborador["time_id"]}, {"_id": 0})
+    async def optional(loader, key):
+        return await loader.load(key) if key else None
     
-    # Get manager info
-    gestor = None
-    if colaborador.get("gestor_direto_id"):
-        gestor = await db.usuarios.find_one(
-            {"id": colaborador["gestor_direto_id"]}, {"_id": 0, "password": 0}
-        )
+    feedback_query, plan_query = await asyncio.gather(
+        policy.compile(user, "feedbacks", {"colaborador_id": colaborador_id}),
+        policy.compile(user, "planos_acao", {"colaborador_id": colaborador_id})
+    )
     
-    # Get all feedbacks
-    feedbacks = await db.feedbacks.find(
-        {"colaborador_id": colaborador_id}, {"_id": 0}
-    ).sort("data_feedback", -1).to_list(100)
-    
-    # Batch fetch gestor names
-    if feedbacks:
-        gestor_ids = list(set(f["gestor_id"] for f in feedbacks))
-        gestores = await db.usuarios.find({"id": {"$in": gestor_ids}}, {"_id": 0, "id": 1, "nome": 1}).to_list(len(gestor_ids))
-        gestor_map = {g["id"]: g.get("nome") for g in gestores}
-        for feedback in feedbacks:
-            feedback["gestor_nome"] = gestor_map.get(feedback["gestor_id"])
-    
-    # Aggregate recurring strengths and improvements
-    pontos_fortes = {}
-    pontos_melhoria = {}
-    
-    for fb in feedbacks:
-        for pf in fb.get("pontos_fortes", []):
-            pontos_fortes[pf] = pontos_fortes.get(pf, 0) + 1
-        for pm in fb.get("pontos_melhoria", []):
-            pontos_melhoria[pm] = pontos_melhoria.get(pm, 0) + 1
-    
-    # Sort by frequency
-    pontos_fortes_sorted = sorted(pontos_fortes.items(), key=lambda x: x[1], reverse=True)[:5]
-    pontos_melhoria_sorted = sorted(pontos_melhoria.items(), key=lambda x: x[1], reverse=True)[:5]
-    
-    # Get active action plans
-    feedback_ids = [f["id"] for f in feedbacks]
-    planos = await db.planos_acao.find(
-        {"feedback_id": {"$in": feedback_ids}}, {"_id": 0}
-    ).to_list(100)
+    # Team, manager, counts, recurring points and the first page of each list
+    # are independent; the manager stays cached for the gestor names below.
+    # The list sorts match GET /feedbacks and GET /action-plans, so the
+    # returned cursors continue there with colaborador_id=<id>&cursor=...
+    (
+        team, gestor, total_feedbacks, total_planos, recorrentes,
+        (feedbacks, feedbacks_cursor), (planos, planos_cursor)
+    ) = await asyncio.gather(
+        optional(loaders.times, colaborador.get("time_id")),
+        optional(loaders.usuarios, colaborador.get("gestor_direto_id")),
+        db.feedbacks.count_documents(feedback_query),
+        db.planos_acao.count_documents(plan_query),
+        db.feedbacks.aggregate(recurring_points_pipeline(feedback_query)).to_list(1),
+        fetch_page(db.feedbacks, feedback_query, [("data_feedback", -1), ("id", -1)], DEFAULT_PAGE_SIZE,
+                   projection={"_id": 0}),
+        fetch_page(db.planos_acao, plan_query, [("prazo_final", 1), ("id", 1)], DEFAULT_PAGE_SIZE,
+                   projection={"_id": 0})
+    )
+    
+    await attach_feedback_names(loaders, feedbacks)
+    recorrentes = recorrentes[0] if recorrentes else {}
     
     # Last and next feedback
     ultimo_feedback = feedbacks[0] if feedbacks else None
@@ -1192,14 +1700,101 @@ async def get_collaborator_profile(colaborador_id: str, user: dict = Depends(get
         "time": team,
         "gestor": gestor,
         "feedbacks": feedbacks,
-        "pontos_fortes_recorrentes": pontos_fortes_sorted,
-        "pontos_melhoria_recorrentes": pontos_melhoria_sorted,
+        "feedbacks_next_cursor": feedbacks_cursor,
+        "pontos_fortes_recorrentes": [[r["_id"], r["count"]] for r in recorrentes.get("pontos_fortes", [])],
+        "pontos_melhoria_recorrentes": [[r["_id"], r["count"]] for r in recorrentes.get("pontos_melhoria", [])],
         "planos_acao": planos,
+        "planos_next_cursor": planos_cursor,
         "ultimo_feedback": ultimo_feedback,
         "proximo_feedback": proximo_feedback,
-        "total_feedbacks": len(feedbacks)
+        "total_feedbacks": total_feedbacks,
+        "total_planos": total_planos
     }
 
+# ==================== EXPORTS ====================
+
+def export_response(tipo: str, format: str, collection, pipeline: list, columns: list) -> StreamingResponse:
+    """Stream an export aggregation as a CSV or NDJSON download"""
+    cursor = collection.aggregate(pipeline, batchSize=1000)
+    filename = f"{tipo}-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{format}"
+    if format == "csv":
+        content, media_type = stream_csv(cursor, columns), "text/csv; charset=utf-8"
+    else:
+        content, media_type = stream_ndjson(cursor), "application/x-ndjson"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.get("/exports/feedbacks")
+async def export_feedbacks(
+    background_tasks: BackgroundTasks,
+    format: str = Query("csv", pattern="^(csv|ndjson|xlsx)$"),
+    filters: FeedbackFilters = Depends(),
+    user: dict = Depends(require_admin)
+):
+    """
+    Export feedbacks with collaborator and manager names. CSV and NDJSON are
+    streamed; XLSX starts a background job and returns its handle.
+    """
+    pipeline = feedback_export_pipeline(await build_feedback_query(user, filters))
+    
+    if format == "xlsx":
+        job = await create_export_job(db, "feedbacks", user["id"])
+        background_tasks.add_task(run_xlsx_export, db, job["id"], "feedbacks", pipeline, FEEDBACK_COLUMNS)
+        return job
+    
+    return export_response("feedbacks", format, db.feedbacks, pipeline, FEEDBACK_COLUMNS)
+
+@api_router.get("/exports/action-plans")
+async def export_action_plans(
+    background_tasks: BackgroundTasks,
+    format: str = Query("csv", pattern="^(csv|ndjson|xlsx)$"),
+    status: Optional[str] = None,
+    responsavel: Optional[str] = None,
+    user: dict = Depends(require_admin)
+):
+    """
+    Export action plans with item completion and collaborator/manager names
+    """
+    query = {}
+    if status:
+        query.update(plan_status_filter(status, datetime.now(timezone.utc)))
+    if responsavel:
+        query["responsavel"] = responsavel
+    pipeline = plan_export_pipeline(query)
+    
+    if format == "xlsx":
+        job = await create_export_job(db, "action-plans", user["id"])
+        background_tasks.add_task(run_xlsx_export, db, job["id"], "planos_acao", pipeline, PLAN_COLUMNS)
+        return job
+    
+    return export_response("action-plans", format, db.planos_acao, pipeline, PLAN_COLUMNS)
+
+@api_router.get("/exports/jobs/{job_id}")
+async def get_export_job(job_id: str, user: dict = Depends(require_admin)):
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Exportação não encontrada")
+    return job
+
+@api_router.get("/exports/jobs/{job_id}/download")
+async def download_export(job_id: str, user: dict = Depends(require_admin)):
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Exportação não encontrada")
+    if job["status"] != "concluido":
+        raise HTTPException(status_code=409, detail="Exportação ainda não concluída")
+    if not Path(job["arquivo"]).exists():
+        raise HTTPException(status_code=410, detail="Arquivo de exportação não está mais disponível")
+    
+    return FileResponse(
+        job["arquivo"],
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=f"{job['tipo']}-{job['criado_em'][:10]}.xlsx"
+    )
+
 # ==================== SEED DATA ====================
 
 @api_router.post("/seed")
@@ -1264,7 +1859,7 @@ async def seed_data():
             "id": admin_id,
             "nome": "Ana Silva",
             "email": "admin@beeit.com.br",
-            "password": hash_password("admin123"),
+            "password": await hash_password("admin123"),
             "papel": "ADMIN",
             "time_id": None,
             "gestor_direto_id": None,
@@ -1275,7 +1870,7 @@ async def seed_data():
             "id": gestor1_id,
             "nome": "Carlos Santos",
             "email": "gestor@beeit.com.br",
-            "password": hash_password("gestor123"),
+            "password": await hash_password("gestor123"),
             "papel": "GESTOR",
             "time_id": times[0]["id"],
             "gestor_direto_id": None,
@@ -1286,7 +1881,7 @@ async def seed_data():
             "id": gestor2_id,
             "nome": "Maria Oliveira",
             "email": "maria.gestor@beeit.com.br",
-            "password": hash_password("gestor123"),
+            "password": await hash_password("gestor123"),
             "papel": "GESTOR",
             "time_id": times[1]["id"],
             "gestor_direto_id": None,
@@ -1297,7 +1892,7 @@ async def seed_data():
             "id": colab1_id,
             "nome": "João Pereira",
             "email": "colaborador@beeit.com.br",
-            "password": hash_password("colab123"),
+            "password": await hash_password("colab123"),
             "papel": "COLABORADOR",
             "time_id": times[0]["id"],
             "gestor_direto_id": gestor1_id,
@@ -1308,7 +1903,7 @@ async def seed_data():
             "id": colab2_id,
             "nome": "Fernanda Costa",
             "email": "fernanda@beeit.com.br",
-            "password": hash_password("colab123"),
+            "password": await hash_password("colab123"),
             "papel": "COLABORADOR",
             "time_id": times[0]["id"],
             "gestor_direto_id": gestor1_id,
@@ -1319,7 +1914,7 @@ async def seed_data():
             "id": colab3_id,
             "nome": "Pedro Almeida",
             "email": "pedro@beeit.com.br",
-            "password": hash_password("colab123"),
+            "password": await hash_password("colab123"),
             "papel": "COLABORADOR",
             "time_id": times[1]["id"],
             "gestor_direto_id": gestor2_id,
@@ -1329,6 +1924,8 @@ async def seed_data():
     ]
     
     await db.usuarios.insert_many(usuarios)
+    await bump_users_version(db)
+    await org_tree.invalidate()
     
     # Create feedbacks
     feedback1_id = str(uuid.uuid4())
@@ -1351,6 +1948,9 @@ async def seed_data():
             "ciencia_colaborador": True,
             "data_ciencia": (datetime.now(timezone.utc) - timedelta(days=14)).isoformat(),
             "confidencial": False,
+            "colaborador_nome": "João Pereira",
+            "gestor_nome": "Carlos Santos",
+            "planos_count": 1,
             "criado_em": (datetime.now(timezone.utc) - timedelta(days=15)).isoformat()
         },
         {
@@ -1369,6 +1969,9 @@ async def seed_data():
             "ciencia_colaborador": False,
             "data_ciencia": None,
             "confidencial": False,
+            "colaborador_nome": "Fernanda Costa",
+            "gestor_nome": "Carlos Santos",
+            "planos_count": 0,
             "criado_em": (datetime.now(timezone.utc) - timedelta(days=5)).isoformat()
         }
     ]
@@ -1380,11 +1983,15 @@ async def seed_data():
     plano = {
         "id": plano_id,
         "feedback_id": feedback1_id,
+        "colaborador_id": colab1_id,
+        "gestor_id": gestor1_id,
         "objetivo": "Melhorar documentação técnica dos projetos desenvolvidos",
         "prazo_final": (datetime.now(timezone.utc) + timedelta(days=30)).isoformat(),
         "responsavel": "Colaborador",
         "status": "Em andamento",
         "progresso_percentual": 33,
+        "itens_total": 3,
+        "itens_concluidos": 1,
         "criado_em": (datetime.now(timezone.utc) - timedelta(days=14)).isoformat()
     }
     
@@ -1429,6 +2036,8 @@ async def seed_data():
     
     await db.checkins.insert_one(checkin)
     
+    await reconcile_counters(db)
+    
     return {
         "message": "Dados de demonstração criados com sucesso",
         "usuarios": {
@@ -1441,132 +2050,98 @@ async def seed_data():
 # ==================== EMAIL NOTIFICATIONS ====================
 
 @api_router.post("/notifications/check-overdue")
-async def check_overdue_and_notify(background_tasks: BackgroundTasks, user: dict = Depends(require_admin)):
+async def check_overdue_and_notify(user: dict = Depends(require_admin)):
     """
-    Check for overdue feedbacks and action plans and send email notifications.
-    This endpoint should be called by a scheduled job (cron).
+    Queue one digest email per manager with overdue feedbacks and one per
+    person responsible for action plans near or past their deadline.
+    This endpoint should be called by a scheduled job (cron); items are
+    alerted at most once a day per person however often it runs.
     """
-    notifications_sent = {
-        "overdue_feedbacks": 0,
-        "approaching_deadlines": 0
-    }
-    
-    now = datetime.now(timezone.utc)
-    
-    # 1. Check for overdue feedbacks (where next feedback date has passed)
-    feedbacks_cursor = db.feedbacks.find({
-        "data_proximo_feedback": {"$lt": now.isoformat()},
-        "status_feedback": {"$ne": "Concluído"}
-    }, {"_id": 0})
-    
-    async for feedback in feedbacks_cursor:
-        gestor = await db.usuarios.find_one({"id": feedback.get("gestor_id")}, {"_id": 0})
-        colaborador = await db.usuarios.find_one({"id": feedback.get("colaborador_id")}, {"_id": 0})
-        
-        if gestor and gestor.get("email") and colaborador:
-            try:
-                data_prevista = datetime.fromisoformat(feedback.get("data_proximo_feedback", now.isoformat()).replace("Z", "+00:00"))
-                dias_atraso = (now - data_prevista).days
-                
-                if dias_atraso > 0:
-                    background_tasks.add_task(
-                        send_overdue_feedback_notification,
-                        gestor.get("email"),
-                        gestor.get("nome", "Gestor"),
-                        colaborador.get("nome", "Colaborador"),
-                        data_prevista.strftime("%d/%m/%Y"),
-                        dias_atraso
-                    )
-                    notifications_sent["overdue_feedbacks"] += 1
-            except Exception as e:
-                logging.error(f"Error processing overdue feedback: {e}")
-    
-    # 2. Check for action plans with approaching deadlines (7 days or less)
-    deadline_threshold = (now + timedelta(days=7)).isoformat()
-    
-    plans_cursor = db.planos_acao.find({
-        "prazo_final": {"$lte": deadline_threshold},
-        "status": {"$nin": ["Concluído"]}
-    }, {"_id": 0})
-    
-    async for plan in plans_cursor:
-        # Get the collaborator from the linked feedback
-        feedback = await db.feedbacks.find_one({"id": plan.get("feedback_id")}, {"_id": 0})
-        if feedback:
-            colaborador = await db.usuarios.find_one({"id": feedback.get("colaborador_id")}, {"_id": 0})
-            gestor = await db.usuarios.find_one({"id": feedback.get("gestor_id")}, {"_id": 0})
-            
-            # Determine who to notify based on responsibility
-            responsavel = plan.get("responsavel", "Ambos")
-            emails_to_notify = []
-            
-            if responsavel in ["Colaborador", "Ambos"] and colaborador and colaborador.get("email"):
-                emails_to_notify.append((colaborador.get("email"), colaborador.get("nome", "Colaborador")))
-            if responsavel in ["Gestor", "Ambos"] and gestor and gestor.get("email"):
-                emails_to_notify.append((gestor.get("email"), gestor.get("nome", "Gestor")))
-            
-            try:
-                prazo_final = datetime.fromisoformat(plan.get("prazo_final", now.isoformat()).replace("Z", "+00:00"))
-                dias_restantes = (prazo_final - now).days
-                
-                for email, nome in emails_to_notify:
-                    background_tasks.add_task(
-                        send_action_plan_deadline_notification,
-                        email,
-                        nome,
-                        plan.get("objetivo", "Plano de Ação"),
-                        prazo_final.strftime("%d/%m/%Y"),
-                        dias_restantes
-                    )
-                    notifications_sent["approaching_deadlines"] += 1
-            except Exception as e:
-                logging.error(f"Error processing action plan deadline: {e}")
+    result = await queue_overdue_digests(db)
     
     return {
         "message": "Notification check completed",
-        "notifications_sent": notifications_sent
+        "notifications_sent": {
+            "overdue_feedbacks": result["feedbacks_atrasados"]["itens"],
+            "approaching_deadlines": result["prazos_planos"]["itens"],
+            "digests": result["feedbacks_atrasados"]["emails"] + result["prazos_planos"]["emails"],
+            "already_notified": result["feedbacks_atrasados"]["ja_notificados"] + result["prazos_planos"]["ja_notificados"]
+        }
     }
 
 
 @api_router.post("/notifications/send-test-email")
 async def send_test_email(email: str, user: dict = Depends(require_admin)):
     """
-    Send a test email to verify SendGrid configuration
-    """
-    from email_service import send_email, get_email_header, get_email_footer
-    
-    html_content = f"""
-    <html>
-    <body style="margin: 0; padding: 20px; background-color: #020617; font-family: Arial, sans-serif;">
-        <div style="max-width: 600px; margin: 0 auto; background-color: #0F172A; border-radius: 8px; overflow: hidden;">
-            {get_email_header()}
-            
-            <div style="padding: 30px; color: #E2E8F0;">
-                <h2 style="color: #10B981; margin-top: 0;">✅ E-mail de Teste</h2>
-                
-                <p>Este é um e-mail de teste do sistema Bee It Feedback.</p>
-                
-                <p>Se você está recebendo este e-mail, a configuração do SendGrid está funcionando corretamente!</p>
-                
-                <div style="background-color: #1E293B; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #10B981;">
-                    <p style="margin: 5px 0;"><strong style="color: #F59E0B;">Data/Hora:</strong> {datetime.now(timezone.utc).strftime("%d/%m/%Y %H:%M:%S")} UTC</p>
-                    <p style="margin: 5px 0;"><strong style="color: #F59E0B;">Enviado por:</strong> {user.get('nome', 'Admin')}</p>
-                </div>
-            </div>
-            
-            {get_email_footer()}
-        </div>
-    </body>
-    </html>
+    Send a test email right away, bypassing the outbox, to verify the SendGrid configuration
     """
-    
-    success = send_email(email, "🧪 Teste de E-mail - Bee It Feedback", html_content)
+    assunto, html = configuration_test_email(user.get('nome', 'Admin'))
+    success = await send_email(outbox_worker.client, email, assunto, html)
     
     if success:
         return {"message": f"E-mail de teste enviado para {email}"}
     else:
         raise HTTPException(status_code=500, detail="Falha ao enviar e-mail. Verifique a configuração do SendGrid.")
 
+@api_router.get("/admin/email-outbox")
+async def get_email_outbox_stats(user: dict = Depends(require_admin)):
+    """
+    Number of queued, in-flight, sent and dead-lettered emails
+    """
+    return await outbox_stats(db)
+
+@api_router.post("/admin/email-outbox/{message_id}/requeue")
+async def requeue_dead_email(message_id: str, user: dict = Depends(require_admin)):
+    """
+    Queue a dead-lettered email again
+    """
+    if not await requeue_email(db, message_id):
+        raise HTTPException(status_code=404, detail="E-mail com falha não encontrado")
+    return {"message": "E-mail recolocado na fila"}
+
+# ==================== ADMIN MAINTENANCE ====================
+
+@api_router.get("/admin/indexes")
+async def get_index_audit(user: dict = Depends(require_admin)):
+    """
+    Report missing, unused and duplicate indexes per collection
+    """
+    return await audit_indexes(db)
+
+@api_router.post("/admin/dashboard-counters/reconcile")
+async def reconcile_dashboard_counters(user: dict = Depends(require_admin)):
+    """
+    Rebuild the materialized dashboard counters from the source collections
+    """
+    scopes = await reconcile_counters(db)
+    return {"message": "Contadores recalculados", "scopes": scopes}
+
+@api_router.post("/admin/feedback-names/backfill")
+async def backfill_names(only_missing: bool = True, user: dict = Depends(require_admin)):
+    """
+    Store collaborator and manager names on feedbacks that predate them
+    (or rewrite every stored name with only_missing=false)
+    """
+    updated = await backfill_feedback_names(db, only_missing)
+    return {"message": "Nomes atualizados", "feedbacks": updated}
+
+@api_router.post("/admin/plan-owners/backfill")
+async def backfill_owners(user: dict = Depends(require_admin)):
+    """
+    Copy colaborador_id and gestor_id from the linked feedback onto action
+    plans that predate them (also run at startup)
+    """
+    updated = await backfill_plan_owners(db)
+    return {"message": "Responsáveis dos planos atualizados", "planos": updated}
+
+@api_router.get("/admin/metrics")
+async def get_metrics(user: dict = Depends(require_admin)):
+    """
+    Return the in-process metrics of the worker serving the request
+    """
+    user_directory.report()
+    return metrics.snapshot()
+
 # ==================== HEALTH CHECK ====================
 
 @api_router.get("/health")
@@ -1583,6 +2158,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
 )
 
 # Configure logging
@@ -1592,6 +2168,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+scheduler = Scheduler(db)
+scheduler.add_job("deadline_sweep", DEADLINE_SWEEP_INTERVAL_SECONDS, sweep_overdue_statuses)
+scheduler.add_job("dashboard_counters", COUNTERS_RECONCILE_INTERVAL_SECONDS, refresh_dashboard_counters)
+scheduler.add_job("export_cleanup", EXPORT_CLEANUP_INTERVAL_SECONDS, lambda: purge_expired_exports(db))
+
+@app.on_event("startup")
+async def create_db_indexes():
+    await ensure_indexes(db)
+
+@app.on_event("startup")
+async def migrate_plan_owners():
+    # Legacy plans are invisible to role-scoped listings until they have owners
+    try:
+        await backfill_plan_owners(db)
+    except Exception as e:
+        logger.error(f"Plan owner backfill failed: {e}")
+
+@app.on_event("startup")
+async def start_scheduler():
+    scheduler.start()
+
+@app.on_event("startup")
+async def start_user_directory():
+    await user_directory.start()
+
+@app.on_event("startup")
+async def start_email_outbox():
+    if EMAIL_OUTBOX_WORKER_ENABLED:
+        await outbox_worker.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+
+@app.on_event("shutdown")
+async def stop_user_directory():
+    await user_directory.stop()
+
+@app.on_event("shutdown")
+async def stop_email_outbox():
+    await outbox_worker.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
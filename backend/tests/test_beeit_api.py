@@ -2,6 +2,8 @@
 Bee It Feedback API Tests
 Tests all CRUD operations for users, teams, feedbacks, action plans, and dashboards
 """
+import base64
+import json
 import pytest
 import requests
 import os
@@ -130,6 +132,29 @@ class TestUsers:
         assert len(data) > 0
         print(f"✓ List users - Found {len(data)} users")
     
+    def test_list_users_pagination(self, admin_token):
+        """Test paginated user listing with total count"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/users?limit=2&include_total=true", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        total = int(response.headers["X-Total-Count"])
+        assert len(data) == min(2, total)
+        if total > 2:
+            assert "X-Next-Cursor" in response.headers
+        print(f"✓ List users paginated - {len(data)} of {total} users")
+    
+    def test_list_users_ndjson(self, admin_token):
+        """Test streamed NDJSON user listing"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/users?format=ndjson", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("application/x-ndjson")
+        lines = [line for line in response.text.splitlines() if line]
+        assert len(lines) > 0
+        assert "password" not in lines[0]
+        print(f"✓ List users streamed - {len(lines)} users")
+    
     def test_create_user(self, admin_token):
         """Test create user endpoint"""
         headers = {"Authorization": f"Bearer {admin_token}"}
@@ -191,7 +216,72 @@ class TestUsers:
         # Verify deletion
         response = requests.get(f"{BASE_URL}/api/users/{user_id}", headers=headers)
         assert response.status_code == 404
-    
+
+    def test_delete_user_cascades(self, admin_token):
+        """Test deleting a user removes their feedbacks and action plans"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        user_id = self.test_create_user(admin_token)
+
+        response = requests.post(f"{BASE_URL}/api/feedbacks", json={
+            "colaborador_id": user_id,
+            "tipo_feedback": "Elogio",
+            "contexto": "TEST_Feedback em cascata",
+            "impacto": "Impacto",
+            "expectativa": "Expectativa",
+            "pontos_fortes": [],
+            "pontos_melhoria": [],
+            "confidencial": False
+        }, headers=headers)
+        feedback_id = response.json()["id"]
+        response = requests.post(f"{BASE_URL}/api/action-plans", json={
+            "feedback_id": feedback_id,
+            "objetivo": "TEST_Plano em cascata",
+            "prazo_final": (datetime.now() + timedelta(days=30)).isoformat(),
+            "responsavel": "Colaborador"
+        }, headers=headers)
+        plan_id = response.json()["id"]
+
+        response = requests.delete(f"{BASE_URL}/api/users/{user_id}", headers=headers)
+        assert response.status_code == 200
+        removidos = response.json()["removidos"]
+        assert removidos["feedbacks"] == 1
+        assert removidos["planos_acao"] == 1
+        # The "novo feedback" email, if still queued, goes too
+        assert "email_outbox" in removidos
+        assert "notification_ledger" in removidos
+
+        assert requests.get(f"{BASE_URL}/api/feedbacks/{feedback_id}", headers=headers).status_code == 404
+        assert requests.get(f"{BASE_URL}/api/action-plans/{plan_id}", headers=headers).status_code == 404
+        print(f"✓ Delete user cascades - {removidos}")
+
+    def test_deactivated_user_loses_access(self, admin_token):
+        """Test that deactivating a user revokes an already issued token"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        user_data = {
+            "nome": "TEST_Usuario Desativado",
+            "email": f"TEST_inactive_{datetime.now().timestamp()}@beeit.com.br",
+            "password": "test123",
+            "papel": "COLABORADOR"
+        }
+        response = requests.post(f"{BASE_URL}/api/users", json=user_data, headers=headers)
+        assert response.status_code == 200
+        user_id = response.json()["id"]
+
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": user_data["email"],
+            "password": user_data["password"]
+        })
+        user_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        assert requests.get(f"{BASE_URL}/api/auth/me", headers=user_headers).status_code == 200
+
+        requests.put(f"{BASE_URL}/api/users/{user_id}", json={"ativo": False}, headers=headers)
+        response = requests.get(f"{BASE_URL}/api/auth/me", headers=user_headers)
+        assert response.status_code == 401
+        print("✓ Deactivated user lost access")
+
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/users/{user_id}", headers=headers)
+
     def test_non_admin_cannot_create_user(self, gestor_token):
         """Test that non-admin cannot create users"""
         headers = {"Authorization": f"Bearer {gestor_token}"}
@@ -346,7 +436,23 @@ class TestFeedbacks:
         assert "id" in data
         print(f"✓ Create feedback - ID: {data['id']}")
         return data["id"]
-    
+
+    def test_create_feedback_rejects_unknown_type(self, gestor_token):
+        """Unknown types would key the dashboard counters with arbitrary text"""
+        headers = {"Authorization": f"Bearer {gestor_token}"}
+        colaborador_id = self.get_colaborador_id(gestor_token)
+
+        for tipo in ["", "a.b", "$set"]:
+            response = requests.post(f"{BASE_URL}/api/feedbacks", json={
+                "colaborador_id": colaborador_id,
+                "tipo_feedback": tipo,
+                "contexto": "TEST_Tipo inválido",
+                "impacto": "Nenhum",
+                "expectativa": "Nenhuma"
+            }, headers=headers)
+            assert response.status_code == 422
+        print("✓ Unknown feedback types rejected")
+
     def test_get_feedback(self, gestor_token):
         """Test get single feedback endpoint"""
         headers = {"Authorization": f"Bearer {gestor_token}"}
@@ -424,6 +530,56 @@ class TestFeedbacks:
         assert response.status_code == 200
         print(f"✓ Delete feedback - ID: {feedback_id}")
     
+    def test_feedback_pagination(self, admin_token):
+        """Test cursor pagination of the feedback list"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/feedbacks?limit=1", headers=headers)
+        assert response.status_code == 200
+        first_page = response.json()
+        assert len(first_page) <= 1
+        
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor:
+            response = requests.get(f"{BASE_URL}/api/feedbacks?limit=1&cursor={next_cursor}", headers=headers)
+            assert response.status_code == 200
+            second_page = response.json()
+            assert len(second_page) == 1
+            assert second_page[0]["id"] != first_page[0]["id"]
+            assert second_page[0]["data_feedback"] <= first_page[0]["data_feedback"]
+        print("✓ Feedback pagination working")
+    
+    def test_feedback_invalid_cursor(self, admin_token):
+        """Test that a malformed cursor is rejected"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/feedbacks?cursor=not-a-cursor", headers=headers)
+        assert response.status_code == 400
+        print("✓ Invalid cursor correctly rejected")
+    
+    def test_feedback_cursor_rejects_operators(self, admin_token):
+        """Test that a cursor carrying query operators is rejected"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        values = json.dumps([{"$ne": None}, {"$ne": None}]).encode("utf-8")
+        cursor = base64.urlsafe_b64encode(values).decode("ascii").rstrip("=")
+        response = requests.get(f"{BASE_URL}/api/feedbacks?cursor={cursor}", headers=headers)
+        assert response.status_code == 400
+        print("✓ Cursor with operators correctly rejected")
+    
+    def test_colaborador_scope(self, admin_token, colaborador_token):
+        """Test that a collaborator only reads their own feedbacks"""
+        colab_headers = {"Authorization": f"Bearer {colaborador_token}"}
+        me = requests.get(f"{BASE_URL}/api/auth/me", headers=colab_headers).json()
+        
+        own = requests.get(f"{BASE_URL}/api/feedbacks", headers=colab_headers).json()
+        assert all(f["colaborador_id"] == me["id"] for f in own)
+        
+        admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        feedbacks = requests.get(f"{BASE_URL}/api/feedbacks?limit=500", headers=admin_headers).json()
+        others = [f for f in feedbacks if f["colaborador_id"] != me["id"]]
+        if others:
+            response = requests.get(f"{BASE_URL}/api/feedbacks/{others[0]['id']}", headers=colab_headers)
+            assert response.status_code == 404
+        print(f"✓ Collaborator scope - {len(own)} own feedbacks")
+    
     def test_feedback_filters(self, admin_token):
         """Test feedback filtering"""
         headers = {"Authorization": f"Bearer {admin_token}"}
@@ -516,6 +672,18 @@ class TestActionPlans:
         response = requests.delete(f"{BASE_URL}/api/action-plans/{plan_id}", headers=headers)
         assert response.status_code == 200
         print(f"✓ Delete action plan - ID: {plan_id}")
+    
+    def test_feedback_com_plano_filter(self, gestor_token):
+        """Test that feedbacks with a plan are found by the com_plano filter"""
+        headers = {"Authorization": f"Bearer {gestor_token}"}
+        feedback_id = self.get_feedback_id(gestor_token)
+        self.test_create_action_plan(gestor_token)
+        
+        com_plano = requests.get(f"{BASE_URL}/api/feedbacks?com_plano=true&limit=500", headers=headers).json()
+        sem_plano = requests.get(f"{BASE_URL}/api/feedbacks?com_plano=false&limit=500", headers=headers).json()
+        assert feedback_id in [f["id"] for f in com_plano]
+        assert feedback_id not in [f["id"] for f in sem_plano]
+        print(f"✓ com_plano filter - {len(com_plano)} with plan, {len(sem_plano)} without")
 
 
 class TestActionPlanItems:
@@ -576,6 +744,26 @@ class TestActionPlanItems:
         assert data["concluido"] == True
         print(f"✓ Update action plan item - ID: {item_id}")
 
+    def test_item_changes_update_plan_progress(self, gestor_token):
+        """Test item create, toggle and delete keep the plan counters and progress in step"""
+        headers = {"Authorization": f"Bearer {gestor_token}"}
+        plan_id = self.get_plan_id(gestor_token)
+        before = requests.get(f"{BASE_URL}/api/action-plans/{plan_id}", headers=headers).json()
+
+        item_id = self.test_create_action_plan_item(gestor_token)
+        requests.put(f"{BASE_URL}/api/action-plan-items/{item_id}", json={"concluido": True}, headers=headers)
+        plan = requests.get(f"{BASE_URL}/api/action-plans/{plan_id}", headers=headers).json()
+        assert plan["itens_total"] == before["itens_total"] + 1
+        assert plan["itens_concluidos"] == before["itens_concluidos"] + 1
+        assert plan["progresso_percentual"] == int(plan["itens_concluidos"] / plan["itens_total"] * 100)
+
+        response = requests.delete(f"{BASE_URL}/api/action-plan-items/{item_id}", headers=headers)
+        assert response.status_code == 200
+        plan = requests.get(f"{BASE_URL}/api/action-plans/{plan_id}", headers=headers).json()
+        assert plan["itens_total"] == before["itens_total"]
+        assert plan["itens_concluidos"] == before["itens_concluidos"]
+        print(f"✓ Item changes update plan progress - {plan['progresso_percentual']}%")
+
 
 class TestCheckins:
     """Check-in tests"""
@@ -709,6 +897,26 @@ class TestNotifications:
         assert response.status_code == 200
         print("✓ Mark all notifications as read")
 
+    def test_check_overdue_digests(self):
+        """Test the overdue check queues digests instead of one email per item"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": ADMIN_EMAIL,
+            "password": ADMIN_PASSWORD
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = requests.post(f"{BASE_URL}/api/notifications/check-overdue", headers=headers)
+        assert response.status_code == 200
+        sent = response.json()["notifications_sent"]
+        assert sent["digests"] <= sent["overdue_feedbacks"] + sent["approaching_deadlines"]
+
+        # A second run the same day finds everything in the ledger
+        response = requests.post(f"{BASE_URL}/api/notifications/check-overdue", headers=headers)
+        assert response.status_code == 200
+        again = response.json()["notifications_sent"]
+        assert again["digests"] == 0
+        assert again["already_notified"] >= sent["overdue_feedbacks"] + sent["approaching_deadlines"]
+        print(f"✓ Check overdue - {sent}")
+
 
 class TestCollaboratorProfile:
     """Collaborator profile tests"""
@@ -735,8 +943,204 @@ class TestCollaboratorProfile:
             data = response.json()
             assert "colaborador" in data
             assert "feedbacks" in data
+            assert data["total_feedbacks"] >= len(data["feedbacks"])
+            assert data["total_planos"] >= len(data["planos_acao"])
+            if data["planos_next_cursor"]:
+                # The rest of the plans continue in the plan listing
+                response = requests.get(
+                    f"{BASE_URL}/api/action-plans",
+                    params={"colaborador_id": colaborador_id, "cursor": data["planos_next_cursor"]},
+                    headers=headers
+                )
+                assert response.status_code == 200
+                assert len(response.json()) > 0
             print(f"✓ Get collaborator profile - {data['colaborador']['nome']}")
 
 
+class TestAdminMaintenance:
+    """Admin maintenance endpoint tests"""
+    
+    @pytest.fixture
+    def admin_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": ADMIN_EMAIL,
+            "password": ADMIN_PASSWORD
+        })
+        return response.json()["access_token"]
+    
+    @pytest.fixture
+    def gestor_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": GESTOR_EMAIL,
+            "password": GESTOR_PASSWORD
+        })
+        return response.json()["access_token"]
+    
+    def test_index_audit(self, admin_token):
+        """Test index audit endpoint"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/admin/indexes", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert "feedbacks" in data
+        assert data["usuarios"]["missing"] == []
+        print(f"✓ Index audit - {len(data)} collections checked")
+    
+    def test_non_admin_cannot_audit_indexes(self, gestor_token):
+        """Test index audit is restricted to admins"""
+        headers = {"Authorization": f"Bearer {gestor_token}"}
+        response = requests.get(f"{BASE_URL}/api/admin/indexes", headers=headers)
+        assert response.status_code == 403
+        print("✓ Non-admin correctly denied index audit")
+    
+    def test_reconcile_dashboard_counters(self, admin_token):
+        """Test dashboard counters reconciliation matches the admin dashboard"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.post(f"{BASE_URL}/api/admin/dashboard-counters/reconcile", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["scopes"] > 0
+        
+        # The listing is paged, so compare with its total rather than one page
+        response = requests.get(f"{BASE_URL}/api/feedbacks?limit=1&include_total=true", headers=headers)
+        total = int(response.headers["X-Total-Count"])
+        dashboard = requests.get(f"{BASE_URL}/api/dashboard/admin", headers=headers).json()
+        assert dashboard["total_feedbacks"] == total
+        print(f"✓ Dashboard counters reconciled - {dashboard['total_feedbacks']} feedbacks")
+    
+    def test_backfill_feedback_names(self, admin_token):
+        """Test that every feedback carries the stored names after a backfill"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        backfill = requests.post(f"{BASE_URL}/api/admin/feedback-names/backfill", headers=headers)
+        assert backfill.status_code == 200
+        assert "feedbacks" in backfill.json()
+        
+        # Stream every feedback instead of checking only the first page
+        response = requests.get(f"{BASE_URL}/api/feedbacks?format=ndjson&include_total=true", headers=headers)
+        feedbacks = [json.loads(line) for line in response.iter_lines() if line]
+        assert len(feedbacks) == int(response.headers["X-Total-Count"])
+        assert all(f["colaborador_nome"] and f["gestor_nome"] for f in feedbacks)
+        print(f"✓ Feedback names backfilled - {backfill.json()['feedbacks']} updated")
+    
+    def test_backfill_plan_owners(self, admin_token):
+        """Test that the plan owner backfill can be run again safely"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.post(f"{BASE_URL}/api/admin/plan-owners/backfill", headers=headers)
+        assert response.status_code == 200
+        # Already run at startup: nothing left to fill
+        assert response.json()["planos"] == 0
+        print("✓ Plan owners backfilled")
+    
+    def test_metrics(self, admin_token):
+        """Test metrics endpoint"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/admin/metrics", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert "counters" in data
+        assert "gauges" in data
+        assert "timers" in data
+        print(f"✓ Metrics - {len(data['gauges'])} gauges")
+
+    def test_user_directory_metrics(self, admin_token):
+        """Test that the user directory reports its size and staleness"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/admin/metrics", headers=headers)
+        assert response.status_code == 200
+        gauges = response.json()["gauges"]
+        assert gauges["user_directory.entries"] > 0
+        assert gauges["user_directory.memory_bytes"] > 0
+        assert "user_directory.staleness_seconds" in gauges
+        print(f"✓ User directory - {gauges['user_directory.entries']} users")
+
+    def test_email_outbox_stats(self, admin_token):
+        """Test the email outbox reports messages per status"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/admin/email-outbox", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert isinstance(data, dict)
+        assert all(isinstance(total, int) for total in data.values())
+
+        response = requests.post(f"{BASE_URL}/api/admin/email-outbox/inexistente/requeue", headers=headers)
+        assert response.status_code == 404
+        print(f"✓ Email outbox - {data}")
+
+
+
+class TestExports:
+    """Export endpoint tests"""
+    
+    @pytest.fixture
+    def admin_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": ADMIN_EMAIL,
+            "password": ADMIN_PASSWORD
+        })
+        return response.json()["access_token"]
+    
+    def test_export_feedbacks_csv(self, admin_token):
+        """Test streamed CSV feedback export"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/exports/feedbacks?format=csv", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/csv")
+        lines = response.content.decode("utf-8-sig").splitlines()
+        assert lines[0].startswith("id,data_feedback")
+        assert "colaborador_nome" in lines[0]
+        print(f"✓ Export feedbacks CSV - {len(lines) - 1} rows")
+
+    def test_export_neutralizes_formulas(self, admin_token):
+        """Text that a spreadsheet would evaluate is exported with a leading apostrophe"""
+        gestor_token = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": GESTOR_EMAIL,
+            "password": GESTOR_PASSWORD
+        }).json()["access_token"]
+        gestor_headers = {"Authorization": f"Bearer {gestor_token}"}
+        colaborador_id = requests.get(
+            f"{BASE_URL}/api/users?papel=COLABORADOR", headers=gestor_headers
+        ).json()[0]["id"]
+        response = requests.post(f"{BASE_URL}/api/feedbacks", json={
+            "colaborador_id": colaborador_id,
+            "tipo_feedback": "1:1",
+            "contexto": "=HYPERLINK(\"http://example.com\",\"TEST_formula\")",
+            "impacto": "Impacto",
+            "expectativa": "Expectativa"
+        }, headers=gestor_headers)
+        assert response.status_code == 200
+
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(
+            f"{BASE_URL}/api/exports/feedbacks?format=csv&colaborador_id={colaborador_id}", headers=headers
+        )
+        assert response.status_code == 200
+        text = response.content.decode("utf-8-sig")
+        assert "'=HYPERLINK" in text
+        assert ",=HYPERLINK" not in text and ",\"=HYPERLINK" not in text
+        print("✓ Export neutralizes formulas")
+
+    def test_export_action_plans_ndjson(self, admin_token):
+        """Test streamed NDJSON action plan export"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/exports/action-plans?format=ndjson", headers=headers)
+        assert response.status_code == 200
+        lines = [line for line in response.text.splitlines() if line]
+        for line in lines:
+            assert "itens_total" in line
+        print(f"✓ Export action plans NDJSON - {len(lines)} rows")
+    
+    def test_export_feedbacks_xlsx_job(self, admin_token):
+        """Test XLSX export job creation"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = requests.get(f"{BASE_URL}/api/exports/feedbacks?format=xlsx", headers=headers)
+        assert response.status_code == 200
+        job = response.json()
+        assert job["formato"] == "xlsx"
+        
+        response = requests.get(f"{BASE_URL}/api/exports/jobs/{job['id']}", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["status"] in ["pendente", "processando", "concluido"]
+        print(f"✓ Export XLSX job - ID: {job['id']}")
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
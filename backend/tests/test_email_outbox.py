@@ -0,0 +1,129 @@
+"""
+Email outbox worker tests
+Run in process: the queue is held in memory and SendGrid is an httpx MockTransport
+"""
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_outbox import OutboxWorker  # noqa: E402
+from email_service import SendGridClient  # noqa: E402
+
+
+class InMemoryWorker(OutboxWorker):
+    """Worker claiming from a list and recording outcomes instead of using MongoDB"""
+
+    def __init__(self, messages, transport, **kwargs):
+        super().__init__(
+            db=None,
+            client=SendGridClient(api_key="test", transport=transport),
+            poll_seconds=0.01,
+            rate_limits={},
+            **kwargs
+        )
+        self.queue = list(messages)
+        self.sent = []
+        self.failed = []
+
+    async def _claim(self):
+        if not self.queue:
+            return None
+        message = dict(self.queue.pop(0))
+        message["tentativas"] = message.get("tentativas", 0) + 1
+        return message
+
+    async def _sent(self, messages):
+        self.sent.extend(message["para"] for message in messages)
+
+    async def _failed(self, message, error, retryable, retry_after=None):
+        self.failed.append((message["para"], error))
+
+    async def report(self):
+        pass
+
+
+def message(para):
+    return {"id": para, "provedor": "sendgrid", "para": para, "assunto": "Assunto", "html": "<p>x</p>"}
+
+
+async def run_until(worker, done, timeout=5):
+    task = asyncio.create_task(worker.run())
+    try:
+        for _ in range(int(timeout / 0.01)):
+            if done():
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await worker.client.close()
+    # The loop was still alive when cancelled
+    return task.cancelled()
+
+
+class TestOutboxWorker:
+    """The drain loop survives errors and keeps delivering"""
+
+    def test_raising_transport_does_not_stop_delivery(self):
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            if len(requests_seen) == 1:
+                raise RuntimeError("transport bug")
+            return httpx.Response(202)
+
+        worker = InMemoryWorker(
+            [message("a@x.com"), message("b@x.com"), message("c@x.com")],
+            httpx.MockTransport(handler),
+            batch_size=1
+        )
+        assert asyncio.run(run_until(worker, lambda: len(worker.sent) == 2))
+        assert worker.sent == ["b@x.com", "c@x.com"]
+        assert worker.failed[0][0] == "a@x.com"
+        assert "RuntimeError" in worker.failed[0][1]
+        print("✓ Delivery continued after a raising transport")
+
+    def test_drain_errors_do_not_kill_the_loop(self):
+        worker = InMemoryWorker(
+            [message("a@x.com"), message("b@x.com")],
+            httpx.MockTransport(lambda request: httpx.Response(202)),
+            batch_size=1
+        )
+        calls = []
+
+        async def flaky_report():
+            calls.append(1)
+            if len(calls) == 1:
+                raise KeyError("criado_em")
+
+        worker.report = flaky_report
+        assert asyncio.run(run_until(worker, lambda: len(worker.sent) == 2))
+        assert worker.sent == ["a@x.com", "b@x.com"]
+        print("✓ Drain loop kept running after an unexpected error")
+
+    def test_messages_sharing_a_body_go_out_in_one_request(self):
+        payloads = []
+
+        def handler(request):
+            payloads.append(json.loads(request.content))
+            return httpx.Response(202)
+
+        shared = [dict(message(para), substituicoes={"-nome-": para}) for para in ("a@x.com", "b@x.com", "c@x.com")]
+        other = dict(message("d@x.com"), html="<p>outro</p>")
+        worker = InMemoryWorker(shared + [other], httpx.MockTransport(handler), batch_size=10, group_size=2)
+        assert asyncio.run(run_until(worker, lambda: len(worker.sent) == 4))
+        assert sorted(worker.sent) == ["a@x.com", "b@x.com", "c@x.com", "d@x.com"]
+        sizes = sorted(len(payload["personalizations"]) for payload in payloads)
+        assert sizes == [1, 1, 2]
+        first = next(payload for payload in payloads if len(payload["personalizations"]) == 2)
+        assert first["personalizations"][0]["substitutions"] == {"-nome-": "a@x.com"}
+        print("✓ Messages sharing a body were grouped into personalizations")
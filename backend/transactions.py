@@ -0,0 +1,32 @@
+"""
+Multi-document transactions for Bee It Feedback
+
+Transactions need a replica set or sharded cluster. Writes that belong
+together go through `run_in_transaction`, which uses one where the
+deployment supports it and otherwise runs the same writes in order without
+a session, so development against a standalone mongod keeps working.
+"""
+from typing import Optional
+
+_transactions_supported: Optional[bool] = None
+
+
+async def supports_transactions(db) -> bool:
+    """Whether the deployment is a replica set or sharded cluster (checked once)"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = await db.client.admin.command("hello")
+        _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+    return _transactions_supported
+
+
+async def run_in_transaction(db, operation):
+    """
+    Await `operation(session)` inside a transaction when the deployment
+    supports them, or `operation(None)` otherwise
+    """
+    if not await supports_transactions(db):
+        return await operation(None)
+    async with await db.client.start_session() as session:
+        # with_transaction retries the whole operation on transient errors
+        return await session.with_transaction(operation)
@@ -0,0 +1,254 @@
+"""
+Process-wide directory of users for Bee It Feedback
+
+Names, roles, teams and reporting lines are read on almost every request
+but change rarely, so each worker keeps them in memory. The directory is
+loaded once at startup and then kept coherent by a change stream on
+`usuarios`. Standalone mongod has no change streams; there the directory
+polls the `usuarios` version counter shared with the principal cache and
+reloads when it moved.
+
+Entries hold only the fields needed to resolve names and reporting lines,
+in `__slots__` objects with interned ids; 50k users take about 20 MB.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+import metrics
+from principal_cache import get_users_version
+
+logger = logging.getLogger(__name__)
+
+USER_DIRECTORY_ENABLED = os.environ.get('USER_DIRECTORY_ENABLED', 'true').lower() == 'true'
+USER_DIRECTORY_POLL_SECONDS = float(os.environ.get('USER_DIRECTORY_POLL_SECONDS', '30'))
+USER_DIRECTORY_RETRY_SECONDS = 5
+
+FIELDS = ("id", "nome", "email", "papel", "time_id", "gestor_direto_id", "ativo")
+PROJECTION = {field: 1 for field in FIELDS}
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class UserEntry:
+    """Compact, read-only view of one user"""
+
+    __slots__ = ("oid",) + FIELDS
+
+    def __init__(self, doc: dict):
+        self.oid = doc.get("_id")
+        self.id = _intern(doc["id"])
+        self.nome = doc.get("nome")
+        self.email = doc.get("email")
+        self.papel = _intern(doc.get("papel"))
+        self.time_id = _intern(doc.get("time_id"))
+        self.gestor_direto_id = _intern(doc.get("gestor_direto_id"))
+        self.ativo = doc.get("ativo", True)
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in FIELDS}
+
+
+class UserDirectory:
+    """In-memory users indexed by id, team and role"""
+
+    def __init__(self, db, enabled: bool = USER_DIRECTORY_ENABLED, poll_seconds: float = USER_DIRECTORY_POLL_SECONDS):
+        self.db = db
+        self.enabled = enabled
+        self.poll_seconds = poll_seconds
+        self.ready = False
+        self.mode = None
+        self._users: Dict[str, UserEntry] = {}
+        # Secondary indexes hold plain lists: far smaller than sets, and
+        # removals only happen when a user changes
+        self._by_time: Dict[str, List[str]] = {}
+        self._by_papel: Dict[str, List[str]] = {}
+        self._version: Optional[int] = None
+        self._synced_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loaded = asyncio.Event()
+
+    # ---- lookups ----
+
+    def get(self, user_id: str) -> Optional[UserEntry]:
+        return self._users.get(user_id)
+
+    def name_of(self, user_id: str) -> Optional[str]:
+        entry = self._users.get(user_id)
+        return entry.nome if entry else None
+
+    def members_of_team(self, time_id: str) -> List[str]:
+        return list(self._by_time.get(time_id, ()))
+
+    def ids_with_role(self, papel: str) -> List[str]:
+        return list(self._by_papel.get(papel, ()))
+
+    # ---- maintenance ----
+
+    def _index(self, entry: UserEntry):
+        for index, key in ((self._by_time, entry.time_id), (self._by_papel, entry.papel)):
+            if key:
+                index.setdefault(key, []).append(entry.id)
+
+    def _unindex(self, entry: UserEntry):
+        for index, key in ((self._by_time, entry.time_id), (self._by_papel, entry.papel)):
+            members = index.get(key)
+            if members is not None and entry.id in members:
+                members.remove(entry.id)
+                if not members:
+                    del index[key]
+
+    def _upsert(self, doc: dict):
+        entry = UserEntry(doc)
+        previous = self._users.get(entry.id)
+        if previous:
+            self._unindex(previous)
+        self._users[entry.id] = entry
+        self._index(entry)
+
+    def _remove_oid(self, oid):
+        # Delete events only carry `_id`; deletes are rare enough for a scan
+        for entry in self._users.values():
+            if entry.oid == oid:
+                self._unindex(entry)
+                del self._users[entry.id]
+                return
+
+    async def reload(self):
+        """Replace the whole directory with the current `usuarios` contents"""
+        with metrics.timed("user_directory.reload"):
+            version = await get_users_version(self.db)
+            docs = await self.db.usuarios.find({}, PROJECTION).to_list(None)
+        self._users, self._by_time, self._by_papel = {}, {}, {}
+        for doc in docs:
+            self._upsert(doc)
+        self._version = version
+        self._synced_at = time.time()
+        self.ready = True
+        self._loaded.set()
+        metrics.inc("user_directory.reloads")
+        # Walking every entry takes ~0.2 s for 50k users, so the footprint is
+        # measured on reloads only
+        metrics.set_gauge("user_directory.memory_bytes", self.memory_bytes())
+        self.report()
+
+    def report(self):
+        """Publish size and staleness gauges"""
+        metrics.set_gauge("user_directory.entries", len(self._users))
+        if self._synced_at is not None:
+            metrics.set_gauge("user_directory.staleness_seconds", round(time.time() - self._synced_at, 3))
+
+    def memory_bytes(self) -> int:
+        """Approximate footprint of the entries and indexes (shared strings counted once)"""
+        seen = set()
+        total = sys.getsizeof(self._users)
+        for entry in self._users.values():
+            total += sys.getsizeof(entry)
+            for field in FIELDS:
+                value = getattr(entry, field)
+                if isinstance(value, str) and id(value) not in seen:
+                    seen.add(id(value))
+                    total += sys.getsizeof(value)
+        for index in (self._by_time, self._by_papel):
+            total += sys.getsizeof(index) + sum(sys.getsizeof(members) for members in index.values())
+        return total
+
+    # ---- background sync ----
+
+    async def start(self, warm_timeout: float = 10):
+        """Start syncing and wait up to `warm_timeout` seconds for the first load"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._loaded.wait(), warm_timeout)
+        except asyncio.TimeoutError:
+            # Requests fall back to the database until the directory is loaded
+            logger.warning("User directory not loaded at startup")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        watch = True
+        while True:
+            try:
+                if watch:
+                    await self._watch()
+                else:
+                    await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if watch and self.mode != "change_stream":
+                    # Change streams need a replica set (or sharded cluster)
+                    logger.info(f"User directory falling back to polling: {e}")
+                    watch = False
+                    continue
+                logger.error(f"User directory sync failed: {e}")
+                metrics.inc("user_directory.errors")
+                await asyncio.sleep(USER_DIRECTORY_RETRY_SECONDS)
+            except PyMongoError as e:
+                logger.error(f"User directory sync failed: {e}")
+                metrics.inc("user_directory.errors")
+                await asyncio.sleep(USER_DIRECTORY_RETRY_SECONDS)
+
+    async def _watch(self):
+        pipeline = [{"$project": {
+            "operationType": 1,
+            "documentKey": 1,
+            **{f"fullDocument.{field}": 1 for field in FIELDS},
+        }}]
+        async with self.db.usuarios.watch(pipeline, full_document="updateLookup") as stream:
+            self.mode = "change_stream"
+            # Load after the stream is open so no change falls in between;
+            # events already reflected in the load are applied again harmlessly
+            await self.reload()
+            while stream.alive:
+                change = await stream.try_next()
+                self._synced_at = time.time()
+                if change is None:
+                    continue
+                self._apply(change)
+                metrics.inc("user_directory.changes")
+
+    def _apply(self, change: dict):
+        operation = change["operationType"]
+        if operation in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc:
+                self._upsert({**doc, "_id": change["documentKey"]["_id"]})
+        elif operation == "delete":
+            self._remove_oid(change["documentKey"]["_id"])
+        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self.ready = False
+
+    async def _poll(self):
+        self.mode = "polling"
+        await self.reload()
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                version = await get_users_version(self.db)
+            except PyMongoError as e:
+                logger.error(f"User directory poll failed: {e}")
+                metrics.inc("user_directory.errors")
+                continue
+            if version != self._version:
+                await self.reload()
+            else:
+                self._synced_at = time.time()
+                self.report()
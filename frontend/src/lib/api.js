@@ -40,19 +40,35 @@ api.interceptors.response.use(
   }
 );
 
+// List endpoints return one page at a time and the cursor of the next page
+// in the X-Next-Cursor header; follow it to load a complete listing
+const MAX_PAGE_SIZE = 500;
+
+const getAllPages = async (url, params = {}) => {
+  let items = [];
+  let cursor = null;
+  let response;
+  do {
+    response = await api.get(url, { params: { ...params, limit: MAX_PAGE_SIZE, ...(cursor ? { cursor } : {}) } });
+    items = items.concat(response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return { ...response, data: items };
+};
+
 // Auth
 export const login = (email, password) => api.post('/auth/login', { email, password });
 export const getMe = () => api.get('/auth/me');
 
 // Users
-export const getUsers = (params) => api.get('/users', { params });
+export const getUsers = (params) => getAllPages('/users', params);
 export const getUser = (id) => api.get(`/users/${id}`);
 export const createUser = (data) => api.post('/users', data);
 export const updateUser = (id, data) => api.put(`/users/${id}`, data);
 export const deleteUser = (id) => api.delete(`/users/${id}`);
 
 // Teams
-export const getTeams = () => api.get('/teams');
+export const getTeams = () => getAllPages('/teams');
 export const getTeam = (id) => api.get(`/teams/${id}`);
 export const createTeam = (data) => api.post('/teams', data);
 export const updateTeam = (id, data) => api.put(`/teams/${id}`, data);
@@ -67,20 +83,20 @@ export const deleteFeedback = (id) => api.delete(`/feedbacks/${id}`);
 export const acknowledgeFeedback = (id) => api.post(`/feedbacks/${id}/acknowledge`);
 
 // Action Plans
-export const getActionPlans = (params) => api.get('/action-plans', { params });
+export const getActionPlans = (params) => getAllPages('/action-plans', params);
 export const getActionPlan = (id) => api.get(`/action-plans/${id}`);
 export const createActionPlan = (data) => api.post('/action-plans', data);
 export const updateActionPlan = (id, data) => api.put(`/action-plans/${id}`, data);
 export const deleteActionPlan = (id) => api.delete(`/action-plans/${id}`);
 
 // Action Plan Items
-export const getActionPlanItems = (planoDeAcaoId) => api.get('/action-plan-items', { params: { plano_de_acao_id: planoDeAcaoId } });
+export const getActionPlanItems = (planoDeAcaoId) => getAllPages('/action-plan-items', { plano_de_acao_id: planoDeAcaoId });
 export const createActionPlanItem = (data) => api.post('/action-plan-items', data);
 export const updateActionPlanItem = (id, data) => api.put(`/action-plan-items/${id}`, data);
 export const deleteActionPlanItem = (id) => api.delete(`/action-plan-items/${id}`);
 
 // Check-ins
-export const getCheckins = (planoDeAcaoId) => api.get('/checkins', { params: { plano_de_acao_id: planoDeAcaoId } });
+export const getCheckins = (planoDeAcaoId) => getAllPages('/checkins', { plano_de_acao_id: planoDeAcaoId });
 export const createCheckin = (data) => api.post('/checkins', data);
 
 // Notifications
@@ -67,6 +67,8 @@ const Feedbacks = () => {
   const [teams, setTeams] = useState([]);
   const [users, setUsers] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [deleteDialogOpen, setDeleteDialogOpen] = useState(false);
   const [feedbackToDelete, setFeedbackToDelete] = useState(null);
   
@@ -96,6 +98,7 @@ const Feedbacks = () => {
         isGestorOrAdmin() ? getUsers() : Promise.resolve({ data: [] })
       ]);
       setFeedbacks(feedbacksRes.data);
+      setNextCursor(feedbacksRes.headers['x-next-cursor'] || null);
       setTeams(teamsRes.data);
       setUsers(usersRes.data);
     } catch (error) {
@@ -106,6 +109,20 @@ const Feedbacks = () => {
     }
   };
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await getFeedbacks({ ...cleanFilters(filters), cursor: nextCursor });
+      setFeedbacks(prev => [...prev, ...response.data]);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Failed to load more feedbacks:', error);
+      toast({ title: 'Erro', description: 'Erro ao carregar feedbacks', variant: 'destructive' });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const cleanFilters = (filters) => {
     const cleaned = {};
     Object.entries(filters).forEach(([key, value]) => {
@@ -439,6 +456,19 @@ const Feedbacks = () => {
                 ))}
               </TableBody>
             </Table>
+            {nextCursor && (
+              <div className="flex justify-center p-4 border-t border-slate-700/50">
+                <Button
+                  variant="outline"
+                  onClick={loadMore}
+                  disabled={loadingMore}
+                  className="bg-slate-800/50 border-slate-700 text-slate-300 hover:text-white hover:bg-slate-700"
+                  data-testid="load-more-feedbacks"
+                >
+                  {loadingMore ? 'Carregando...' : 'Carregar mais'}
+                </Button>
+              </div>
+            )}
           </div>
         )}
       </div>